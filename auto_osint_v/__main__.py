@@ -1,23 +1,24 @@
 """This module forms the main part of the program, where other modules are run from.
 
 Run this file to run the tool.
+
+Only light modules are imported at the top of this file. The models and the heavy libraries
+(torch, transformers, spaCy, pandas, selenium) are imported where they are first used, so that
+argument errors, '-h' and entering the intelligence statement are instant.
 """
+import importlib.util
 import os
 import sys
+import time
 from itertools import combinations
-from sentence_transformers import SentenceTransformer, util
-from tqdm import tqdm
 import argparse
-import pandas as pd
-from typing import List
 
-from auto_osint_v.specific_entity_processor import EntityProcessor
 from auto_osint_v.file_handler import FileHandler
-from auto_osint_v.sentiment_analyser import SentimentAnalyser
-from auto_osint_v.source_aggregator import SourceAggregator
-from auto_osint_v.priority_manager import PriorityManager
+from auto_osint_v.inference_cache import get_cache
+from auto_osint_v.metrics import LAST_RUN, RUN_SECONDS, get_metrics, start_server
+from auto_osint_v.thread_budget import get_budget
 
-data_file_path = os.getcwd() + "/data_files/"
+data_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_files", "")
 sys.path.append(
     "/auto_osint_v/__main__.py")
 # modify environment variables
@@ -59,15 +60,17 @@ def similar(a, b, threshold=0.90):
     Returns:
         Boolean True or False
     """
+    from sentence_transformers import util
+    from auto_osint_v.inference_cache import embed
+    from auto_osint_v.priority_manager import PriorityManager
     priority_manager = PriorityManager
     text1, text2 = map(priority_manager.get_text_from_site, (a, b))
     # split the texts every 500 chars
     text1_split = [text1[i:i + 500] for i in range(0, len(text1), 500)]
     text2_split = [text2[i:i + 500] for i in range(0, len(text2), 500)]
-    # for each 'sentence' in both texts generate similarity scores
-    model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-    embeddings1 = model.encode(text1_split, convert_to_tensor=True)
-    embeddings2 = model.encode(text2_split, convert_to_tensor=True)
+    # for each 'sentence' in both texts generate similarity scores (embeddings are cached)
+    embeddings1 = embed(text1_split)
+    embeddings2 = embed(text2_split)
 
     cosine_scores = util.cos_sim(embeddings1, embeddings2)
     # print(f"{embeddings1}\n{embeddings2}\n\n{cosine_scores}")
@@ -98,6 +101,7 @@ def similarity_check(sources):
     Args:
         sources: the list of sources to examine
     """
+    from tqdm import tqdm
     output_sources = sources[:10]
     sources = sources[10:]
     for source_a, source_b in tqdm(combinations(output_sources, 2),
@@ -122,50 +126,270 @@ def similarity_check(sources):
     return output_sources
 
 
-def format_output(source_list_dict: List[dict], file_handler_obj):
-    """Formats all the results into a table.
+# columns of the output table, in order
+OUTPUT_COLUMNS = ["Evidence Type", "Important Info", "URL", "Extra Info", "Priority Score",
+                  "Headline Sentiment"]
+
+
+def output_rows(source_list_dict, file_handler_obj):
+    """Generates the rows of the results table, one at a time.
 
     This takes the sources, bias sources (if any), sentiment analysis results
 
     Returns:
-        the output dataframe, which can be printed
+        a generator of dictionaries, keyed by the columns in OUTPUT_COLUMNS
     """
-    output = str()
     # get sentiment analysis results from evidence file
     sentiment_dict = file_handler_obj.read_evidence_file()[0]
     # get bias sources from bias file
     bias_list_dict = file_handler_obj.read_bias_file()
-    # create the dataframe for all our results
-    dataframe = pd.DataFrame(columns=["Evidence Type", "Important Info", "URL", "Extra Info",
-                                      "Priority Score", "Headline Sentiment"])
-    # add sentiment analysis of statement to dataframe
-    sentiment_df = pd.DataFrame(
-        [{"Evidence Type": sentiment_dict["evidence type"],
-          "Important Info": sentiment_dict["info"]}])
-    dataframe = pd.concat([dataframe, sentiment_df], ignore_index=True)
-    # add bias sources to the dataframe
+    # add sentiment analysis of statement
+    yield {"Evidence Type": sentiment_dict["evidence type"],
+           "Important Info": sentiment_dict["info"]}
+    # add bias sources
     for bias_dict in bias_list_dict:
-        bias_df = pd.DataFrame(
-            [{"Evidence Type": bias_dict["Type/Link"],
-              "Important Info": bias_dict["Key Info"],
-              "Headline Sentiment": bias_dict["Info Sentiment"]
-              }])
-        dataframe = pd.concat([dataframe, bias_df], ignore_index=True)
-    # add corroborating sources to the dataframe
+        yield {"Evidence Type": bias_dict["Type/Link"],
+               "Important Info": bias_dict["Key Info"],
+               "Headline Sentiment": bias_dict["Info Sentiment"]}
+    # add corroborating sources
     for source in source_list_dict:
-        source_df = pd.DataFrame(
-            [{"Evidence Type": "Corroboration", "Important Info": source["title"],
-              "URL": source["url"], "Extra Info": source["description"] + " Page Type: "
-                                                  + source["page_type"] + " Published on: " +
-                                                  source["time_published"],
-              "Priority Score": source["score"],
-              "Headline Sentiment": source["title_sentiment"]
-              }])
-        dataframe = pd.concat([dataframe, source_df], ignore_index=True)
-    return dataframe
+        yield {"Evidence Type": "Corroboration", "Important Info": source["title"],
+               "URL": source["url"], "Extra Info": source["description"] + " Page Type: "
+                                                   + source["page_type"] + " Published on: " +
+                                                   source["time_published"],
+               "Priority Score": source["score"],
+               "Headline Sentiment": source["title_sentiment"]}
 
 
-if __name__ == '__main__':
+def format_output(source_list_dict, file_handler_obj):
+    """Formats all the results into a table.
+
+    The rows are collected first and the dataframe is built once.
+
+    Returns:
+        the output dataframe, which can be printed
+    """
+    import pandas as pd
+    return pd.DataFrame(list(output_rows(source_list_dict, file_handler_obj)),
+                        columns=OUTPUT_COLUMNS)
+
+
+def run_pipeline(intel_file, args, file_handler_obj, sentiment_analyser, pfix):
+    """Runs the whole tool for one intelligence statement and saves the output.
+
+    Args:
+        intel_file: the intelligence statement.
+        args: the parsed command line arguments.
+        file_handler_obj: the file handler object.
+        sentiment_analyser: the SentimentAnalyser object, reused between statements.
+        pfix: the output file's postfix.
+    """
+    from auto_osint_v.specific_entity_processor import EntityProcessor
+    from auto_osint_v.source_aggregator import SourceAggregator
+    from auto_osint_v.pre_ranker import PreRanker
+    from auto_osint_v.query_planner import QueryPlanner
+    from auto_osint_v.run_store import RunStore
+    from auto_osint_v.checkpoint import Checkpointer
+    start = time.perf_counter()
+    # stages run in this process use every core, see ThreadBudget
+    budget = get_budget()
+    run_store = None
+    if not args.no_store:
+        # keep a history of every run, see RunStore
+        run_store = RunStore(data_file_path + "runs.sqlite")
+        run_id = run_store.start_run(intel_file)
+    # the output of each stage is checkpointed, so a crashed run can be resumed
+    checkpointer = Checkpointer(intel_file)
+    if args.resume:
+        completed = checkpointer.completed()
+        if completed:
+            print(f"Resuming, reusing the checkpointed {', '.join(completed)}")
+    else:
+        # forget the checkpoints of any earlier, crashed run of this statement
+        checkpointer.clear()
+    # set the statement parameter
+    sentiment_analyser.set_statement(intel_file)
+    # Entity Processor - identifies specific entities mentioned in intel statement
+    print("Processing entities...")
+    process_entities = EntityProcessor(file_handler_obj)
+    with budget.run_stage("Statement entities (NER)"):
+        process_entities.store_words_from_label(intel_file)
+
+    # Clean evidence_file.csv
+    file_handler_obj.clean_data_file(data_file_path + "evidence_file.csv")
+    # call to sentiment analyser - sentiment analysis on intel statement
+    print("Analysing sentiment of intelligence statement...")
+    with budget.run_stage("Statement sentiment"):
+        sentiment_analyser.statement_analyser()
+    # Source aggregation below
+    print("\nAggregating Sources:")
+    search_backend = None
+    if args.search_index:
+        from auto_osint_v.search_backend import LocalIndexBackend
+        # search a local corpus rather than Google, e.g. on an air-gapped network
+        search_backend = LocalIndexBackend(args.search_index)
+    pre_ranker = None
+    if args.relevance_floor is not None:
+        pre_ranker = PreRanker(file_handler_obj.get_keywords_from_target_info(), intel_file,
+                               args.relevance_floor, args.embedding_prerank)
+    source_aggregator = SourceAggregator(intel_file, file_handler_obj, sentiment_analyser,
+                                         pre_ranker, run_store, args.incremental, checkpointer,
+                                         search_backend, QueryPlanner(args.query_similarity))
+    if checkpointer.has("queries"):
+        source_aggregator.queries, keyword_groups = checkpointer.load("queries")
+        source_aggregator.plan_keyword_groups(keyword_groups)
+    else:
+        previous_queries = []
+        if args.incremental:
+            # reuse the keyword groups, and the queries close to the new ones, of the previous run
+            # of this statement (or of the statement it was edited from), so its searches are
+            # reused
+            previous_run_id = args.previous_run or run_store.previous_run(run_id, intel_file)
+            if previous_run_id is not None:
+                previous_queries, previous_groups = run_store.get_queries(previous_run_id)
+                source_aggregator.plan_keyword_groups(previous_groups)
+        # generates the queries and stores the planned ones in the source_aggregator object
+        print("Generating queries...")
+        with budget.run_stage("Query generation"):
+            source_aggregator.search_query_generator(args.seed, previous_queries)
+        if source_aggregator.query_planner.removed:
+            print(f"Removed {len(source_aggregator.query_planner.removed)} near-duplicate "
+                  "queries and keyword groups")
+    checkpointer.save("queries", (source_aggregator.queries, source_aggregator.keyword_groups))
+    if run_store is not None:
+        run_store.record_queries(run_id, source_aggregator.queries,
+                                 source_aggregator.keyword_groups)
+    # Searches google and social media sites using the queries stored in source_aggregator object
+    # search results will be stored in a dictionary in the source_aggregator Object.
+    if checkpointer.has("sources"):
+        potential_sources = checkpointer.load("sources")
+        file_handler_obj.create_potential_corroboration_file(potential_sources)
+    else:
+        with budget.run_stage("Source aggregation"):
+            potential_sources = source_aggregator.find_sources()
+        checkpointer.save("sources", potential_sources)
+    if run_store is not None:
+        run_store.record_sources(run_id, potential_sources)
+    if checkpointer.has("scores"):
+        sources = checkpointer.load("scores")
+    else:
+        sources = score_sources(potential_sources, args, file_handler_obj, process_entities,
+                                run_store, checkpointer, search_backend)
+        checkpointer.save("scores", sources)
+    # print([f"url: {source['url']}, score: {source['score']}" for source in sources])
+    if run_store is not None:
+        run_store.record_scores(run_id, sources)
+        run_store.finish_run(run_id)
+        run_store.close()
+
+    # similarity_check(sources) - does not work, unfortunately.
+
+    # OUTPUT:
+    write_output(sources, args, file_handler_obj, pfix)
+    # the run is complete, it won't need resuming
+    checkpointer.clear()
+    metrics = get_metrics()
+    metrics.observe(RUN_SECONDS, time.perf_counter() - start)
+    metrics.set(LAST_RUN, time.time())
+    if args.metrics_file:
+        metrics.write_textfile(args.metrics_file)
+
+
+def score_sources(potential_sources, args, file_handler_obj, process_entities, run_store,
+                  checkpointer, search_backend=None):
+    """Fetches and scores the sources found, reusing any stored or checkpointed page texts.
+
+    Args:
+        potential_sources: the source records found by the source aggregator.
+        args: the parsed command line arguments.
+        file_handler_obj: the file handler object.
+        process_entities: the EntityProcessor object holding the statement's entities.
+        run_store: Optional RunStore object, the page texts and entities are recorded in it.
+        checkpointer: the Checkpointer object of the run.
+        search_backend: Optional SearchBackend the sources were found with, the texts it holds
+            are not fetched.
+
+    Returns:
+        the scored sources, in descending order of score
+    """
+    from auto_osint_v.priority_manager import PriorityManager
+    # Initialise the Priority Manager
+    page_texts = {}
+    source_entities = {}
+    if search_backend is not None:
+        page_texts = search_backend.page_texts(source["url"] for source in potential_sources)
+    if args.incremental:
+        # only sources that are new since the previous runs are fetched and processed
+        urls = [source["url"] for source in potential_sources]
+        page_texts.update(run_store.get_page_texts(urls))
+        source_entities = run_store.get_ner_entities(urls)
+    # the texts and entities of a crashed run are not fetched or processed again
+    resumed_texts = checkpointer.load("page_texts", {})
+    resumed_entities = checkpointer.load("source_entities", {})
+    page_texts.update(resumed_texts)
+    source_entities.update(resumed_entities)
+    broker = None
+    if args.broker:
+        from auto_osint_v.work_queue import connect_broker
+        # sources are fetched and processed by work queue workers, possibly on other nodes
+        broker = connect_broker(args.broker)
+    priority_manager = PriorityManager(file_handler_obj, process_entities, potential_sources,
+                                       page_texts, source_entities, args.weighting, broker=broker,
+                                       checkpointer=checkpointer)
+    # Check the relevance of sources, filter out those that are not relevant.
+    # Assign higher priority (order) to sources that are most relevant.
+    if args.time_budget is not None or args.fetch_budget is not None:
+        # anytime ranking - stop once the top sources are stable or the budget is used up
+        sources = priority_manager.anytime_manager(args.top_k, args.time_budget,
+                                                   args.fetch_budget)
+    else:
+        sources = priority_manager.manager()
+    if run_store is not None:
+        # the resumed texts and entities were fetched and processed by the crashed run
+        run_store.record_page_texts({**resumed_texts, **priority_manager.new_page_texts})
+        run_store.record_ner_entities({**resumed_entities,
+                                       **priority_manager.new_source_entities})
+        run_store.record_entity_counts(priority_manager.entity_counts)
+    # the page texts are no longer needed
+    priority_manager.close()
+    return sources
+
+
+def write_output(sources, args, file_handler_obj, pfix):
+    """Saves the results table in the format chosen on the command line.
+
+    Args:
+        sources: the scored sources.
+        args: the parsed command line arguments.
+        file_handler_obj: the file handler object.
+        pfix: the output file's postfix.
+    """
+    if args.jsonl:
+        # stream the rows straight to the file, no dataframe needed
+        file_handler_obj.write_jsonl_output(output_rows(sources, file_handler_obj), pfix)
+        return
+    out_df = format_output(sources, file_handler_obj)
+    # we can turn sources into a pandas dataframe then use df.style or display(df) or tabulate(df)
+    # save the dataframe to a markdown, html or parquet file
+    if args.markdown:
+        out_df.to_markdown(file_handler_obj.get_output_path(pfix, "md"))
+    elif args.html:
+        out_df.to_html(file_handler_obj.get_output_path(pfix, "html"))
+    elif args.parquet:
+        out_df.to_parquet(file_handler_obj.get_output_path(pfix, "parquet"))
+    else:
+        out_df.to_csv(file_handler_obj.get_output_path(pfix, "csv"))
+
+
+def parse_args(argv=None):
+    """Interprets the command line arguments.
+
+    Args:
+        argv: Optional list of arguments, defaults to the command line arguments.
+
+    Returns:
+        the parsed arguments
+    """
     # interpret command line arguments
     parser = argparse.ArgumentParser()
     # add optional arguments
@@ -180,78 +404,147 @@ if __name__ == '__main__':
                                                             "(default: csv).")
     parser.add_argument("-m", "--markdown", action='store_true', help="Output will be in markdown "
                                                                       "(default: csv)")
+    parser.add_argument("-j", "--jsonl", action='store_true', help="Output will be in JSON Lines, "
+                                                                   "one result per line "
+                                                                   "(default: csv)")
+    parser.add_argument("--parquet", action='store_true', help="Output will be in Parquet, needs "
+                                                               "pyarrow or fastparquet "
+                                                               "(default: csv)")
     parser.add_argument("-f", "--FileToUse", help="Specify the file to read the intelligence "
                                                   "statement from")
     parser.add_argument("-p", "--output_postfix", help="Specify the output file's postfix,"
                                                        "e.g. 'output3.txt' rather than default "
                                                        "'output.txt'")
+    parser.add_argument("-k", "--top_k", type=int, default=10,
+                        help="Number of top sources that must be stable before scoring stops when "
+                             "a time or fetch budget is given (default: 10)")
+    parser.add_argument("-t", "--time_budget", type=float,
+                        help="Wall-clock budget, in seconds, for scoring sources. Sources are "
+                             "scored in order of likely relevance and partial results are output")
+    parser.add_argument("--fetch_budget", type=int,
+                        help="Maximum number of sources to fetch when scoring sources")
+    parser.add_argument("-r", "--relevance_floor", type=float,
+                        help="Search results whose title and snippet score below this value are "
+                             "never fetched. The score is the number of target entities found")
+    parser.add_argument("-e", "--embedding_prerank", action='store_true',
+                        help="Add the similarity of each title and snippet to the statement to "
+                             "its pre-ranking score (used with --relevance_floor)")
+    parser.add_argument("-b", "--batch",
+                        help="Validate every statement in the given directory inside data_files, "
+                             "e.g. 'statements_for_eval'. The output postfix is the statement's "
+                             "file name")
+    parser.add_argument("--seed", type=int,
+                        help="Seed for query generation, so a statement always generates the "
+                             "same queries")
+    parser.add_argument("--query_similarity", type=float, default=0.85,
+                        help="Generated queries and keyword groups more similar than this to one "
+                             "already planned are not searched, and the searches saved are spent "
+                             "on more diverse queries (default: 0.85, 1 keeps them all)")
+    parser.add_argument("--broker",
+                        help="Fetch and process sources with workers pulling tasks from this work "
+                             "queue broker: a broker server URL (http://host:port) or the path of "
+                             "a SQLite broker database. See auto_osint_v/work_queue.py")
+    parser.add_argument("--search_index",
+                        help="Search this local search index rather than Google, e.g. on an "
+                             "air-gapped network. See auto_osint_v/search_backend.py")
+    parser.add_argument("--http1", action='store_true',
+                        help="Fetch pages over HTTP/1.1 only, even if httpx and h2 are installed")
+    parser.add_argument("--metrics_file",
+                        help="Write the pipeline's metrics to this Prometheus textfile after each "
+                             "run, e.g. in node_exporter's textfile directory")
+    parser.add_argument("--metrics_port", type=int,
+                        help="Serve the pipeline's metrics for Prometheus on this port while the "
+                             "tool runs, at http://127.0.0.1:<port>/metrics")
+    parser.add_argument("--no_store", action='store_true',
+                        help="Don't record this run in the run store (data_files/runs.sqlite)")
+    parser.add_argument("-w", "--weighting", choices=["count", "tfidf", "bm25"], default="count",
+                        help="How entity mentions are scored: the number of distinct entities "
+                             "found (count), or tfidf/bm25, which favour rare entities "
+                             "(default: count)")
+    parser.add_argument("--profile", action='store_true',
+                        help="Print the number of workers, threads per worker and time taken by "
+                             "each stage, and the hit rate of the model inference cache")
+    parser.add_argument("--previous_run", type=int,
+                        help="With --incremental, reuse this run's keyword groups and queries "
+                             "rather than those of the last run of the most similar statement")
+    parser.add_argument("--resume", action='store_true',
+                        help="Resume a crashed run of the same statement, reusing the queries, "
+                             "searches, sources, page texts and entities it checkpointed")
+    parser.add_argument("-i", "--incremental", action='store_true',
+                        help="Reuse the queries, searches, page texts and entities stored by "
+                             "previous runs, so only new sources are fetched and processed")
     # read args from command line
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if args.broker and (args.time_budget is not None or args.fetch_budget is not None):
+        parser.error("--broker can't be used with --time_budget or --fetch_budget")
+    if args.incremental and args.no_store:
+        parser.error("--incremental needs the run store, it can't be used with --no_store")
+    if args.previous_run is not None and not args.incremental:
+        parser.error("--previous_run can only be used with --incremental")
+    if args.parquet and importlib.util.find_spec("pyarrow") is None \
+            and importlib.util.find_spec("fastparquet") is None:
+        parser.error("--parquet needs pyarrow or fastparquet to be installed")
+    return args
+
+
+if __name__ == '__main__':
+    # interpret command line arguments
+    args = parse_args()
     # This code won't run if this file is imported.
     file_handler = FileHandler(data_file_path)
+    if args.http1:
+        from auto_osint_v.http_session import configure_session
+        configure_session(http2=False)
+    if args.metrics_port:
+        start_server(get_metrics(), port=args.metrics_port)
+    # inference cache hits and misses before this run, for the profiling report
+    cache_stats = get_cache().stats()
     # Only input point for user - potential refinement would be a feedback loop to the user.
     use_editor = True
     if args.NoEditor:
         use_editor = False
-    if args.Silent:
+    if args.Silent or args.batch:
         print("Intelligence statement already entered, skipping...")
     else:
         input_intelligence(use_editor)
         input("\nPress ENTER to continue...\n")
+    # the heavy modules are only imported once the statement has been entered
+    from auto_osint_v.sentiment_analyser import SentimentAnalyser
+    from auto_osint_v.query_generator import QueryGenerator
+    from auto_osint_v.query_planner import CANDIDATE_QUERIES
     intel_file = ""
     analyse_sentiment_object = SentimentAnalyser(intel_file, "intelligence_statement", file_handler)
     # input_bias_sources(analyse_sentiment_object)
-    # Read intelligence file
-    print("Reading intelligence file...")
-    if args.FileToUse:
-        intel_file = file_handler.read_file(args.FileToUse)
-    else:
-        intel_file = file_handler.read_file("intelligence_file.txt")
-    # set the statement parameter
-    analyse_sentiment_object.set_statement(intel_file)
-    # Entity Processor - identifies specific entities mentioned in intel statement
-    print("Processing entities...")
-    process_entities = EntityProcessor(file_handler)
-    process_entities.store_words_from_label(intel_file)
-
-    # Clean evidence_file.csv
-    file_handler.clean_data_file(data_file_path + "evidence_file.csv")
-    # call to sentiment analyser - sentiment analysis on intel statement
-    print("Analysing sentiment of intelligence statement...")
-    analyse_sentiment_object.statement_analyser()
-    # Source aggregation below
-    print("\nAggregating Sources:")
-    source_aggregator = SourceAggregator(intel_file, file_handler, analyse_sentiment_object)
-    # generates 10 queries and stores it in the source_aggregator object
-    print("Generating queries...")
-    source_aggregator.search_query_generator()
-    # Searches google and social media sites using the queries stored in source_aggregator object
-    # search results will be stored in a dictionary in the source_aggregator Object.
-    potential_sources = source_aggregator.find_sources()
-    # Initialise the Priority Manager
-    priority_manager = PriorityManager(file_handler, process_entities, potential_sources)
-    # Check the relevance of sources, filter out those that are not relevant.
-    # Assign higher priority (order) to sources that are most relevant.
-    sources = priority_manager.manager()
-    # print([f"url: {source['url']}, score: {source['score']}" for source in sources])
-
-    # similarity_check(sources) - does not work, unfortunately.
-
-    # OUTPUT:
-    out_df = format_output(sources, file_handler)
     # save the user's given postfix for the output file
     if args.output_postfix:
         pfix = args.output_postfix
     else:
         pfix = ""
-    # we can turn sources into a pandas dataframe then use df.style or display(df) or tabulate(df)
-    # save the dataframe to a markdown or html file
-    if args.markdown:
-        out_df.to_markdown(file_handler.get_output_path(pfix, "md"))
-    elif args.html:
-        out_df.to_html(file_handler.get_output_path(pfix, "html"))
+    if args.batch:
+        # run every statement in the batch directory, one output file per statement
+        statement_files = sorted(os.listdir(os.path.join(data_file_path, args.batch)))
+        statements = [file_handler.read_file(os.path.join(args.batch, statement_file))
+                      for statement_file in statement_files]
+        # generate the queries for every statement in one batch, they are cached for each run
+        print("Generating queries for all statements...")
+        with get_budget().run_stage("Query generation"):
+            QueryGenerator(data_file_path + "query_cache.json", num_queries=CANDIDATE_QUERIES,
+                           seed=args.seed).generate(statements)
+        for statement_file, intel_file in zip(statement_files, statements):
+            print(f"\nValidating {statement_file}...")
+            run_pipeline(intel_file, args, file_handler, analyse_sentiment_object,
+                         pfix + os.path.splitext(statement_file)[0])
     else:
-        out_df.to_csv(file_handler.get_output_path(pfix, "csv"))
+        # Read intelligence file
+        print("Reading intelligence file...")
+        if args.FileToUse:
+            intel_file = file_handler.read_file(args.FileToUse)
+        else:
+            intel_file = file_handler.read_file("intelligence_file.txt")
+        run_pipeline(intel_file, args, file_handler, analyse_sentiment_object, pfix)
+    if args.profile:
+        print("\n" + get_budget().report())
+        print("\n" + get_cache().report(since=cache_stats))
 
     # TODO:
     #   ~~~~~ High Priority ~~~~~
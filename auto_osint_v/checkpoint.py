@@ -0,0 +1,84 @@
+"""This module checkpoints the output of each stage of a run, so that a crashed run can be resumed.
+
+A run that dies late (e.g. a worker running out of memory, or Chrome crashing) would otherwise lose
+its generated queries, the search results it spent API quota on, and every page it fetched. Each
+stage's output is pickled to its own file in a directory named after the statement. Files are
+written to a temporary file first and then renamed, so a checkpoint is either complete or absent.
+
+With --resume, every stage that has a checkpoint is skipped and its output loaded instead.
+"""
+import hashlib
+import os
+import pickle
+import shutil
+
+# directory holding one directory of checkpoints per statement
+CHECKPOINT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_files",
+                                    "checkpoints")
+# the stages that are checkpointed, in the order they run
+STAGES = ("queries", "searches", "sources", "page_texts", "source_entities", "scores")
+
+
+class Checkpointer:
+    """Saves and loads the output of each stage of the run of a statement.
+    """
+
+    def __init__(self, statement, directory=CHECKPOINT_DIRECTORY):
+        """Initialises the Checkpointer object.
+
+        Args:
+            statement: the intelligence statement being validated.
+            directory: Optional directory holding the checkpoints of every statement.
+        """
+        statement_hash = hashlib.sha256(statement.strip().encode("utf-8")).hexdigest()
+        self.directory = os.path.join(directory, statement_hash[:16])
+
+    def path(self, stage):
+        """Gets the path of the checkpoint file of a stage."""
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage '{stage}', expected one of {STAGES}")
+        return os.path.join(self.directory, stage + ".pickle")
+
+    def save(self, stage, data):
+        """Saves the output of a stage, replacing any earlier checkpoint of it.
+
+        Args:
+            stage: the stage, one of STAGES.
+            data: the output of the stage, anything that can be pickled.
+        """
+        path = self.path(stage)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(path + ".tmp", "wb") as checkpoint_file:
+            pickle.dump(data, checkpoint_file, protocol=pickle.HIGHEST_PROTOCOL)
+            # make sure the data is on disk before the checkpoint replaces the old one
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(path + ".tmp", path)
+
+    def load(self, stage, default=None):
+        """Loads the output of a stage.
+
+        Args:
+            stage: the stage, one of STAGES.
+            default: Optional value returned if the stage has no checkpoint.
+
+        Returns:
+            the output of the stage
+        """
+        try:
+            with open(self.path(stage), "rb") as checkpoint_file:
+                return pickle.load(checkpoint_file)
+        except FileNotFoundError:
+            return default
+
+    def has(self, stage):
+        """Checks whether a stage has a checkpoint."""
+        return os.path.exists(self.path(stage))
+
+    def completed(self):
+        """Gets the stages that have a checkpoint, in the order they run."""
+        return [stage for stage in STAGES if self.has(stage)]
+
+    def clear(self):
+        """Deletes every checkpoint of the statement."""
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,220 @@
+"""This module normalises entity texts, so that different forms of an entity match each other.
+
+Entities found by NER, or in the statement, come in many forms: 'Wagner Group', 'wagner  group',
+'Wagner Group's', or an alias such as 'Russian MoD' for 'Russian Ministry of Defence'. Every text
+is reduced to a key (case-folded, without punctuation or possessives, with single spaces, and
+optionally lemmatised), and aliases map keys to a single canonical key. Keys are memoised and
+aliases and stopwords are hashed lookups, so matching, deduplicating and counting entities all
+use the same O(1) lookups.
+
+Aliases and extra stopwords are configured in data_files/entity_normalisation.json.
+"""
+import json
+import os
+import re
+import unicodedata
+
+# path of the aliases and stopwords configuration
+NORMALISATION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_files",
+                                  "entity_normalisation.json")
+# List of words that have no meaning without context
+IRRELEVANT_WORDS = frozenset(["it", "them", "they", "the", "he", "she", "his", "her", "we", "i",
+                              "us", "me", "my", "here", "our"])
+# possessive endings, removed before punctuation so "Russia's" becomes "russia"
+POSSESSIVE = re.compile(r"['’]s\b")
+PUNCTUATION = re.compile(r"[\W_]+")
+
+# the normaliser used by the matchers, created the first time it is needed
+_NORMALISER = None
+
+
+class EntityNormaliser:
+    """Normalises entity texts to canonical keys, and matches and counts entities in texts.
+    """
+    # the number of keys (and lemmas) memoised, the memo is emptied when it is full so long
+    # running and batch processes don't keep every text ever seen
+    max_memoised = 100000
+
+    def __init__(self, aliases=None, stopwords=IRRELEVANT_WORDS, lemmatiser=None):
+        """Initialises the EntityNormaliser object.
+
+        Args:
+            aliases: Optional dictionary of canonical entity -> list of its aliases.
+            stopwords: entities with no meaning without context, they are never matched.
+            lemmatiser: Optional function giving the lemma of a (normalised) word, e.g. spaCy's
+                lemmatiser, so that 'tanks' and 'tank' have the same key.
+        """
+        self.lemmatiser = lemmatiser
+        # memoised keys, text -> key
+        self._keys = {}
+        # memoised lemmas, word -> lemma
+        self._lemmas = {}
+        # alias key -> canonical key, and canonical key -> every key with that canonical key
+        self._canonical = {}
+        self._variants = {}
+        self.stopwords = frozenset(self.key(word) for word in stopwords)
+        for canonical, entity_aliases in (aliases or {}).items():
+            for alias in entity_aliases:
+                self.add_alias(canonical, alias)
+        # the index of the last list of entities counted, see _index
+        self._last_index = (None, None)
+
+    def tokens(self, text):
+        """Splits a text into normalised words.
+
+        Args:
+            text: the text to normalise.
+
+        Returns:
+            list of words: case-folded, without punctuation or possessives, and lemmatised if a
+            lemmatiser was given
+        """
+        text = unicodedata.normalize("NFKC", str(text)).casefold()
+        words = PUNCTUATION.sub(" ", POSSESSIVE.sub("", text)).split()
+        if self.lemmatiser is not None:
+            for i, word in enumerate(words):
+                if word not in self._lemmas:
+                    if len(self._lemmas) >= self.max_memoised:
+                        self._lemmas.clear()
+                    self._lemmas[word] = self.lemmatiser(word)
+                words[i] = self._lemmas[word]
+        return words
+
+    def key(self, text):
+        """Gets the normalised key of an entity text (memoised)."""
+        try:
+            return self._keys[text]
+        except KeyError:
+            if len(self._keys) >= self.max_memoised:
+                self._keys.clear()
+            key = self._keys[text] = " ".join(self.tokens(text))
+            return key
+
+    def canonical(self, text):
+        """Gets the canonical key of an entity text: its key, or the key its alias stands for."""
+        key = self.key(text)
+        return self._canonical.get(key, key)
+
+    def add_alias(self, canonical, alias):
+        """Makes an alias match its canonical entity.
+
+        Args:
+            canonical: the canonical entity, e.g. 'Russian Ministry of Defence'.
+            alias: another form of the entity, e.g. 'Russian MoD'.
+        """
+        canonical_key = self.canonical(canonical)
+        alias_key = self.key(alias)
+        if alias_key and alias_key != canonical_key:
+            self._canonical[alias_key] = canonical_key
+            self._variants.setdefault(canonical_key, {canonical_key}).add(alias_key)
+        self._last_index = (None, None)
+
+    def is_stopword(self, text):
+        """Checks whether an entity has no meaning without context (or is only punctuation)."""
+        key = self.key(text)
+        return not key or key in self.stopwords
+
+    def deduplicate(self, entities):
+        """Removes stopwords and repeated forms of the same entity.
+
+        Args:
+            entities: list of entity texts.
+
+        Returns:
+            list of the first form of each canonical entity, in the order given
+        """
+        seen = set()
+        unique = []
+        for entity in entities:
+            canonical = self.canonical(entity)
+            if canonical not in seen and not self.is_stopword(entity):
+                seen.add(canonical)
+                unique.append(entity)
+        return unique
+
+    def _index(self, entities):
+        """Indexes the word sequences of every form of the given entities.
+
+        The index of the last list of entities is kept, as the same entities are counted in every
+        source.
+
+        Returns:
+            (dictionary of word tuple -> entity, sorted list of the word tuple lengths)
+        """
+        entities = tuple(entities)
+        if self._last_index[0] != entities:
+            index = {}
+            for entity in self.deduplicate(entities):
+                canonical = self.canonical(entity)
+                for variant in self._variants.get(canonical, (canonical,)):
+                    index.setdefault(tuple(variant.split()), entity)
+            self._last_index = (entities, (index, sorted({len(words) for words in index})))
+        return self._last_index[1]
+
+    def count(self, entities, text):
+        """Counts the appearances of each entity in a text, in any of its forms.
+
+        Entities are matched on whole words of the normalised text, so 'Russia' is not found in
+        'Russian', but 'Russian MoD' is found in "the russian ministry of defence's statement".
+
+        Args:
+            entities: the entities to look for.
+            text: the text to look for entities within.
+
+        Returns:
+            dictionary of entity -> number of appearances, for the entities that appear in the text
+        """
+        index, _ = self._index(entities)
+        return self.count_words(entities, self.tokens(text)) if index else {}
+
+    def count_words(self, entities, words):
+        """Counts the appearances of each entity in a text already split into words.
+
+        Args:
+            entities: the entities to look for.
+            words: the normalised words of the text, see tokens.
+
+        Returns:
+            see count
+        """
+        index, lengths = self._index(entities)
+        counts = {}
+        for length in lengths:
+            for i in range(len(words) - length + 1):
+                entity = index.get(tuple(words[i:i + length]))
+                if entity is not None:
+                    counts[entity] = counts.get(entity, 0) + 1
+        return counts
+
+
+def load_normaliser(file_path=NORMALISATION_PATH):
+    """Creates a normaliser with the aliases and extra stopwords of a configuration file.
+
+    The file is a JSON object with an optional "aliases" object (canonical entity -> list of
+    aliases) and an optional "stopwords" list. A missing file gives the default normaliser.
+
+    Args:
+        file_path: path of the configuration file.
+
+    Returns:
+        the EntityNormaliser object
+    """
+    try:
+        with open(file_path, encoding="utf-8") as config_file:
+            config = json.load(config_file)
+    except FileNotFoundError:
+        config = {}
+    return EntityNormaliser(config.get("aliases"),
+                            IRRELEVANT_WORDS | frozenset(config.get("stopwords", [])))
+
+
+def get_normaliser():
+    """Gets the normaliser used by the matchers, creating it the first time.
+
+    Returns:
+        the EntityNormaliser object
+    """
+    global _NORMALISER
+    if _NORMALISER is None:
+        _NORMALISER = load_normaliser()
+    return _NORMALISER
@@ -0,0 +1,124 @@
+"""This module stores the target entities extracted from the intelligence statement.
+
+Entities are kept in memory, indexed by label and by canonical text (see EntityNormaliser), and
+can be written to a single CSV file as a snapshot for later runs (or for the user to inspect).
+"""
+import csv
+import os
+
+from auto_osint_v.entity_normaliser import get_normaliser
+
+
+class EntityStore:
+    """In-memory store of target entities, their labels and number of mentions.
+    """
+
+    def __init__(self):
+        """Initialises the empty store and its indexes."""
+        # entity text -> [label, mentions]
+        self._entities = {}
+        # label -> list of entity texts
+        self._by_label = {}
+        # canonical entity text -> first entity text stored with it
+        self._by_key = {}
+
+    @staticmethod
+    def normalise(text):
+        """Normalises the text of an entity for lookups (case, whitespace, punctuation, aliases).
+        """
+        return get_normaliser().canonical(text)
+
+    def __len__(self):
+        return len(self._entities)
+
+    def __contains__(self, text):
+        return self.normalise(text) in self._by_key
+
+    def add(self, label, text, mentions=1):
+        """Adds an entity to the store, or adds to its mentions if it is already stored.
+
+        Args:
+            label: the label associated with the entity, e.g. 'Location'.
+            text: the entity text.
+            mentions: the number of times the entity has appeared.
+        """
+        try:
+            self._entities[text][1] += mentions
+        except KeyError:
+            self._entities[text] = [label, mentions]
+            self._by_label.setdefault(label, []).append(text)
+            self._by_key.setdefault(self.normalise(text), text)
+
+    def clear(self):
+        """Removes every entity from the store."""
+        self._entities.clear()
+        self._by_label.clear()
+        self._by_key.clear()
+
+    def labels(self):
+        """Gets the labels of the stored entities."""
+        return list(self._by_label)
+
+    def by_label(self, label):
+        """Gets the entities with the given label.
+
+        Args:
+            label: the label to look up.
+
+        Returns:
+            List of (text, mentions) tuples.
+        """
+        return [(text, self._entities[text][1]) for text in self._by_label.get(label, [])]
+
+    def lookup(self, text):
+        """Finds a stored entity, ignoring differences in case, whitespace and punctuation, or
+        by one of its aliases.
+
+        Args:
+            text: the entity text to look up.
+
+        Returns:
+            (text, label, mentions) of the stored entity, or None if it is not stored.
+        """
+        try:
+            stored_text = self._by_key[self.normalise(text)]
+        except KeyError:
+            return None
+        label, mentions = self._entities[stored_text]
+        return stored_text, label, mentions
+
+    def keywords(self):
+        """Gets the text of every stored entity, except those with no meaning without context.
+
+        Forms of the same entity (e.g. 'Wagner Group' and 'PMC Wagner') give a single keyword.
+
+        Returns:
+            List of entity texts.
+        """
+        return get_normaliser().deduplicate(self._by_key.values())
+
+    def write_snapshot(self, file_path):
+        """Writes every stored entity to a single CSV file.
+
+        The file is written to a temporary path first, so a snapshot is never half written.
+
+        Args:
+            file_path: path of the snapshot file.
+        """
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, "w", newline="", encoding="utf-8") as snapshot_file:
+            writer = csv.writer(snapshot_file)
+            writer.writerow(["Label", "Info", "Mentions"])
+            writer.writerows([label, text, mentions]
+                             for text, (label, mentions) in self._entities.items())
+        os.replace(tmp_path, file_path)
+
+    def load_snapshot(self, file_path):
+        """Adds every entity in a snapshot file to the store.
+
+        Args:
+            file_path: path of the snapshot file.
+        """
+        with open(file_path, "r", newline="", encoding="utf-8") as snapshot_file:
+            for row in csv.DictReader(snapshot_file):
+                self.add(row["Label"], row["Info"], int(row["Mentions"]))
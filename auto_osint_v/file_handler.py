@@ -2,9 +2,12 @@
 """
 
 import csv
+import json
 import os
 import webbrowser
-import pandas as pd
+
+from auto_osint_v.entity_store import EntityStore
+from auto_osint_v.source_record import SourceRecord
 
 
 class FileHandler:
@@ -21,6 +24,9 @@ class FileHandler:
         # empty list to hold unique urls present after searching
         self.urls_present = []
         self.data_file_path = data_file
+        # target entities from the intelligence statement, see EntityProcessor
+        self.target_entities = EntityStore()
+        self.target_info_path = os.path.join(data_file, "target_info.csv")
 
     def write_bias_file(self, info_analyser):
         """Creates and writes to the bias information file.
@@ -101,32 +107,20 @@ class FileHandler:
             return temp
 
     def get_keywords_from_target_info(self):
-        """Gets all the information that is stored in the 'Info' field in each target info file.
+        """Gets the text of every target entity, except those with no meaning without context.
+
+        If no entities have been stored in this run, they are loaded from the last snapshot.
 
         Returns:
-            All the info stored in /target_info_files/
+            All the target info stored in self.target_entities
         """
-        # List of words that have no meaning without context
-        irrelevant_words = ["it", "them", "they", "the", "he", "she", "his", "her", "we", "i",
-                            "us", "me", "my", "here", "our"]
-        # the directory to find the target info files
-        target_files_dir = os.path.join(self.data_file_path, "target_info_files/")
-        # list target info files
-        target_files = os.listdir(target_files_dir)
-        # Create list to store keywords
-        info_all = []
-        # read each file individually
-        for file in target_files:
-            filepath = os.path.join(target_files_dir, file)
-            frame = pd.read_csv(filepath, index_col=False)
-            # appends every entry in the 'info' column to the 'info_all' list unless
-            # it is irrelevant
-            values = frame["Info"].values.tolist()
-            info_all.extend(values)
-        # remove irrelevant words
-        info_all = [word for word in info_all if word not in irrelevant_words]
-        # return list after each file has been examined
-        return info_all
+        if not self.target_entities and os.path.isfile(self.target_info_path):
+            self.target_entities.load_snapshot(self.target_info_path)
+        return self.target_entities.keywords()
+
+    def write_target_info_snapshot(self):
+        """Writes the target entities to the target info file, in one go."""
+        self.target_entities.write_snapshot(self.target_info_path)
 
     @staticmethod
     def clean_directory(directory):
@@ -166,7 +160,7 @@ class FileHandler:
             writer.writerow(to_write)  # writes a row of the csv file using the list 'to_files'
         except ValueError as exc:
             raise ValueError(
-                "I/O operation on closed file. Issue with FileHandler.open_label_file") \
+                "I/O operation on closed file. Issue with FileHandler.open_evidence_file") \
                 from exc
 
     def write_to_txt_file_remove_duplicates(self, file_object, to_write):
@@ -211,40 +205,6 @@ class FileHandler:
         """
         file_object.close()
 
-    def open_label_file(self, label, text, mentions):
-        """Creates/Opens label file directory and the label file itself.
-
-        Args:
-            text: The labelled word
-            mentions: The number of times the text has appeared.
-            label: This will be the name for the label file. This is the label associated with a
-                word
-
-        Returns:
-            Nothing - output to file
-        """
-        label_files_directory = self.data_file_path + "target_info_files"
-        try:
-            os.mkdir(label_files_directory)
-            file_path = str(os.path.join(label_files_directory, label + ".csv"))
-        except FileExistsError:
-            file_path = str(os.path.join(label_files_directory, label + ".csv"))
-        fieldnames = ['Info', 'Mentions']
-        try:
-            with open(file_path, "x", encoding="utf-8") as label_file:
-                # Creation of csv file
-                writer = csv.DictWriter(label_file, fieldnames)
-                # enter source type and key information
-                writer.writeheader()
-                # Write info to csv
-                to_write = [text, mentions]
-                self.write_to_given_csv_file(label_file, to_write)
-        except FileExistsError:
-            with open(file_path, "a", encoding="utf-8") as label_file:
-                # Write info to csv
-                to_write = [text, mentions]
-                self.write_to_given_csv_file(label_file, to_write)
-
     def open_evidence_file(self, to_write):
         """Creates/Opens evidence file and writes to it.
 
@@ -275,13 +235,13 @@ class FileHandler:
             list_of_dicts = list(reader)
             return list_of_dicts
 
-    def create_potential_corroboration_file(self, sources_list_of_dicts):
+    def create_potential_corroboration_file(self, sources):
         """Creates the potential corroboration source store.
 
-        Writes the list of dictionaries to a csv file.
+        Writes the list of source records to a csv file.
 
         Args:
-            sources_list_of_dicts: Must be a list of dictionaries ( list[dict[x,y]] )
+            sources: Must be a list of SourceRecord objects
 
         Returns:
             nothing, outputs to file
@@ -291,14 +251,12 @@ class FileHandler:
             self.clean_data_file("potential_corroboration.csv")
         except FileNotFoundError:
             pass
-        # get keys of dictionary and store as fieldnames
-        fieldnames = sources_list_of_dicts[0].keys()
         with open(sources_file_path, "x", newline="", encoding="utf-8") as sources_file:
             # create writer object
-            writer = csv.DictWriter(sources_file, fieldnames)
-            writer.writeheader()
-            # write the dictionary to csv
-            writer.writerows(sources_list_of_dicts)
+            writer = csv.writer(sources_file)
+            writer.writerow(SourceRecord.csv_fields)
+            # write each record as a row
+            writer.writerows(source.as_row() for source in sources)
 
     def get_output_path(self, postfix, file_ext):
         """Gets the path of the output file"""
@@ -309,3 +267,19 @@ class FileHandler:
         except FileExistsError:
             file_path = str(os.path.join(output_directory, f"output{postfix}.{file_ext}"))
         return file_path
+
+    def write_jsonl_output(self, rows, postfix):
+        """Writes the output rows to a JSON Lines file, one row at a time.
+
+        Args:
+            rows: iterable of dictionaries, one per row of the output.
+            postfix: the output file's postfix.
+
+        Returns:
+            the path of the output file
+        """
+        file_path = self.get_output_path(postfix, "jsonl")
+        with open(file_path, "w", encoding="utf-8") as output_file:
+            for row in rows:
+                output_file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        return file_path
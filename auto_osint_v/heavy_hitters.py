@@ -0,0 +1,94 @@
+"""This module tracks the most frequent items of a stream in a fixed amount of memory.
+
+Used to find the popular entities amongst the sources: every source's entities are added as soon
+as the source has been processed, and the top entities are ready when the last source finishes.
+Only a fixed number of counters is kept, however large the vocabulary of the sources.
+"""
+import heapq
+
+
+class SpaceSaving:
+    """The Space-Saving heavy hitters algorithm (Metwally, Agrawal and El Abbadi, 2005).
+
+    At most capacity items are counted. When a new item arrives and every counter is in use, the
+    item with the smallest count is replaced, and the new item inherits its count as an error
+    bound. Any item occurring more than total / capacity times is guaranteed to be tracked, and
+    while no item has been replaced every count is exact.
+    """
+
+    def __init__(self, capacity=1000):
+        """Initialises the SpaceSaving object.
+
+        Args:
+            capacity: the maximum number of items counted.
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        # item -> [count, error], the count overestimates the item's count by at most error
+        self.counters = {}
+        # min-heap of (count, item), with outdated entries skipped when popped
+        self._heap = []
+        # the number of items added, and the number of tracked items replaced
+        self.total = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.counters)
+
+    def add(self, item, count=1):
+        """Adds occurrences of an item.
+
+        Args:
+            item: the item, e.g. an entity.
+            count: the number of occurrences.
+        """
+        self.total += count
+        counter = self.counters.get(item)
+        if counter is None:
+            error = 0
+            if len(self.counters) >= self.capacity:
+                # replace the item with the smallest count
+                error, evicted = self._pop_min()
+                del self.counters[evicted]
+                self.evictions += 1
+            counter = self.counters[item] = [error, error]
+        counter[0] += count
+        heapq.heappush(self._heap, (counter[0], item))
+        if len(self._heap) > 4 * self.capacity:
+            # drop the outdated entries, so the heap stays proportional to the capacity
+            self._heap = [(counter[0], tracked) for tracked, counter in self.counters.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self):
+        """Removes the heap entry of the tracked item with the smallest count.
+
+        Returns:
+            (count, item)
+        """
+        while True:
+            count, item = heapq.heappop(self._heap)
+            counter = self.counters.get(item)
+            if counter is not None and counter[0] == count:
+                return count, item
+
+    def update(self, items):
+        """Adds one occurrence of each item."""
+        for item in items:
+            self.add(item)
+
+    def top(self, k):
+        """Gets the k items with the highest counts.
+
+        Args:
+            k: the number of items.
+
+        Returns:
+            list of (item, count) tuples, in descending order of count
+        """
+        return heapq.nlargest(k, ((item, counter[0]) for item, counter in self.counters.items()),
+                              key=lambda x: x[1])
+
+    def distinct(self):
+        """Gets the number of distinct items added, or None if it is more than the capacity."""
+        return len(self.counters) if not self.evictions else None
@@ -0,0 +1,295 @@
+"""This module schedules the requests made to each host, learning from previous requests.
+
+Every fetch records its latency and outcome against the URL's host. This history is used to:
+    - set the timeout of each request from the host's latency (fast hosts fail fast),
+    - skip URLs that recently failed (4xx, 5xx or timeouts) until their entry expires,
+    - stop requesting hosts that keep failing (circuit breaker) until a cool-down has passed.
+
+Responses that block scripted clients (e.g. 403 from social media sites) are not failures: the
+page may still be fetched with a browser, so they are neither skipped nor counted by the breaker.
+
+The history is kept in a small SQLite database, so it is shared by the worker processes and
+persists between runs.
+"""
+import os
+import sqlite3
+import time
+from urllib.parse import urlsplit
+import requests
+from auto_osint_v.http_session import get_session
+from auto_osint_v.metrics import FETCH_FAILURES, FETCH_SECONDS, get_metrics
+
+# path of the default host history database
+HOSTS_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_files",
+                             "hosts.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hosts (
+    host TEXT PRIMARY KEY,
+    latency REAL NOT NULL,
+    deviation REAL NOT NULL,
+    failures INTEGER NOT NULL DEFAULT 0,
+    open_until REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS failed_urls (
+    url TEXT PRIMARY KEY,
+    status INTEGER NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+# the scheduler used by the fetching functions, created the first time it is needed
+_SCHEDULER = None
+
+
+class HostUnavailable(requests.exceptions.ConnectTimeout):
+    """Raised instead of making a request that is expected to fail.
+
+    Subclasses ConnectTimeout so that callers already handling timeouts and connection errors
+    treat a skipped request like a failed one.
+    """
+
+
+class HostScheduler:
+    """Tracks the latency and failures of each host and decides how (or whether) to fetch a URL.
+
+    Latency is tracked like TCP's retransmission timer: a smoothed latency and its mean deviation,
+    giving a timeout of latency + 4 * deviation, clamped between min_timeout and the caller's
+    maximum timeout.
+    """
+    # weight of each new sample in the smoothed latency and deviation
+    latency_weight = 0.125
+    deviation_weight = 0.25
+    min_timeout = 1.0
+    # how long failed URLs are skipped for (seconds). Client errors (e.g. 403, 404) rarely change,
+    # while server errors and timeouts are often temporary.
+    client_error_ttl = 24 * 60 * 60
+    server_error_ttl = 60 * 60
+    # consecutive failures before a host's circuit is opened, and how long it stays open
+    failure_threshold = 5
+    cool_down = 10 * 60
+    # statuses sites use to turn away scripted clients, the page may still load in a browser
+    blocked_statuses = frozenset([401, 403, 406, 429])
+
+    def __init__(self, db_path):
+        """Initialises the HostScheduler object.
+
+        Args:
+            db_path: path of the SQLite database storing the host history.
+        """
+        self.db_path = db_path
+        self._connection = None
+        self._pid = None
+
+    def __getstate__(self):
+        # each process opens its own connection
+        state = self.__dict__.copy()
+        state["_connection"] = None
+        state["_pid"] = None
+        return state
+
+    @property
+    def connection(self):
+        """The SQLite connection of the current process."""
+        if self._connection is None or self._pid != os.getpid():
+            # a connection can't be shared with a forked process, so open a new one
+            self._connection = sqlite3.connect(self.db_path, timeout=30)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._connection
+
+    def close(self):
+        """Closes the database connection of the current process."""
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+    @staticmethod
+    def host(url):
+        """Gets the host of a URL, e.g. 'www.bbc.co.uk'."""
+        return urlsplit(url).netloc.lower()
+
+    def timeout(self, url, max_timeout):
+        """Gets the timeout to use for a request to the given URL.
+
+        Args:
+            url: the URL to request.
+            max_timeout: the longest timeout to use, also used for hosts with no history.
+
+        Returns:
+            the timeout in seconds
+        """
+        row = self.connection.execute("SELECT latency, deviation FROM hosts WHERE host = ?",
+                                      (self.host(url),)).fetchone()
+        if row is None:
+            return max_timeout
+        latency, deviation = row
+        return min(max(latency + 4 * deviation, self.min_timeout), max_timeout)
+
+    def allow(self, url):
+        """Checks whether a URL should be requested.
+
+        Args:
+            url: the URL to request.
+
+        Returns:
+            False if the URL recently failed or its host's circuit is open
+        """
+        now = time.time()
+        failed = self.connection.execute("SELECT expires FROM failed_urls WHERE url = ?",
+                                         (url,)).fetchone()
+        if failed is not None and failed[0] > now:
+            return False
+        host = self.connection.execute("SELECT open_until FROM hosts WHERE host = ?",
+                                       (self.host(url),)).fetchone()
+        # once the cool-down has passed the next request is let through (half-open); if it fails
+        # too the circuit opens again straight away
+        return host is None or host[0] <= now
+
+    def _update_host(self, url, latency, failed):
+        """Adds a request to the host's latency and failure history.
+
+        Args:
+            url: the requested URL.
+            latency: the time taken by the request, in seconds.
+            failed: whether the request failed, or None to leave the host's failures unchanged.
+        """
+        host = self.host(url)
+        row = self.connection.execute(
+            "SELECT latency, deviation, failures, open_until FROM hosts WHERE host = ?",
+            (host,)).fetchone()
+        if row is None:
+            smoothed, deviation, failures, open_until = latency, latency / 2, 0, 0.0
+        else:
+            smoothed, deviation, failures, open_until = row
+            deviation += self.deviation_weight * (abs(latency - smoothed) - deviation)
+            smoothed += self.latency_weight * (latency - smoothed)
+        # the circuit (and its cool-down) is only changed by successes and failures
+        if failed is not None:
+            failures = failures + 1 if failed else 0
+            open_until = 0.0
+            if failures >= self.failure_threshold:
+                open_until = time.time() + self.cool_down
+        self.connection.execute(
+            "INSERT OR REPLACE INTO hosts (host, latency, deviation, failures, open_until) "
+            "VALUES (?, ?, ?, ?, ?)", (host, smoothed, deviation, failures, open_until))
+
+    def record_success(self, url, latency):
+        """Records a successful request, closing the host's circuit.
+
+        Args:
+            url: the requested URL.
+            latency: the time taken by the request, in seconds.
+        """
+        with self.connection:
+            self._update_host(url, latency, False)
+            self.connection.execute("DELETE FROM failed_urls WHERE url = ?", (url,))
+
+    def record_blocked(self, url, latency):
+        """Records a request the host blocked, e.g. a 403 to a scripted client.
+
+        Only the host's latency is updated: the URL is not skipped, so callers with a browser
+        fallback can still fetch it, and the host's circuit is left as it was.
+
+        Args:
+            url: the requested URL.
+            latency: the time taken by the request, in seconds.
+        """
+        with self.connection:
+            self._update_host(url, latency, None)
+
+    def record_failure(self, url, latency, status=0):
+        """Records a failed request, skipping the URL until its entry expires.
+
+        Args:
+            url: the requested URL.
+            latency: the time taken by the request (or the timeout), in seconds.
+            status: the HTTP status code, or 0 for timeouts and connection errors.
+        """
+        ttl = self.client_error_ttl if 400 <= status < 500 else self.server_error_ttl
+        with self.connection:
+            self._update_host(url, latency, True)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO failed_urls (url, status, expires) VALUES (?, ?, ?)",
+                (url, status, time.time() + ttl))
+
+    def clear_failure(self, url):
+        """Stops skipping a URL, e.g. when it was fetched another way after failing.
+
+        Args:
+            url: the URL that failed.
+        """
+        with self.connection:
+            self.connection.execute("DELETE FROM failed_urls WHERE url = ?", (url,))
+            self.connection.execute("UPDATE hosts SET failures = 0, open_until = 0 WHERE host = ?",
+                                    (self.host(url),))
+
+    def get(self, url, *, max_timeout=10, **kwargs):
+        """Requests a URL through the shared HTTP session, using a timeout adapted to its host.
+
+        Args:
+            url: the URL to request.
+            max_timeout: the longest timeout to use, in seconds.
+            kwargs: keyword arguments passed on to HTTPSession.get, e.g. headers.
+
+        Returns:
+            the response, whatever its status code
+
+        Raises:
+            HostUnavailable: if the URL recently failed or its host keeps failing.
+            requests.exceptions.RequestException: if the request fails.
+        """
+        metrics = get_metrics()
+        if not self.allow(url):
+            metrics.inc(FETCH_FAILURES, reason="skipped")
+            raise HostUnavailable(f"Skipping {url}, it or its host recently failed")
+        timeout = self.timeout(url, max_timeout)
+        start = time.monotonic()
+        try:
+            response = get_session().get(url, timeout=timeout, **kwargs)
+        except requests.exceptions.RequestException as error:
+            self.record_failure(url, time.monotonic() - start)
+            metrics.inc(FETCH_FAILURES, reason=self.failure_reason(error))
+            raise
+        latency = time.monotonic() - start
+        metrics.observe(FETCH_SECONDS, latency)
+        if response.status_code in self.blocked_statuses:
+            self.record_blocked(url, latency)
+            metrics.inc(FETCH_FAILURES, reason="blocked")
+        elif response.status_code >= 400:
+            self.record_failure(url, latency, response.status_code)
+            metrics.inc(FETCH_FAILURES, reason=f"http_{response.status_code // 100}xx")
+        else:
+            self.record_success(url, latency)
+        return response
+
+    @staticmethod
+    def failure_reason(error):
+        """Gets the reason a request failed, for the fetch failure metric.
+
+        Args:
+            error: the requests exception raised by the request.
+
+        Returns:
+            'timeout', 'ssl', 'connection' or 'error'
+        """
+        if isinstance(error, requests.exceptions.Timeout):
+            return "timeout"
+        if isinstance(error, requests.exceptions.SSLError):
+            return "ssl"
+        if isinstance(error, requests.exceptions.ConnectionError):
+            return "connection"
+        return "error"
+
+
+def get_scheduler():
+    """Gets the host scheduler used for fetching sources, creating it the first time.
+
+    Returns:
+        the HostScheduler object
+    """
+    global _SCHEDULER
+    if _SCHEDULER is None:
+        _SCHEDULER = HostScheduler(HOSTS_DB_PATH)
+    return _SCHEDULER
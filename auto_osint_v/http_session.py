@@ -0,0 +1,148 @@
+"""This module provides the HTTP session used for every fetch, shared by the requests of a process.
+
+A bare requests.get opens a new connection, and a new TLS handshake, for every page. The session
+keeps a pool of connections to each host, so fetching several pages from the same site reuses
+them. It also:
+    - sends browser-like headers, so fewer sites answer 403 and send us to the Selenium fallback,
+    - asks for every compression we can decode (gzip and deflate, plus brotli and zstd when their
+      libraries are installed),
+    - uses HTTP/2 through httpx when httpx and h2 are installed, falling back to requests.
+
+Each process has its own session: connections can't be shared with a forked process.
+"""
+import importlib.util
+import os
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.request import ACCEPT_ENCODING
+
+# headers sent with every request, like those of a desktop browser
+BROWSER_HEADERS = {
+    'User-Agent':
+        'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+        'Chrome/112.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'en-GB,en;q=0.9',
+    # only the encodings urllib3 can decode here (brotli and zstd need their libraries)
+    'Accept-Encoding': ACCEPT_ENCODING.replace(",", ", "),
+}
+
+# options of the sessions created by get_session, see configure_session
+_OPTIONS = {}
+# the session of the current process, and the process it was created in
+_SESSION = None
+_SESSION_PID = None
+
+
+def http2_available():
+    """Checks whether httpx and h2 are installed, for HTTP/2 support."""
+    return all(importlib.util.find_spec(name) is not None for name in ("httpx", "h2"))
+
+
+class HTTPSession:
+    """Fetches URLs over pooled, kept-alive connections, with HTTP/2 where available.
+
+    Responses and exceptions are those of requests whichever client is used, so callers only need
+    to handle requests' exceptions.
+    """
+
+    def __init__(self, http2=None, pool_connections=32, pool_maxsize=8, headers=None):
+        """Initialises the HTTPSession object.
+
+        Args:
+            http2: whether to use HTTP/2 (through httpx). Defaults to using it if it is available.
+            pool_connections: the number of hosts whose connections are kept.
+            pool_maxsize: the number of connections kept to each host.
+            headers: Optional headers replacing or adding to BROWSER_HEADERS.
+        """
+        self.headers = dict(BROWSER_HEADERS)
+        self.headers.update(headers or {})
+        self.http2 = http2_available() if http2 is None else http2
+        if self.http2:
+            import httpx
+            self._client = httpx.Client(
+                http2=True, headers=self.headers, follow_redirects=True,
+                limits=httpx.Limits(max_connections=pool_connections * pool_maxsize,
+                                    max_keepalive_connections=pool_connections))
+        else:
+            self._client = requests.Session()
+            self._client.headers.update(self.headers)
+            adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+            self._client.mount("http://", adapter)
+            self._client.mount("https://", adapter)
+
+    def get(self, url, timeout=None, headers=None, **kwargs):
+        """Requests a URL.
+
+        Args:
+            url: the URL to request.
+            timeout: Optional timeout, in seconds.
+            headers: Optional headers replacing or adding to the session's headers.
+            kwargs: keyword arguments passed on to the client's get.
+
+        Returns:
+            the requests.Response
+
+        Raises:
+            requests.exceptions.RequestException: if the request fails.
+        """
+        if not self.http2:
+            return self._client.get(url, timeout=timeout, headers=headers, **kwargs)
+        import httpx
+        try:
+            response = self._client.get(url, timeout=timeout, headers=headers, **kwargs)
+        except httpx.ConnectTimeout as error:
+            raise requests.exceptions.ConnectTimeout(str(error)) from error
+        except httpx.TimeoutException as error:
+            raise requests.exceptions.ReadTimeout(str(error)) from error
+        except (httpx.ConnectError, httpx.RemoteProtocolError) as error:
+            raise requests.exceptions.ConnectionError(str(error)) from error
+        except (httpx.HTTPError, httpx.InvalidURL) as error:
+            raise requests.exceptions.RequestException(str(error)) from error
+        return self._to_requests_response(response)
+
+    @staticmethod
+    def _to_requests_response(response):
+        """Converts an httpx response to a requests response."""
+        converted = requests.Response()
+        converted.status_code = response.status_code
+        converted.headers = CaseInsensitiveDict(response.headers)
+        # the content has already been decompressed by httpx
+        converted._content = response.content
+        converted.encoding = response.encoding
+        converted.url = str(response.url)
+        converted.reason = response.reason_phrase
+        return converted
+
+    def close(self):
+        """Closes the session's connections."""
+        self._client.close()
+
+
+def configure_session(**options):
+    """Sets the options of the sessions created from now on, see HTTPSession.
+
+    Args:
+        options: keyword arguments for HTTPSession, e.g. http2=False.
+    """
+    global _SESSION
+    _OPTIONS.clear()
+    _OPTIONS.update(options)
+    if _SESSION is not None and _SESSION_PID == os.getpid():
+        _SESSION.close()
+    _SESSION = None
+
+
+def get_session():
+    """Gets the HTTP session of the current process, creating it the first time.
+
+    Returns:
+        the HTTPSession object
+    """
+    global _SESSION, _SESSION_PID
+    if _SESSION is None or _SESSION_PID != os.getpid():
+        # a session's connections can't be shared with a forked process, so create a new one
+        _SESSION = HTTPSession(**_OPTIONS)
+        _SESSION_PID = os.getpid()
+    return _SESSION
@@ -0,0 +1,225 @@
+"""This module caches model results by content, so that no text goes through a model twice.
+
+Results are keyed by (model id, model version, SHA-256 of the text), so a changed model never reuses
+old results. The cache is a SQLite database shared by the worker processes and kept between runs.
+It is bounded in size: once it holds more than max_entries results, the least recently used are
+evicted. Hits and misses are counted per model.
+
+Used for NER entities (specific_entity_processor), headline and statement sentiment
+(sentiment_analyser) and sentence embeddings (embed).
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from auto_osint_v.metrics import INFERENCE_SECONDS, INFERENCE_TEXTS, get_metrics
+
+# path of the default inference cache database
+INFERENCE_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_files",
+                                    "inference_cache.sqlite")
+# the sentence embedding model used to compare texts
+EMBEDDING_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS inferences (
+    model TEXT NOT NULL,
+    version TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    result TEXT NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (model, version, text_hash)
+);
+CREATE INDEX IF NOT EXISTS inferences_last_used ON inferences (last_used);
+CREATE TABLE IF NOT EXISTS counters (
+    model TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0
+);
+-- running count of the results stored (an upper bound, replaced results are counted again), so
+-- the table is only counted when it may be full
+CREATE TABLE IF NOT EXISTS size (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    entries INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO size (id, entries) SELECT 1, COUNT(*) FROM inferences;
+"""
+
+# the cache used by the models, created the first time it is needed
+_CACHE = None
+# loaded sentence embedding models, by name
+_EMBEDDING_MODELS = {}
+
+
+class InferenceCache:
+    """Persistent, size-bounded cache of model results, keyed by model, version and text hash.
+    """
+
+    def __init__(self, db_path, max_entries=200000):
+        """Initialises the InferenceCache object.
+
+        Args:
+            db_path: path of the SQLite database storing the results.
+            max_entries: the number of results kept before the least recently used are evicted.
+        """
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._connection = None
+        self._pid = None
+
+    def __getstate__(self):
+        # each process opens its own connection
+        state = self.__dict__.copy()
+        state["_connection"] = None
+        state["_pid"] = None
+        return state
+
+    @property
+    def connection(self):
+        """The SQLite connection of the current process."""
+        if self._connection is None or self._pid != os.getpid():
+            # a connection can't be shared with a forked process, so open a new one
+            self._connection = sqlite3.connect(self.db_path, timeout=30)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._connection
+
+    def close(self):
+        """Closes the database connection of the current process."""
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+    @staticmethod
+    def text_hash(text):
+        """Gets the hash identifying a text."""
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def map(self, model, version, texts, infer):
+        """Gets the result of a model for each text, only running the model on uncached texts.
+
+        Uncached texts are passed to the model in a single batch, each distinct text once.
+
+        Args:
+            model: the model id, e.g. 'Souvikcmsa/BERT_sentiment_analysis'.
+            version: the model version.
+            texts: list of texts.
+            infer: function taking a list of texts and returning a list of JSON serialisable
+                results, one per text.
+
+        Returns:
+            list of results, one per text
+        """
+        if not texts:
+            return []
+        hashes = [self.text_hash(text) for text in texts]
+        results = {}
+        unique_hashes = list(dict.fromkeys(hashes))
+        for i in range(0, len(unique_hashes), 500):
+            chunk = unique_hashes[i:i + 500]
+            rows = self.connection.execute(
+                "SELECT text_hash, result FROM inferences WHERE model = ? AND version = ? AND "
+                f"text_hash IN ({', '.join('?' * len(chunk))})", [model, version] + chunk)
+            results.update((text_hash, json.loads(result)) for text_hash, result in rows)
+        hits = list(results)
+        missing = {}
+        for text_hash, text in zip(hashes, texts):
+            if text_hash not in results:
+                missing.setdefault(text_hash, text)
+        metrics = get_metrics()
+        if missing:
+            with metrics.timer(INFERENCE_SECONDS, model=model):
+                results.update(zip(missing, infer(list(missing.values()))))
+        metrics.inc(INFERENCE_TEXTS, len(texts) - len(missing), model=model, cache="hit")
+        metrics.inc(INFERENCE_TEXTS, len(missing), model=model, cache="miss")
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE inferences SET last_used = ? WHERE model = ? AND version = ? AND "
+                "text_hash = ?", [(now, model, version, text_hash) for text_hash in hits])
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO inferences (model, version, text_hash, result, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(model, version, text_hash, json.dumps(results[text_hash]), now)
+                 for text_hash in missing])
+            self.connection.execute(
+                "INSERT OR IGNORE INTO counters (model, hits, misses) VALUES (?, 0, 0)", (model,))
+            self.connection.execute(
+                "UPDATE counters SET hits = hits + ?, misses = misses + ? WHERE model = ?",
+                (len(texts) - len(missing), len(missing), model))
+            self.connection.execute("UPDATE size SET entries = entries + ?", (len(missing),))
+            entries = self.connection.execute("SELECT entries FROM size").fetchone()[0]
+        if entries > self.max_entries:
+            self.evict()
+        return [results[text_hash] for text_hash in hashes]
+
+    def evict(self):
+        """Evicts the least recently used results once there are more than max_entries."""
+        with self.connection:
+            count = self.connection.execute("SELECT COUNT(*) FROM inferences").fetchone()[0]
+            if count > self.max_entries:
+                # evict down to 90% so eviction doesn't run again for a while
+                self.connection.execute(
+                    "DELETE FROM inferences WHERE rowid IN (SELECT rowid FROM inferences "
+                    "ORDER BY last_used LIMIT ?)", (count - int(self.max_entries * 0.9),))
+                count = int(self.max_entries * 0.9)
+            self.connection.execute("UPDATE size SET entries = ?", (count,))
+
+    def stats(self):
+        """Gets the number of hits and misses of each model, since the cache was created.
+
+        Returns:
+            dictionary of model -> (hits, misses)
+        """
+        return {model: (hits, misses) for model, hits, misses in
+                self.connection.execute("SELECT model, hits, misses FROM counters")}
+
+    def report(self, since=None):
+        """Gets the hits, misses and hit rate of each model, as a printable table.
+
+        Args:
+            since: Optional earlier result of stats(), to only report what happened since then.
+
+        Returns:
+            the report
+        """
+        since = since or {}
+        lines = ["Model inference cache: hits, misses, hit rate"]
+        for model, (hits, misses) in self.stats().items():
+            hits -= since.get(model, (0, 0))[0]
+            misses -= since.get(model, (0, 0))[1]
+            if hits + misses:
+                lines.append(f"{model}: {hits}, {misses}, {hits / (hits + misses):.0%}")
+        return "\n".join(lines)
+
+
+def get_cache():
+    """Gets the inference cache used by the models, creating it the first time.
+
+    Returns:
+        the InferenceCache object
+    """
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = InferenceCache(INFERENCE_CACHE_PATH)
+    return _CACHE
+
+
+def embed(texts, model_name=EMBEDDING_MODEL):
+    """Gets the sentence embedding of each text. The model is only loaded for uncached texts.
+
+    Args:
+        texts: list of texts.
+        model_name: the name of the sentence-transformers model.
+
+    Returns:
+        list of embeddings (lists of floats), one per text
+    """
+    import sentence_transformers
+
+    def infer(missing):
+        if model_name not in _EMBEDDING_MODELS:
+            _EMBEDDING_MODELS[model_name] = sentence_transformers.SentenceTransformer(model_name)
+        return _EMBEDDING_MODELS[model_name].encode(missing).tolist()
+    return get_cache().map(model_name, sentence_transformers.__version__, texts, infer)
@@ -0,0 +1,395 @@
+"""This module records counters and histograms of the pipeline's health, for Prometheus.
+
+Metrics are recorded by every process (fetch and NER workers, work queue workers and the main
+process) into a SQLite database shared by the processes of a machine and kept between runs, so
+counters only ever increase, as Prometheus expects. They can be exported:
+    - as a textfile, written at the end of each run with --metrics_file, for node_exporter's
+      textfile collector,
+    - over HTTP, by the tool itself while it runs (--metrics_port) or by a daemon serving the
+      database (python -m auto_osint_v.metrics serve).
+
+The Prometheus text format is used, or OpenMetrics when a scraper asks for it.
+
+Recorded: fetch latency per host, fetch failures by reason, Selenium fallbacks, search API
+requests (and searches reused without a request), model inference batches and latency, sources
+dropped at each stage, the time taken by each stage and by each run.
+"""
+import argparse
+import bisect
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# path of the default metrics database
+METRICS_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_files",
+                               "metrics.sqlite")
+# upper bounds (seconds) of the histogram buckets of requests and model batches
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# upper bounds (seconds) of the histogram buckets of stages and runs
+DURATION_BUCKETS = (1, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    suffix TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels, suffix)
+) WITHOUT ROWID;
+"""
+
+# every metric, by name, in the order they are exported
+METRICS = {}
+# the registry used by the pipeline, created the first time it is needed
+_METRICS = None
+
+
+class Metric:
+    """The definition of a counter, gauge or histogram.
+    """
+
+    def __init__(self, name, kind, documentation, labels=(), buckets=None):
+        """Initialises the Metric object and adds it to METRICS.
+
+        Args:
+            name: the metric name, without the '_total' suffix of counters.
+            kind: 'counter', 'gauge' or 'histogram'.
+            documentation: the help text of the metric.
+            labels: the names of the metric's labels.
+            buckets: the upper bounds of a histogram's buckets, in increasing order.
+        """
+        if kind not in ("counter", "gauge", "histogram"):
+            raise ValueError(f"Unknown metric type '{kind}'")
+        self.name = name
+        self.kind = kind
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets or ())
+        METRICS[name] = self
+
+    def label_values(self, labels):
+        """Gets the values of the metric's labels, in the order of its label names."""
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} has labels {self.labels}, got {tuple(labels)}")
+        return [str(labels[label]) for label in self.labels]
+
+
+# not labelled by host: the database is kept between runs, so every host ever fetched would add a
+# series (the host scheduler keeps each host's latency)
+FETCH_SECONDS = Metric("auto_osint_v_fetch_duration_seconds", "histogram",
+                       "Time taken to fetch a page", (), LATENCY_BUCKETS)
+FETCH_FAILURES = Metric("auto_osint_v_fetch_failures", "counter",
+                        "Page fetches that failed or were skipped, by reason", ("reason",))
+SELENIUM_FALLBACKS = Metric("auto_osint_v_selenium_fallbacks", "counter",
+                            "Pages fetched with Selenium after the plain request failed, by stage",
+                            ("stage",))
+SEARCH_REQUESTS = Metric("auto_osint_v_search_requests", "counter",
+                         "Search API requests, by backend and outcome", ("backend", "outcome"))
+SEARCHES_REUSED = Metric("auto_osint_v_searches_reused", "counter",
+                         "Searches answered without a request, by where the results came from",
+                         ("source",))
+INFERENCE_SECONDS = Metric("auto_osint_v_inference_batch_duration_seconds", "histogram",
+                           "Time taken by a batch of model inference, by model", ("model",),
+                           LATENCY_BUCKETS)
+INFERENCE_TEXTS = Metric("auto_osint_v_inference_texts", "counter",
+                         "Texts given to a model, by model and inference cache result",
+                         ("model", "cache"))
+QUERIES_REMOVED = Metric("auto_osint_v_queries_removed", "counter",
+                         "Near-duplicate queries and keyword groups removed before searching, by "
+                         "kind", ("kind",))
+SOURCES_DROPPED = Metric("auto_osint_v_sources_dropped", "counter",
+                         "Sources dropped, by the stage that dropped them", ("stage",))
+STAGE_SECONDS = Metric("auto_osint_v_stage_duration_seconds", "histogram",
+                       "Time taken by a stage of the pipeline", ("stage",), DURATION_BUCKETS)
+RUN_SECONDS = Metric("auto_osint_v_run_duration_seconds", "histogram",
+                     "Time taken to validate a statement", (), DURATION_BUCKETS)
+LAST_RUN = Metric("auto_osint_v_last_run_timestamp_seconds", "gauge",
+                  "Time the last run finished, in seconds since the epoch")
+
+
+def format_value(value):
+    """Formats a sample value for the text formats."""
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(names, values):
+    """Formats label names and values as {name="value",...}, escaping the values."""
+    if not names:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+               for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+class MetricsRegistry:
+    """Records metrics into a SQLite database and exports them in the Prometheus text formats.
+
+    Recording never raises: a metric that can't be written (e.g. the database is locked for too
+    long) is dropped rather than failing the fetch or model call being measured.
+    """
+
+    def __init__(self, db_path):
+        """Initialises the MetricsRegistry object.
+
+        Args:
+            db_path: path of the SQLite database storing the metrics.
+        """
+        self.db_path = db_path
+        # each thread has its own connection, as the HTTP endpoint renders from its own threads
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # each process opens its own connection
+        return {"db_path": self.db_path}
+
+    def __setstate__(self, state):
+        self.__init__(state["db_path"])
+
+    @property
+    def connection(self):
+        """The SQLite connection of the current process and thread."""
+        local = self._local
+        if getattr(local, "connection", None) is None or local.pid != os.getpid():
+            # a connection can't be shared with a forked process, so open a new one
+            local.connection = sqlite3.connect(self.db_path, timeout=30)
+            local.connection.execute("PRAGMA journal_mode=WAL")
+            local.connection.executescript(SCHEMA)
+            local.pid = os.getpid()
+        return local.connection
+
+    def close(self):
+        """Closes the database connection of the current process and thread."""
+        local = self._local
+        if getattr(local, "connection", None) is not None and local.pid == os.getpid():
+            local.connection.close()
+        local.connection = None
+
+    def _add(self, rows, replace=False):
+        """Adds to (or replaces) samples, in one transaction.
+
+        Args:
+            rows: list of (name, labels, suffix, value).
+            replace: whether to replace the samples' values rather than add to them.
+        """
+        update = "excluded.value" if replace else "value + excluded.value"
+        try:
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT INTO samples (name, labels, suffix, value) VALUES (?, ?, ?, ?) "
+                    f"ON CONFLICT (name, labels, suffix) DO UPDATE SET value = {update}", rows)
+        except sqlite3.Error:
+            pass
+
+    def inc(self, metric, amount=1, **labels):
+        """Increases a counter.
+
+        Args:
+            metric: the counter's Metric.
+            amount: the amount to add, at least 0.
+            labels: the value of each of the metric's labels.
+        """
+        if amount < 0:
+            raise ValueError("counters can only increase")
+        if amount:
+            self._add([(metric.name, json.dumps(metric.label_values(labels)), "", amount)])
+
+    def set(self, metric, value, **labels):
+        """Sets a gauge.
+
+        Args:
+            metric: the gauge's Metric.
+            value: the new value.
+            labels: the value of each of the metric's labels.
+        """
+        self._add([(metric.name, json.dumps(metric.label_values(labels)), "", value)],
+                  replace=True)
+
+    def observe(self, metric, value, **labels):
+        """Adds an observation to a histogram.
+
+        Buckets are stored as the count of their own observations, and made cumulative on export.
+
+        Args:
+            metric: the histogram's Metric.
+            value: the observed value, e.g. a duration in seconds.
+            labels: the value of each of the metric's labels.
+        """
+        label_values = json.dumps(metric.label_values(labels))
+        index = bisect.bisect_left(metric.buckets, value)
+        bucket = metric.buckets[index] if index < len(metric.buckets) else float("inf")
+        self._add([(metric.name, label_values, "bucket:" + format_value(bucket), 1),
+                   (metric.name, label_values, "sum", value),
+                   (metric.name, label_values, "count", 1)])
+
+    @contextmanager
+    def timer(self, metric, **labels):
+        """Observes the time taken by the code in the with block, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(metric, time.perf_counter() - start, **labels)
+
+    def values(self):
+        """Gets every recorded sample.
+
+        Returns:
+            dictionary of metric name -> {label values tuple -> {suffix -> value}}
+        """
+        values = {}
+        for name, labels, suffix, value in self.connection.execute(
+                "SELECT name, labels, suffix, value FROM samples ORDER BY name, labels"):
+            values.setdefault(name, {}).setdefault(tuple(json.loads(labels)), {})[suffix] = value
+        return values
+
+    def render(self, openmetrics=False):
+        """Exports every metric.
+
+        Args:
+            openmetrics: whether to use the OpenMetrics format rather than the Prometheus one.
+
+        Returns:
+            the metrics, as text
+        """
+        values = self.values()
+        lines = []
+        for metric in METRICS.values():
+            # the counter's family is named without '_total' in OpenMetrics only
+            family = metric.name
+            if metric.kind == "counter" and not openmetrics:
+                family += "_total"
+            lines.append(f"# HELP {family} {metric.documentation}")
+            lines.append(f"# TYPE {family} {metric.kind}")
+            for label_values, samples in values.get(metric.name, {}).items():
+                if len(label_values) != len(metric.labels):
+                    # recorded when the metric had other labels
+                    continue
+                labels = format_labels(metric.labels, label_values)
+                if metric.kind == "counter":
+                    lines.append(f"{metric.name}_total{labels} {format_value(samples[''])}")
+                elif metric.kind == "gauge":
+                    lines.append(f"{metric.name}{labels} {format_value(samples[''])}")
+                else:
+                    cumulative = 0
+                    for bucket in metric.buckets + (float("inf"),):
+                        cumulative += samples.get("bucket:" + format_value(bucket), 0)
+                        bucket_labels = format_labels(metric.labels + ("le",),
+                                                      label_values + (format_value(bucket),))
+                        lines.append(
+                            f"{metric.name}_bucket{bucket_labels} {format_value(cumulative)}")
+                    lines.append(f"{metric.name}_sum{labels} {format_value(samples['sum'])}")
+                    lines.append(f"{metric.name}_count{labels} {format_value(samples['count'])}")
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, file_path, openmetrics=False):
+        """Writes every metric to a file, replacing it in one step so it is never read half-written.
+
+        Args:
+            file_path: the path of the file, e.g. in node_exporter's textfile directory (the file
+                name should end in '.prom').
+            openmetrics: whether to use the OpenMetrics format rather than the Prometheus one.
+        """
+        with open(file_path + ".tmp", "w", encoding="utf-8") as metrics_file:
+            metrics_file.write(self.render(openmetrics))
+        os.replace(file_path + ".tmp", file_path)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Answers scrapes of /metrics with the server's registry.
+    """
+
+    def do_GET(self):
+        """Sends every metric, in OpenMetrics if the scraper accepts it."""
+        if urlsplit(self.path).path not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+        body = self.server.registry.render(openmetrics).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type",
+                         OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # scrapes are too frequent to log
+        pass
+
+
+def create_server(registry, host="127.0.0.1", port=9464):
+    """Creates an HTTP server exporting the metrics of a registry on /metrics.
+
+    Args:
+        registry: the MetricsRegistry to export.
+        host: the address to listen on.
+        port: the port to listen on.
+
+    Returns:
+        the server, call serve_forever() to run it
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    server.registry = registry
+    return server
+
+
+def start_server(registry, host="127.0.0.1", port=9464):
+    """Serves the metrics of a registry from a background thread, while the pipeline runs.
+
+    Returns:
+        the server, call shutdown() to stop it
+    """
+    server = create_server(registry, host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def get_metrics():
+    """Gets the metrics registry used by the pipeline, creating it the first time.
+
+    Returns:
+        the MetricsRegistry object
+    """
+    global _METRICS
+    if _METRICS is None:
+        _METRICS = MetricsRegistry(METRICS_DB_PATH)
+    return _METRICS
+
+
+def parse_args(argv=None):
+    """Interprets the command line arguments of the metrics exporter."""
+    parser = argparse.ArgumentParser(prog="python -m auto_osint_v.metrics")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="Serve the metrics over HTTP for Prometheus")
+    serve.add_argument("--db", default=METRICS_DB_PATH, help="Path of the metrics database")
+    serve.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    serve.add_argument("--port", type=int, default=9464, help="Port to listen on")
+    write = commands.add_parser("write", help="Write the metrics to a textfile")
+    write.add_argument("--db", default=METRICS_DB_PATH, help="Path of the metrics database")
+    write.add_argument("--openmetrics", action="store_true",
+                       help="Use the OpenMetrics format rather than the Prometheus one")
+    write.add_argument("file", help="Path of the textfile, e.g. auto_osint_v.prom")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.command == "serve":
+        print(f"Serving metrics {args.db} on http://{args.host}:{args.port}/metrics")
+        create_server(MetricsRegistry(args.db), args.host, args.port).serve_forever()
+    else:
+        MetricsRegistry(args.db).write_textfile(args.file, args.openmetrics)
@@ -0,0 +1,13 @@
+"""Loads the NER model when imported.
+
+This module is preloaded by the forkserver of the NER worker pool (see worker_pool), so the model is
+loaded once in the forkserver and every worker forked from it shares the model's memory
+copy-on-write, instead of loading its own copy.
+"""
+from auto_osint_v.specific_entity_processor import get_ner
+
+try:
+    get_ner()
+except OSError:
+    # the model could not be found, each worker will report this when it needs the model
+    pass
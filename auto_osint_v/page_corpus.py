@@ -0,0 +1,101 @@
+"""This module stores the text of every fetched source in a single memory-mapped file.
+
+Page texts can be several megabytes each, so rather than pickling them between the worker processes
+and the main process, each text is written once to the corpus file and passed around as an
+(offset, length) handle. Any process can read a text back through its own memory map of the file.
+"""
+import mmap
+import os
+import tempfile
+
+
+class PageCorpus:
+    """Append-only corpus of UTF-8 page texts, read through a memory map.
+
+    Texts are appended with a single write to a file opened in append mode, so worker processes
+    can add texts concurrently. A PageCorpus pickles as its path, so it can be sent to workers.
+    """
+
+    def __init__(self, path=None):
+        """Initialises the PageCorpus object.
+
+        Args:
+            path: Optional path of the corpus file. By default a temporary file is created, and
+                deleted when the corpus is closed.
+        """
+        self.owner = path is None
+        if path is None:
+            file_descriptor, path = tempfile.mkstemp(prefix="page_corpus_", suffix=".txt")
+            os.close(file_descriptor)
+        self.path = path
+        self._file_descriptor = None
+        self._map = None
+        self._pid = None
+
+    def __getstate__(self):
+        # each process opens its own file descriptor and memory map, and never deletes the file
+        state = self.__dict__.copy()
+        state.update(owner=False, _file_descriptor=None, _map=None, _pid=None)
+        return state
+
+    def _check_process(self):
+        """Forgets the file descriptor and memory map inherited from a parent process."""
+        if self._pid != os.getpid():
+            self._file_descriptor = None
+            self._map = None
+            self._pid = os.getpid()
+
+    def add(self, text):
+        """Appends a text to the corpus.
+
+        Args:
+            text: the text to store.
+
+        Returns:
+            the (offset, length) handle of the text, in bytes
+        """
+        data = text.encode("utf-8")
+        if not data:
+            return 0, 0
+        self._check_process()
+        if self._file_descriptor is None:
+            self._file_descriptor = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+        written = os.write(self._file_descriptor, data)
+        if written != len(data):
+            raise OSError(f"Only {written} of {len(data)} bytes written to {self.path}")
+        # in append mode the file position is the end of our write, even with other writers
+        end = os.lseek(self._file_descriptor, 0, os.SEEK_CUR)
+        return end - len(data), len(data)
+
+    def get(self, handle):
+        """Reads a text from the corpus.
+
+        Args:
+            handle: the (offset, length) handle given by add.
+
+        Returns:
+            the text
+        """
+        offset, length = handle
+        if length == 0:
+            return ""
+        self._check_process()
+        if self._map is None or offset + length > len(self._map):
+            # the file has grown since it was mapped
+            if self._map is not None:
+                self._map.close()
+            with open(self.path, "rb") as corpus_file:
+                self._map = mmap.mmap(corpus_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[offset:offset + length].decode("utf-8")
+
+    def close(self):
+        """Closes the corpus, deleting its file if it is a temporary file owned by this object."""
+        self._check_process()
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file_descriptor is not None:
+            os.close(self._file_descriptor)
+            self._file_descriptor = None
+        if self.owner and os.path.exists(self.path):
+            os.remove(self.path)
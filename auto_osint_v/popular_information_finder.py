@@ -1,13 +1,15 @@
 """Finds entities (information) that is popular amongst the potentially corroborating sources.
 """
 import http.client
-import itertools
-from multiprocessing import Pool, Manager
+import math
 import requests
-import selenium.common.exceptions
 from bs4 import BeautifulSoup
 from tqdm import tqdm
-from seleniumwire import webdriver
+from auto_osint_v.heavy_hitters import SpaceSaving
+from auto_osint_v.host_scheduler import get_scheduler
+from auto_osint_v.metrics import SELENIUM_FALLBACKS, get_metrics
+from auto_osint_v.work_queue import run_job
+from auto_osint_v.worker_pool import NER_WORKER_MEMORY, ner_pool, pool_size
 
 
 class PopularInformationFinder:
@@ -17,49 +19,69 @@ class PopularInformationFinder:
     particular entity is mentioned.
     """
 
-    def __init__(self, file_handler_object, entity_processor_object):
+    # the most popular entities kept, as a share of the entities found, and at most
+    popular_share = 0.10
+    max_popular = 30
+
+    def __init__(self, file_handler_object, entity_processor_object, broker=None, capacity=1000):
         """Initialises the PopularInformationFinder object.
 
         Args:
             file_handler_object: gives the class access to the file_handler object.
             entity_processor_object: gives the class access to the entity_processor object.
+            broker: Optional work queue broker. If given, entities are found by workers pulling
+                tasks from it (see work_queue) rather than by a local pool.
+            capacity: the number of entities whose popularity is tracked, this bounds the memory
+                used. At least max_popular / popular_share keeps the cut-off exact.
         """
-        # Lazy creation of class attribute.
-        try:
-            manager = getattr(type(self), 'manager')
-        except AttributeError:
-            manager = type(self).manager = Manager()
-        self.entities = manager.dict()
+        # number of sources mentioning each entity, for the most popular entities only
+        self.entities = SpaceSaving(capacity)
+        # entities found in each source that can still be popular, url -> list of entities
+        self.source_entities = {}
+        # every entity found by NER in each source processed, url -> list of entities, these are
+        # never pruned so they can be stored as complete NER results
+        self.found_entities = {}
+        # the number of entities kept in source_entities, and the number at which they are pruned
+        self._kept_entities = 0
+        self._prune_at = 4 * capacity
+        # corpus of the source texts already fetched, see find_entities
+        self.corpus = None
+        self.broker = broker
         self.file_handler = file_handler_object
         self.entity_processor = entity_processor_object
 
-    def get_text_process_entities(self, source):
-        """Gets the body text from each source using its URL.
+    def __getstate__(self):
+        # the workers only need the entity processor, not the results collected so far
+        state = self.__dict__.copy()
+        state["entities"] = None
+        state["source_entities"] = {}
+        state["found_entities"] = {}
+        state["broker"] = None
+        return state
+
+    def get_text_process_entities(self, source, text=None):
+        """Gets the body text from each source using its URL, and finds the entities in it.
 
         Uses requests and BeautifulSoup to retrieve and parse the webpage's HTML into a readable
         format for entity recognition.
 
-        This method updates the 'self.sources' dictionary.
-
         Args:
-            source: the individual source from the dictionary of sources.
+            source: the individual source from the list of sources.
+            text: Optional text of the source, if it has already been fetched.
 
         Returns:
-            A list of key-value pairs (tuples).
-            Note: key-value pairs are required for the map function to construct a dictionary from.
+            A list of the entities found in the source (each entity appears once).
         """
+        if text is not None:
+            return self.process_text_entities(text)
         # define entities variable
         entities = []
         # define the url
         url = source["url"]
-        # set headers to try to avoid 403 errors
-        headers = {
-            'User-Agent':
-                'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
-                'Chrome/112.0.0.0 Safari/537.36'}
-        # request the webpage - if timeout, move on to next source
+        # request the webpage (the session sends browser headers to try to avoid 403 errors)
+        # if timeout, or the host keeps failing, move on to next source
         try:
-            response = requests.get(url, headers, timeout=5)
+            response = get_scheduler().get(url, max_timeout=5)
         except (requests.exceptions.ReadTimeout, requests.exceptions.ConnectionError):
             return entities
         try:
@@ -67,7 +89,10 @@ class PopularInformationFinder:
         except KeyError:
             content_type = ''
         if "application/javascript" in content_type or response.status_code != 200:
+            import selenium.common.exceptions
+            from seleniumwire import webdriver
             # using selenium to avoid 'JavaScript is not available.' error
+            get_metrics().inc(SELENIUM_FALLBACKS, stage="popular_information")
             options = webdriver.ChromeOptions()
             options.headless = True
             options.add_argument("start-maximized")
@@ -104,6 +129,8 @@ class PopularInformationFinder:
             if request.response.status_code != 200:
                 driver.quit()
                 return entities
+            # the browser got the page, so don't skip it next time
+            get_scheduler().clear_failure(url)
         else:
             html = response.text
         # get the content type
@@ -132,15 +159,121 @@ class PopularInformationFinder:
         chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
         # drop blank lines
         text = '\n'.join(chunk for chunk in chunks if chunk)
+        return self.process_text_entities(text)
+
+    def process_text_entities(self, text):
+        """Finds the entities in the text of a source.
+
+        Args:
+            text: the source text, with a line break between each chunk of text.
+
+        Returns:
+            A list of the entities found in the text (each entity appears once).
+        """
         # split into list
         textlist = text.split('\n')
+        if len(text) > 100000:
+            return []
+        # run the text through the entity processor, counting each entity once for this source
+        return [entity for entity, _ in self.entity_processor.get_entities_and_count(textlist, {})]
 
-        if len(text) <= 100000:
-            # run the text through the entity processor. stores entities in namesake variable
-            entities = self.entity_processor.get_entities_and_count(textlist, self.entities)
-        return entities
+    def _process_task(self, task):
+        """Finds the entities in a source, for the worker pool.
+
+        Args:
+            task: tuple of the source URL and the handle of its text in the corpus (None if the
+                text must be fetched).
+
+        Returns:
+            tuple of the source URL and the list of entities found in the source.
+        """
+        url, handle = task
+        text = None if handle is None else self.corpus.get(handle)
+        return url, self.get_text_process_entities({"url": url}, text)
+
+    def _find_entities_locally(self, tasks):
+        """Finds the entities in sources with a local pool of NER workers.
+
+        Args:
+            tasks: list of tuples of the source URL and the handle of its text in the corpus (None
+                if the text must be fetched).
+        """
+        if not tasks:
+            # e.g. every source's entities are stored, so the NER model is never loaded
+            return
+        workers = pool_size(NER_WORKER_MEMORY)
+        with ner_pool("Popular entities (NER)", workers) as pool:
+            # an even chunksize for the imap function, one chunk per worker
+            chunksize = max(math.ceil(len(tasks) / workers), 1)
+            for url, entities in tqdm(pool.imap_unordered(self._process_task, tasks, chunksize),
+                                      total=len(tasks), desc="Finding popular entities"):
+                self._add_source_entities(url, entities, found=True)
 
-    def find_entities(self, sources):
+    def _find_entities_remotely(self, tasks):
+        """Finds the entities in sources with the work queue's workers.
+
+        Remote workers can't read the corpus, so the texts already fetched are sent with the tasks.
+
+        Args:
+            tasks: list of tuples of the source URL and the handle of its text in the corpus (None
+                if the text must be fetched).
+        """
+        payloads = [{"url": url} if handle is None else
+                    {"url": url, "text": self.corpus.get(handle)} for url, handle in tasks]
+        for payload, result in run_job(self.broker, "entities", payloads,
+                                       "Finding popular entities"):
+            # sources that failed on every worker have no entities
+            self._add_source_entities(payload["url"], result["entities"] if result else [],
+                                      found=True)
+
+    def _add_source_entities(self, url, entities, found=False):
+        """Records the entities found in a source, and counts them towards their popularity.
+
+        Args:
+            url: the source URL.
+            entities: the entities found in the source (each entity appears once).
+            found: whether NER has just been run on the source, rather than its entities being
+                known already. These are kept in found_entities in full.
+        """
+        if found:
+            self.found_entities[url] = entities
+        self.entities.update(entities)
+        self.source_entities[url] = entities
+        self._kept_entities += len(entities)
+        if self._kept_entities > self._prune_at:
+            self._prune_source_entities()
+
+    def _prune_source_entities(self):
+        """Keeps only the entities of each source that are still tracked by the popularity counter.
+
+        Entities no longer tracked are too rare to be popular. Pruning happens whenever the number
+        of entities kept has doubled, so the entities kept stay proportional to the entities that
+        can be popular rather than to every entity found.
+        """
+        tracked = self.entities.counters
+        self._kept_entities = 0
+        for url, entities in self.source_entities.items():
+            if any(entity not in tracked for entity in entities):
+                entities = self.source_entities[url] = [entity for entity in entities
+                                                        if entity in tracked]
+            self._kept_entities += len(entities)
+        self._prune_at = max(self._prune_at, 2 * self._kept_entities)
+
+    def popular_entities(self):
+        """Gets the most popular entities amongst the sources processed so far.
+
+        Keeps the top 10% of the entities found, and no more than 30 entities.
+
+        Returns:
+            A list of the most popular entities, most popular first.
+        """
+        distinct = self.entities.distinct()
+        # more entities than the capacity means the 10% cut-off is above the maximum anyway
+        cut_off_index = self.max_popular if distinct is None else \
+            int(min(distinct * self.popular_share, self.max_popular))
+        return [entity for entity, _ in self.entities.top(cut_off_index)]
+
+    def find_entities(self, sources, corpus=None, page_handles=None, known_entities=None):
         """Finds entities in the given text.
 
         Uses the same model for entity recognition in specific_entity_processor.
@@ -150,31 +283,30 @@ class PopularInformationFinder:
         Most slowdowns here have been due to Russia's wikipedia page.
 
         Args:
-            sources: list of dictionaries of sources with corresponding URL.
+            sources: list of sources with corresponding URL.
+            corpus: Optional PageCorpus holding the texts of sources already fetched.
+            page_handles: Optional dictionary of url -> handle of the text in the corpus, for
+                sources that need no fetching.
+            known_entities: Optional dictionary of url -> entities, for sources that need no
+                entity recognition (e.g. stored from a previous run).
 
         Returns:
             A list of the most popular words amongst all the sources.
         """
-        with Pool() as pool:
-            # sources = tqdm(sources)  # add a progress bar
-            # calculate an even chunksize for the imap function using pool size (max processes)
-            chunksize = len(sources) / len(pool._pool)
-            if int(chunksize) < chunksize:
-                chunksize = int(chunksize) + 1
+        # the workers are sent each text's handle, and read the text from the corpus
+        self.corpus = corpus
+        page_handles = page_handles or {}
+        known_entities = known_entities or {}
+        tasks = []
+        for source in sources:
+            if source["url"] in known_entities:
+                self._add_source_entities(source["url"], known_entities[source["url"]])
             else:
-                chunksize = int(chunksize)
-            tmp = tqdm(pool.imap_unordered(self.get_text_process_entities, sources, chunksize),
-                       total=len(sources), desc="Finding popular entities")
-            self.entities.update([tpl for sublist in tmp for tpl in sublist if tpl])
-
-        # sort list of dictionaries by highest no. of mentions.
-        # lambda function specifies sorted to use the values of the dictionary in desc. order
-        sorted_entities = sorted(self.entities.items(), key=lambda x: x[1], reverse=True)
-        # keep top 10% of popular entities, and no greater than 30 entities.
-        cut_off_index = len(sorted_entities) * 0.10
-        cut_off_index = int(min(cut_off_index, 30))
-        # truncate the list based on cut_off_index
-        sorted_entities = itertools.islice(sorted_entities, cut_off_index)
-        sorted_entities_words = list(word for (word, count) in sorted_entities)
-
-        return sorted_entities_words
+                tasks.append((source["url"], page_handles.get(source["url"])))
+        if self.broker is not None:
+            self._find_entities_remotely(tasks)
+        else:
+            self._find_entities_locally(tasks)
+        self._prune_source_entities()
+        # the popularity of each entity was counted as each source finished
+        return self.popular_entities()
@@ -0,0 +1,90 @@
+"""This module ranks sources using only the metadata returned by the search engine.
+
+Search results already carry a title and a snippet, so clearly irrelevant sources can be rejected
+before any of their pages are fetched.
+"""
+from auto_osint_v.inference_cache import embed
+from auto_osint_v.priority_manager import count_entities
+from auto_osint_v.query_planner import cosine_similarity
+
+
+class PreRanker:
+    """Scores search results on their title and snippet, rejecting those below a relevance floor.
+
+    The score is the number of target entities found in the title and snippet. Optionally, the
+    cosine similarity between the statement and the title and snippet is added to this score.
+    """
+
+    def __init__(self, keywords, statement="", relevance_floor=1.0, use_embeddings=False):
+        """Initialises the PreRanker object.
+
+        Args:
+            keywords: the target entities extracted from the intelligence statement.
+            statement: the intelligence statement, only used for embedding similarity.
+            relevance_floor: sources scoring below this value are never fetched.
+            use_embeddings: whether to add embedding similarity to the statement to the score.
+        """
+        self.keywords = keywords
+        self.statement = statement
+        self.relevance_floor = relevance_floor
+        self.use_embeddings = use_embeddings
+        self._statement_embedding = None
+
+    def _similarity(self, text):
+        """Cosine similarity between the statement and the given text.
+
+        Both embeddings go through the inference cache, so the model is only loaded for texts it
+        has not seen, and the statement is only embedded once.
+
+        Args:
+            text: the text to compare to the statement.
+
+        Returns:
+            Float similarity score between -1 and 1.
+        """
+        if self._statement_embedding is None:
+            self._statement_embedding = embed([self.statement])[0]
+        return cosine_similarity(self._statement_embedding, embed([text])[0])
+
+    def relevance(self, title, snippet):
+        """Scores a search result on its title and snippet.
+
+        Args:
+            title: the title of the search result.
+            snippet: the snippet (or description) of the search result.
+
+        Returns:
+            The relevance score of the search result.
+        """
+        metadata = f"{title} {snippet}"
+        score = float(count_entities(self.keywords, metadata))
+        if self.use_embeddings and self.statement:
+            score += self._similarity(metadata)
+        return score
+
+    def is_relevant(self, title, snippet):
+        """Checks whether a search result is worth fetching.
+
+        Args:
+            title: the title of the search result.
+            snippet: the snippet (or description) of the search result.
+
+        Returns:
+            True if the relevance score reaches the relevance floor.
+        """
+        return self.relevance(title, snippet) >= self.relevance_floor
+
+    def filter_sources(self, sources):
+        """Removes the sources that fall below the relevance floor.
+
+        Args:
+            sources: list of source dictionaries, with 'title' and 'description' fields.
+
+        Returns:
+            The list of sources worth fetching.
+        """
+        if self.use_embeddings and self.statement and sources:
+            # embed the uncached titles and snippets in one batch
+            embed([f"{source['title']} {source['description']}" for source in sources])
+        return [source for source in sources
+                if self.is_relevant(source["title"], source["description"])]
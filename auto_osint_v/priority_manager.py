@@ -1,77 +1,286 @@
 """This module assigns scores to each source, prioritising the most relevant sources.
 """
 import http.client
-import inspect
+import time
 from typing import List
-from multiprocessing import Pool
+from multiprocessing import TimeoutError as PoolTimeoutError
 import requests
-import selenium.common.exceptions
 from tqdm import tqdm
 from bs4 import BeautifulSoup
-from seleniumwire import webdriver
 
 
+from auto_osint_v.entity_normaliser import get_normaliser
 from auto_osint_v.popular_information_finder import PopularInformationFinder
+from auto_osint_v.host_scheduler import get_scheduler
+from auto_osint_v.metrics import SELENIUM_FALLBACKS, SOURCES_DROPPED, get_metrics
+from auto_osint_v.page_corpus import PageCorpus
+from auto_osint_v.scoring_engine import ScoringEngine
+from auto_osint_v.source_record import SourceRecord, to_records
+from auto_osint_v.work_queue import run_job
+from auto_osint_v.worker_pool import fetch_pool
 
 
 def count_entities(entities, source_text):
     """Counts the number of entities appearing in a given source.
 
+    Entities are matched in any of their forms, see EntityNormaliser.
+
+    Args:
+        entities: the entities to look for.
+        source_text: the source text to look for entities within.
+
+    Returns:
+        Integer number of distinct entities appearing in the source
+    """
+    return len(get_normaliser().count(entities, source_text))
+
+
+def entity_counts(entities, source_text):
+    """Counts the appearances of each entity in a given source.
+
+    Entities are matched in any of their forms, see EntityNormaliser.
+
     Args:
         entities: the entities to look for.
         source_text: the source text to look for entities within.
 
     Returns:
-        Integer number of appearances of all entities in the source
+        Dictionary of entity -> number of appearances, for the entities that appear in the source
     """
-    entity_count = 0
-    for entity in entities:
-        # built-in method find() returns the index of a given substring within
-        # a string, returns -1 if not found
-        if source_text.find(entity) != -1:
-            entity_count += 1
-    return entity_count
+    return get_normaliser().count(entities, source_text)
+
+
+def count_words(entities, source_text):
+    """Counts the appearances of each entity in a given source, and the words of the source.
+
+    Args:
+        entities: the entities to look for.
+        source_text: the source text to look for entities within.
+
+    Returns:
+        tuple of the entity counts (see entity_counts) and the number of words in the source, the
+        length BM25 normalises by
+    """
+    normaliser = get_normaliser()
+    words = normaliser.tokens(source_text)
+    return normaliser.count_words(entities, words), len(words)
+
+
+def extract_text(html):
+    """Gets the readable text of a webpage.
+
+    Args:
+        html: the HTML of the webpage.
+
+    Returns:
+        The text of the webpage, without scripts and styles, with one chunk of text per line.
+    """
+    # parse using the lxml html parser
+    soup = BeautifulSoup(html, "lxml")
+    # kill all script and style elements
+    for script in soup(["script", "style"]):
+        script.extract()  # rip it out
+    # get text
+    text = soup.get_text()
+    # break into lines and remove leading and trailing space on each
+    lines = (line.strip() for line in text.splitlines())
+    # break multi-headlines into a line each
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    # drop blank lines
+    return '\n'.join(chunk for chunk in chunks if chunk)
+
+
+def prior_score(entities, source):
+    """Cheap relevance prior for a source, using only the metadata from the search result.
+
+    No network I/O is needed, so this can be used to decide which sources to fetch first.
+
+    Args:
+        entities: the entities to look for.
+        source: the individual source record (or dictionary) of information.
+
+    Returns:
+        Integer number of entities appearing in the source's title and description.
+    """
+    metadata = " ".join(str(source.get(field, "")) for field in ("title", "description"))
+    return count_entities(entities, metadata)
 
 
 class PriorityManager:
     """Provides methods for assigning source scores based on relevancy to the user's statement.
     """
 
-    def __init__(self, fh_object, entity_processor_object, potential_corroboration: List[dict]):
+    def __init__(self, fh_object, entity_processor_object,
+                 potential_corroboration: List[SourceRecord], page_texts=None,
+                 source_entities=None, weighting="count", weights=None, broker=None,
+                 checkpointer=None):
         """Initialises the PriorityManager object.
 
         Args:
             fh_object: file handler object to use for extracting info from data files.
             entity_processor_object: object to use for processing entities
-            potential_corroboration: list of dictionaries of source information.
+            potential_corroboration: list of source records (dictionaries are converted).
+            page_texts: Optional dictionary of url -> text, for sources that need no fetching
+                (e.g. stored from a previous run).
+            source_entities: Optional dictionary of url -> entities found by NER, for sources that
+                need no entity recognition (e.g. stored from a previous run).
+            weighting: how entity counts are weighted, see ScoringEngine.
+            weights: Optional dictionary of weights for the 'target' and 'popular' scores.
+            broker: Optional work queue broker. If given, sources are fetched and processed by
+                workers pulling tasks from it (see work_queue) rather than by a local pool.
+            checkpointer: Optional Checkpointer object, the page texts and the entities found by
+                NER are checkpointed in it once they have all been gathered.
         """
-        self._target_entity_multiplier = 10  # multiplier for mentions of target info
-        self._popular_entity_multiplier = 5  # multiplier for mentions of popular info
+        # multipliers for mentions of target info and popular info
+        self.weights = {"target": 10, "popular": 5}
+        self.weights.update(weights or {})
+        # entities counted by the workers in the current pass
         self._entities = []
+        self._target_entities = []
+        self._popular_entities = []
+        # matrix of the entities counted in each source, scores are computed from it
+        self.engine = ScoringEngine(weighting)
         self.file_handler = fh_object
         self.entity_processor = entity_processor_object
-        self.sources = potential_corroboration
+        self.sources = to_records(potential_corroboration)
+        # entities counted in each source: url -> {entity: count}, see RunStore
+        self.entity_counts = {}
+        # text of each source fetched, stored once and shared with the workers by handle
+        self.corpus = PageCorpus()
+        # handle of each source's text in the corpus, url -> (offset, length)
+        self.page_handles = {url: self.corpus.add(text)
+                             for url, text in (page_texts or {}).items()}
+        # urls of the sources fetched in this run
+        self._new_urls = []
+        # entities found by NER in each source, url -> list of entities
+        self.source_entities = dict(source_entities or {})
+        # entities found by NER in this run
+        self.new_source_entities = {}
+        self.broker = broker
+        self.checkpointer = checkpointer
+
+    def __getstate__(self):
+        # the workers only need the entities, not the sources or any results
+        state = self.__dict__.copy()
+        for attribute in ("sources", "entity_counts", "page_handles", "_new_urls",
+                          "source_entities", "new_source_entities", "_target_entities",
+                          "_popular_entities"):
+            state[attribute] = type(state[attribute])()
+        state["engine"] = None
+        state["broker"] = None
+        state["checkpointer"] = None
+        return state
+
+    @property
+    def page_texts(self):
+        """Dictionary of url -> text, for every source fetched.
+
+        Failed fetches give no text, and are left out so that they are fetched again by later
+        runs rather than stored as empty pages.
+        """
+        return {url: self.corpus.get(handle) for url, handle in self.page_handles.items()
+                if handle[1]}
+
+    @property
+    def new_page_texts(self):
+        """Dictionary of url -> text, for the sources fetched in this run, see page_texts."""
+        return {url: self.corpus.get(self.page_handles[url]) for url in self._new_urls
+                if self.page_handles[url][1]}
+
+    def close(self):
+        """Deletes the page corpus, once the page texts are no longer needed."""
+        self.corpus.close()
 
     def manager(self):
         """This method controls the order of execution for counting target and popular info.
 
         Returns:
-            self.sources: list of dictionaries of source information
+            self.sources: list of source records
         """
         self.target_info_scorer()  # generates a score for each source
+        if self.checkpointer is not None:
+            self.checkpointer.save("page_texts", self.page_texts)
         # remove sources with 0 score (or could remove bottom x% of sources)
         self.remove_sources()
         # clear entities list
-        self._entities.clear()
+        self._entities = []
         # generate a popular info score for each source
         self.popular_info_scorer()
         # sort sources by score in descending order
         self.sort_sources_desc()
-        # return scored sources list(dict)
+        # return scored sources list(SourceRecord)
+        return self.sources
+
+    def anytime_manager(self, top_k=10, time_budget=None, fetch_budget=None):
+        """Ranks the sources within a fixed time and fetch budget.
+
+        Sources are ordered by a cheap prior (target entities in the title and description), then
+        fetched and scored in that order. Scoring stops once the top-k has not changed for top_k
+        consecutive sources, or once either budget is used up. Sources that were never fetched are
+        dropped, so the results are partial but correctly ordered.
+
+        Popular info scoring needs the text of every source, so it is not run in this mode.
+
+        Args:
+            top_k: the number of top sources that must be stable before stopping.
+            time_budget: optional wall-clock budget in seconds.
+            fetch_budget: optional maximum number of sources to fetch.
+
+        Returns:
+            self.sources: list of source records
+        """
+        deadline = None if time_budget is None else time.monotonic() + time_budget
+        # Gather saved target entities
+        self._entities = self._target_entities = self.file_handler.get_keywords_from_target_info()
+        sources_by_url = {source.url: source for source in self.sources}
+        # sources that have already been fetched are scored straight away
+        scored = [self._record(*self.count_stored_text(source.url), sources_by_url)
+                  for source in self.sources if source.url in self.page_handles]
+        self.rescore(scored)
+        # fetch the most promising sources first
+        queue = sorted((source for source in self.sources if source.url not in self.page_handles),
+                       key=lambda x: prior_score(self._entities, x), reverse=True)
+        if fetch_budget is not None:
+            queue = queue[:fetch_budget]
+        # the workers only need each source's url
+        queue = [source.url for source in queue]
+        top_urls = []
+        stable_for = 0
+        with fetch_pool("Scoring sources in priority order") as pool:
+            # chunksize of 1 keeps the workers fetching in priority order
+            results = pool.imap_unordered(self.get_text_count_entities, queue)
+            with tqdm(total=len(queue), desc="Assigning scores to sources in priority order") \
+                    as progress:
+                for _ in range(len(queue)):
+                    timeout = None
+                    if deadline is not None:
+                        timeout = deadline - time.monotonic()
+                        if timeout <= 0:
+                            break
+                    try:
+                        scored.append(self._record(*results.next(timeout), sources_by_url))
+                    except PoolTimeoutError:
+                        break
+                    progress.update()
+                    # idf weights change with every source, so every score is recomputed
+                    self.rescore(scored)
+                    scored.sort(key=lambda x: x.score, reverse=True)
+                    new_top_urls = [source.url for source in scored[:top_k]]
+                    if len(scored) > top_k and new_top_urls == top_urls:
+                        stable_for += 1
+                    else:
+                        stable_for = 0
+                    top_urls = new_top_urls
+                    if stable_for >= top_k:
+                        break
+        # leaving the 'with' block terminates any fetches still in progress
+        self.sources = scored
+        self.remove_sources()
+        self.sort_sources_desc()
         return self.sources
 
     def get_sources(self):
-        """Method for getting the list of source dictionaries."""
+        """Method for getting the list of source records."""
         return self.sources
 
     @staticmethod
@@ -89,14 +298,10 @@ class PriorityManager:
         """
         # initialise the webpage text variable
         text = ""
-        # set headers to try to avoid 403 errors
-        headers = {
-            'User-Agent':
-                'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
-                'Chrome/112.0.0.0 Safari/537.36'}
-        # request the webpage - if timeout, move on to next source
+        # request the webpage (the session sends browser headers to try to avoid 403 errors)
+        # if timeout, or the host keeps failing, move on to next source
         try:
-            response = requests.get(url, headers, timeout=5)
+            response = get_scheduler().get(url, max_timeout=5)
         except (requests.exceptions.ReadTimeout, requests.exceptions.ConnectionError):
             return text
         try:
@@ -104,7 +309,10 @@ class PriorityManager:
         except KeyError:
             content_type = ''
         if "application/javascript" in content_type or response.status_code != 200:
+            import selenium.common.exceptions
+            from seleniumwire import webdriver
             # using selenium to avoid 'JavaScript is not available." error
+            get_metrics().inc(SELENIUM_FALLBACKS, stage="scoring")
             options = webdriver.ChromeOptions()
             options.headless = True
             options.add_argument("start-maximized")
@@ -141,6 +349,8 @@ class PriorityManager:
             if request.response.status_code in {400, 401, 403, 404, 429}:
                 driver.quit()
                 return text
+            # the browser got the page, so don't skip it next time
+            get_scheduler().clear_failure(url)
         else:
             html = response.text
         # get the content type
@@ -151,131 +361,174 @@ class PriorityManager:
             if content_type == "text/xml" or content_type == "application/xml":
                 # don't parse xml
                 return text
-            else:
-                # parse using the lxml html parser
-                soup = BeautifulSoup(html, "lxml")
         except KeyError:
-            # except on KeyError if no 'content-type' header exists
-            soup = BeautifulSoup(html, "lxml")
-
-        # kill all script and style elements
-        for script in soup(["script", "style"]):
-            script.extract()  # rip it out
-        # get text
-        text = soup.get_text()
-        # break into lines and remove leading and trailing space on each
-        lines = (line.strip() for line in text.splitlines())
-        # break multi-headlines into a line each
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        # drop blank lines
-        text = '\n'.join(chunk for chunk in chunks if chunk)
-        # return string text formatted and with line breaks
-        return text
+            # no 'content-type' header exists, parse it as html
+            pass
+        return extract_text(html)
 
     def target_info_scorer(self):
         """Assigns scores based on the amount of target entities identified.
 
-        Updates the 'self.sources' list of dicts
+        Updates the 'self.sources' list of source records
         """
         # Gather saved target entities
-        self._entities = self.file_handler.get_keywords_from_target_info()
+        self._entities = self._target_entities = self.file_handler.get_keywords_from_target_info()
 
         # Count number of appearances in each source
-        # for source in tqdm(self.sources, desc="Counting target entity appearances in "
-        #                                      "sources"):
-        with Pool() as pool:
-            self.sources = list(tqdm(pool.imap_unordered(self.get_text_get_score_target_inf,
-                                                         self.sources), total=len(self.sources),
-                                     desc="Assigning scores to sources based on target info"))
-        # Updated 'self.sources' list of dictionaries
+        self._score_sources("Assigning scores to sources based on target info")
+        # Updated 'self.sources' list of source records
 
     def popular_info_scorer(self):
         """Assigns scores to each source based on the amount of popular entities identified.
 
-        Updates the 'self.sources' list of dicts.
+        Updates the 'self.sources' list of source records.
         """
         # initialise popular info finder object
-        popular_info_object = PopularInformationFinder(self.file_handler, self.entity_processor)
-        # Gather popular entities
-        entities = popular_info_object.find_entities(self.sources)
-        self._entities = entities
+        popular_info_object = PopularInformationFinder(self.file_handler, self.entity_processor,
+                                                       self.broker)
+        # Gather popular entities, reusing any texts and entities we already have
+        entities = popular_info_object.find_entities(self.sources, self.corpus, self.page_handles,
+                                                     self.source_entities)
+        # the finder only keeps the entities that can be popular, store every entity NER found
+        for url, source_entities in popular_info_object.found_entities.items():
+            if url not in self.source_entities:
+                self.new_source_entities[url] = source_entities
+                self.source_entities[url] = source_entities
+        if self.checkpointer is not None:
+            self.checkpointer.save("source_entities", self.source_entities)
+        self._entities = self._popular_entities = entities
         # Count number of appearances in each source
         # new approach using multiprocessing map function
-        with Pool() as pool:
-            self.sources = list(tqdm(pool.imap_unordered(self.get_text_get_score_pop_inf,
-                                                         self.sources), total=len(self.sources),
-                                     desc="Assigning scores to sources based on popular info"))
-        # Updated 'self.sources' list of dictionaries
+        self._score_sources("Assigning scores to sources based on popular info")
+        # Updated 'self.sources' list of source records
 
-    def get_text_get_score_target_inf(self, source):
-        """Gets the text from the source URL and assigns a score.
+    def _score_sources(self, desc):
+        """Scores every source, only fetching the sources that have not already been fetched.
 
         Args:
-            source: the individual source dictionary of information
+            desc: the description for the progress bar and the profiling report.
+        """
+        results = [self.count_stored_text(source.url) for source in self.sources
+                   if source.url in self.page_handles]
+        # the workers only need each source's url, and return the handle of its text
+        to_fetch = [source.url for source in self.sources if source.url not in self.page_handles]
+        if self.broker is not None:
+            results += self._score_remotely(to_fetch, desc)
+        else:
+            with fetch_pool(desc) as pool:
+                results += tqdm(pool.imap_unordered(self.get_text_count_entities, to_fetch),
+                                total=len(to_fetch), desc=desc)
+        sources_by_url = {source.url: source for source in self.sources}
+        self.sources = [self._record(*result, sources_by_url) for result in results]
+        self.rescore()
+
+    def _score_remotely(self, urls, desc):
+        """Fetches sources and counts their entities with the work queue's workers.
+
+        Args:
+            urls: the URLs of the sources to fetch.
+            desc: the description for the progress bar.
 
         Returns:
-            the updated source dictionary with a new 'score' field.
+            list of results, see count_text
         """
-        # get the text from the source
-        text = self.get_text_from_site(source["url"])
-        # return score for target info
-        score = int(count_entities(self._entities, text) * self._target_entity_multiplier)
-        # adds score to the source dictionary
-        try:
-            source["score"] += score
-        except KeyError:
-            source["score"] = score
-        return source
+        results = []
+        payloads = [{"url": url, "entities": self._entities} for url in urls]
+        for payload, result in run_job(self.broker, "count", payloads, desc):
+            # sources that failed on every worker are scored as if they have no text
+            result = result or {"text": "", "counts": {}, "length": 0}
+            results.append((payload["url"], result["counts"], self.corpus.add(result["text"]),
+                            result["length"]))
+        return results
+
+    def _record(self, url, counts, handle, length, sources_by_url=None):
+        """Records the entities counted in a source, and its text.
+
+        Args:
+            url: the source URL.
+            counts: the entities counted in the source.
+            handle: the handle of the source's text in the corpus.
+            length: the number of words in the source's text.
+            sources_by_url: Optional dictionary of url -> source record.
+
+        Returns:
+            the source record
+        """
+        if sources_by_url is None:
+            sources_by_url = {source.url: source for source in self.sources}
+        self.engine.add(url, counts, length)
+        self.entity_counts.setdefault(url, {}).update(counts)
+        if url not in self.page_handles:
+            self.page_handles[url] = handle
+            self._new_urls.append(url)
+        return sources_by_url[url]
 
-    def get_text_get_score_pop_inf(self, source):
-        """Gets the text from the source URL and assigns a score.
+    def rescore(self, sources=None):
+        """Sets the score of each source from the entity matrix, without scanning any text.
+
+        The score is the weighted target info score plus the weighted popular info score.
+
+        Args:
+            sources: Optional list of source records to score, defaults to every source.
+        """
+        target_scores = self.engine.scores(self._target_entities, self.weights["target"])
+        popular_scores = self.engine.scores(self._popular_entities, self.weights["popular"])
+        for source in self.sources if sources is None else sources:
+            score = target_scores.get(source.url, 0.0) + popular_scores.get(source.url, 0.0)
+            # distinct entity counts give whole numbers, keep them as integers
+            source.score = int(round(score)) if self.engine.weighting == "count" \
+                else round(score, 3)
+
+    def count_text(self, url, text):
+        """Counts the entities appearing in the text of a source, and stores the text.
 
         Args:
-            source: the individual source dictionary of information
+            url: the source URL.
+            text: the text of the source.
 
         Returns:
-            the updated source dictionary with a new 'score' field.
+            the source URL, the entities counted in it, the handle of its text in the corpus and
+            the number of words in the text.
         """
-        # get the text from the source
-        text = self.get_text_from_site(source["url"])
-        # return score for target info
-        score = int(count_entities(self._entities, text) * self._target_entity_multiplier)
-        # adds score to the source dictionary
-        try:
-            source["score"] += score
-        except KeyError:
-            source["score"] = score
-        return source
+        counts, length = count_words(self._entities, text)
+        return url, counts, self.corpus.add(text), length
+
+    def count_stored_text(self, url):
+        """Counts the entities appearing in the text of a source that has already been fetched.
+
+        Args:
+            url: the source URL.
+
+        Returns:
+            see count_text
+        """
+        handle = self.page_handles[url]
+        counts, length = count_words(self._entities, self.corpus.get(handle))
+        return url, counts, handle, length
+
+    def get_text_count_entities(self, url):
+        """Gets the text from the source URL and counts the current entities in it.
 
-    def get_text_assign_score(self, source):
-        """Gets the text from the source URL and examines it to count the number of entities.
+        The entities are the target or the popular entities, whichever are being scored.
 
         Args:
-            source: the individual source dictionary of information.
+            url: the source URL
+
+        Returns:
+            see count_text
         """
         # get the text from the source
-        text = self.get_text_from_site(source["url"])
-        # assign score based on entity appearance count
-        # use different multiplier depending on which method has called 'get_text_assign_score()'
-        if inspect.stack()[1].function == "target_info_scorer()":
-            score = count_entities(self._entities, text) * self._target_entity_multiplier
-        elif inspect.stack()[1].function == "popular_info_scorer()":
-            score = count_entities(self._entities, text) * self._popular_entity_multiplier
-        else:
-            score = 10
-        # adds score to the source dictionary
-        try:
-            source["score"] += score
-        except KeyError:
-            source["score"] = score
-        return source
+        text = self.get_text_from_site(url)
+        return self.count_text(url, text)
 
     def remove_sources(self):
         """Removes sources that have a score of 0."""
-        self.sources = [dict_ for dict_ in self.sources if dict_["score"] != 0]
+        count = len(self.sources)
+        self.sources = [source for source in self.sources if source.score != 0]
+        get_metrics().inc(SOURCES_DROPPED, count - len(self.sources), stage="zero_score")
 
     def sort_sources_desc(self):
-        """Sorts the 'self.sources' list of dicts in descending order based on score."""
-        # sort sources list of dictionaries by highest score.
-        # lambda function specifies sorted to use the values of the dictionary in desc. order
-        self.sources.sort(key=lambda x: x["score"], reverse=True)
+        """Sorts the 'self.sources' list of records in descending order based on score."""
+        # sort sources list of records by highest score.
+        # lambda function specifies sorted to use the score of each record in desc. order
+        self.sources.sort(key=lambda x: x.score, reverse=True)
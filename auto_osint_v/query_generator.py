@@ -0,0 +1,145 @@
+"""This module generates search queries from intelligence statements.
+
+Query generation is the most memory-hungry step of the tool, so generated queries are cached on
+disk by statement hash and the T5 model is only loaded when the cache misses.
+"""
+import hashlib
+import json
+import os
+
+
+class QueryGenerator:
+    """Generates search queries for one or more statements, using a cache of previous queries.
+
+    Uses the BeIR/query-gen-msmarco-t5 pre-trained models and example code available on
+    HuggingFace.co. The 'large' model is used for accuracy, falling back to the 'base' model when
+    there is not enough memory for it.
+    """
+    large_model = 'BeIR/query-gen-msmarco-t5-large-v1'
+    base_model = 'BeIR/query-gen-msmarco-t5-base-v1'
+    # rough amount of memory (bytes) needed to load and run the large model
+    large_model_memory = 4 * 1024 ** 3
+
+    def __init__(self, cache_path, num_queries=3, seed=None):
+        """Initialises the QueryGenerator object.
+
+        Args:
+            cache_path: path of the JSON file that stores previously generated queries.
+            num_queries: number of queries to generate per statement - increasing this massively
+                impacts performance.
+            seed: optional seed, so that a new statement always generates the same queries.
+        """
+        self.cache_path = cache_path
+        self.num_queries = num_queries
+        self.seed = seed
+        try:
+            with open(cache_path, "r", encoding="utf-8") as cache_file:
+                self._cache = json.load(cache_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._cache = {}
+
+    def cache_key(self, statement):
+        """Gets the cache key for a statement.
+
+        Args:
+            statement: the intelligence statement.
+
+        Returns:
+            The hex digest identifying the statement and the generation settings.
+        """
+        settings = json.dumps([statement.strip(), self.num_queries, self.seed])
+        return hashlib.sha256(settings.encode("utf-8")).hexdigest()
+
+    def _save_cache(self):
+        """Writes the query cache to disk, replacing the previous cache file."""
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as cache_file:
+            json.dump(self._cache, cache_file)
+        os.replace(tmp_path, self.cache_path)
+
+    @classmethod
+    def _enough_memory_for_large_model(cls):
+        """Checks whether the large model is likely to fit in the available memory."""
+        try:
+            import psutil
+        except ImportError:
+            # can't tell, so try the large model and fall back if it fails
+            return True
+        return psutil.virtual_memory().available >= cls.large_model_memory
+
+    @staticmethod
+    def _load_model(model_name):
+        """Loads the tokenizer and model with the given name.
+
+        They are not kept once the batch is generated, so the model's memory is free for the
+        worker pools of the later stages.
+        """
+        from transformers import T5Tokenizer, T5ForConditionalGeneration
+        return (T5Tokenizer.from_pretrained(model_name),
+                T5ForConditionalGeneration.from_pretrained(model_name))
+
+    def _generate_with_model(self, model_name, statements):
+        """Generates queries for the given statements in a single batch.
+
+        Args:
+            model_name: the name of the model to use.
+            statements: list of statements to generate queries for.
+
+        Returns:
+            A list of lists of queries, one list per statement.
+        """
+        tokenizer, model = self._load_model(model_name)
+        if self.seed is not None:
+            from transformers import set_seed
+            set_seed(self.seed)
+        inputs = tokenizer(statements, return_tensors='pt', padding=True, truncation=True)
+        outputs = model.generate(
+            input_ids=inputs["input_ids"],
+            attention_mask=inputs["attention_mask"],
+            max_length=128,  # default = 64
+            do_sample=True,
+            top_p=0.95,  # default = 0.95
+            num_return_sequences=self.num_queries)  # Returns x queries per statement
+        queries = [str(tokenizer.decode(output, skip_special_tokens=True)) for output in outputs]
+        # outputs are grouped by statement, num_queries at a time
+        return [queries[i:i + self.num_queries] for i in range(0, len(queries), self.num_queries)]
+
+    def _generate(self, statements):
+        """Generates queries, falling back to the base model when memory runs out."""
+        model_names = [self.large_model, self.base_model]
+        if not self._enough_memory_for_large_model():
+            model_names = [self.base_model]
+        for model_name in model_names:
+            try:
+                return self._generate_with_model(model_name, statements)
+            except (MemoryError, RuntimeError) as error:
+                # torch reports out of memory errors as RuntimeErrors
+                if model_name == self.base_model or (
+                        isinstance(error, RuntimeError) and "out of memory" not in str(error)):
+                    raise
+                # the large model is freed with the error, before trying the base model
+                print("Not enough memory for the large query generation model, "
+                      "falling back to the base model.")
+
+    def generate(self, statements):
+        """Gets the queries for each statement, generating them only for uncached statements.
+
+        All uncached statements are generated in one batch.
+
+        Args:
+            statements: list of intelligence statements.
+
+        Returns:
+            A list of lists of queries, one list per statement.
+        """
+        keys = [self.cache_key(statement) for statement in statements]
+        missing = {}
+        for key, statement in zip(keys, statements):
+            if key not in self._cache:
+                missing[key] = statement
+        if missing:
+            generated = self._generate(list(missing.values()))
+            for key, queries in zip(missing, generated):
+                self._cache[key] = queries
+            self._save_cache()
+        return [list(self._cache[key]) for key in keys]
@@ -0,0 +1,178 @@
+"""This module plans the searches made for a statement, removing near-duplicate queries.
+
+Generated queries often rephrase each other, and a keyword group can add little to a query that
+already names its entities. Every keyword group is searched once on Google and once on each social
+media site, so near-duplicates waste most of the search quota. The candidate queries and keyword
+groups are compared by sentence embedding (or, without sentence-transformers, by their normalised
+words), and those too similar to a search already planned are removed. The searches saved are
+spent on more of the generated queries, always picking the one least like those already planned.
+"""
+import importlib.util
+import math
+from collections import Counter
+from auto_osint_v.entity_normaliser import get_normaliser
+from auto_osint_v.inference_cache import embed
+from auto_osint_v.metrics import QUERIES_REMOVED, get_metrics
+
+# number of generated queries searched for each statement
+PLANNED_QUERIES = 3
+# number of queries generated for each statement, the planned queries are picked from these
+CANDIDATE_QUERIES = 6
+
+
+def cosine_similarity(first, second):
+    """Cosine similarity between two vectors.
+
+    Args:
+        first: a list of floats, or a dictionary of word -> count.
+        second: a vector of the same kind as first.
+
+    Returns:
+        Float similarity score, at most 1. Empty vectors are not similar to anything.
+    """
+    if isinstance(first, dict):
+        dot = sum(value * second.get(word, 0) for word, value in first.items())
+        first, second = first.values(), second.values()
+    else:
+        dot = sum(x * y for x, y in zip(first, second))
+    norm = math.sqrt(sum(x * x for x in first)) * math.sqrt(sum(y * y for y in second))
+    return min(dot / norm, 1.0) if norm else 0.0
+
+
+class QueryPlanner:
+    """Picks diverse queries and keyword groups to search, without near-duplicates.
+    """
+
+    def __init__(self, similarity_threshold=0.85, num_queries=PLANNED_QUERIES,
+                 use_embeddings=None):
+        """Initialises the QueryPlanner object.
+
+        Args:
+            similarity_threshold: queries and keyword groups more similar than this to a search
+                already planned are removed, 1 keeps everything but exact duplicates.
+            num_queries: the number of queries searched, before adding those bought with the
+                searches saved by removing keyword groups.
+            use_embeddings: whether to compare sentence embeddings rather than words, by default
+                when sentence-transformers is installed.
+        """
+        self.similarity_threshold = similarity_threshold
+        self.num_queries = num_queries
+        if use_embeddings is None:
+            use_embeddings = importlib.util.find_spec("sentence_transformers") is not None
+        self.use_embeddings = use_embeddings
+        # (kind, text) of the queries and keyword groups removed by the last plan
+        self.removed = []
+
+    def vectors(self, texts):
+        """Gets the vectors the texts are compared by.
+
+        Args:
+            texts: list of queries or keyword groups joined into one text.
+
+        Returns:
+            list of sentence embeddings, or of word counts without stopwords, one per text
+        """
+        if self.use_embeddings:
+            return embed(texts)
+        normaliser = get_normaliser()
+        return [Counter(word for word in normaliser.tokens(text)
+                        if word not in normaliser.stopwords) for text in texts]
+
+    def _pick(self, candidates, vectors, planned, count):
+        """Picks queries one at a time, each the least similar to the searches already planned.
+
+        Candidates too similar to a planned search are removed, as they only become more similar
+        to the plan as it grows. Picked and removed candidates are taken out of the given lists.
+
+        Args:
+            candidates: the queries not yet picked, in the order they were generated.
+            vectors: the vector of each candidate.
+            planned: the vectors of the searches already planned, picked vectors are added.
+            count: the number of queries to pick.
+
+        Returns:
+            list of the picked queries
+        """
+        picked = []
+        while candidates and len(picked) < count:
+            similarities = [max((cosine_similarity(vector, other) for other in planned),
+                                default=-1.0) for vector in vectors]
+            for i in reversed(range(len(candidates))):
+                if similarities[i] > self.similarity_threshold:
+                    self.removed.append(("query", candidates.pop(i)))
+                    del vectors[i], similarities[i]
+            if not candidates:
+                break
+            best = min(range(len(candidates)), key=similarities.__getitem__)
+            picked.append(candidates.pop(best))
+            planned.append(vectors.pop(best))
+        return picked
+
+    def reuse(self, candidate_queries, previous_queries):
+        """Replaces each candidate query by a previous run's query, if they are near-duplicates.
+
+        The searches of previous runs are stored, so a reused query costs no search.
+
+        Args:
+            candidate_queries: the generated queries.
+            previous_queries: the queries searched by a previous run of a similar statement.
+
+        Returns:
+            list of queries, one per candidate
+        """
+        vectors = self.vectors(list(candidate_queries) + list(previous_queries))
+        previous_vectors = vectors[len(candidate_queries):]
+        queries = []
+        for query, vector in zip(candidate_queries, vectors):
+            similarities = [cosine_similarity(vector, other) for other in previous_vectors]
+            best = max(range(len(similarities)), key=similarities.__getitem__)
+            queries.append(previous_queries[best]
+                           if similarities[best] > self.similarity_threshold else query)
+        return queries
+
+    def plan(self, candidate_queries, keyword_groups, previous_queries=None):
+        """Plans the searches for a statement.
+
+        The most diverse num_queries of the candidate queries are planned first. Keyword groups
+        too similar to a planned query (or an earlier group) are then removed, and for each one
+        removed another candidate query is planned: an extra query costs one Google search, as the
+        queries are searched together on the social media sites, while a keyword group costs a
+        search on Google and on every social media site.
+
+        Args:
+            candidate_queries: the generated queries, in the order they were generated.
+            keyword_groups: the groups of keywords searched together.
+            previous_queries: Optional queries of a previous run of a similar statement, used in
+                place of the candidates they are near-duplicates of, see reuse.
+
+        Returns:
+            tuple of the list of queries and the list of keyword groups to search
+        """
+        if previous_queries:
+            candidate_queries = self.reuse(candidate_queries, previous_queries)
+        self.removed = []
+        candidates = []
+        for query in candidate_queries:
+            if query in candidates:
+                self.removed.append(("query", query))
+            else:
+                candidates.append(query)
+        vectors = self.vectors(candidates + [" ".join(group) for group in keyword_groups])
+        query_vectors, group_vectors = vectors[:len(candidates)], vectors[len(candidates):]
+        planned = []
+        queries = self._pick(candidates, query_vectors, planned, self.num_queries)
+        groups = []
+        for group, vector in zip(keyword_groups, group_vectors):
+            if any(cosine_similarity(vector, other) > self.similarity_threshold
+                   for other in planned):
+                self.removed.append(("keyword_group", " ".join(group)))
+            else:
+                groups.append(group)
+                planned.append(vector)
+        # spend the searches saved on more queries
+        queries += self._pick(candidates, query_vectors, planned,
+                              len(keyword_groups) - len(groups))
+        metrics = get_metrics()
+        for kind, _ in self.removed:
+            metrics.inc(QUERIES_REMOVED, kind=kind)
+        return queries, groups
@@ -0,0 +1,459 @@
+"""This module stores the results of every run in a local SQLite database.
+
+Each run overwrites the tool's CSV data files, so the run store keeps the history: the statement,
+the sources found, the entities counted in each source, the scores and the headline sentiment.
+Writes are batched, one transaction per stage.
+
+The store also keeps what is needed to re-validate an edited statement incrementally: the queries
+and keyword groups of each run, the results of every search, and the text and NER entities of
+every source.
+"""
+import difflib
+import hashlib
+import json
+import re
+import sqlite3
+import time
+import zlib
+
+from auto_osint_v.source_record import SourceRecord
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS statements (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    statement_id INTEGER NOT NULL REFERENCES statements(id),
+    started REAL NOT NULL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    title TEXT,
+    description TEXT,
+    page_type TEXT,
+    time_published TEXT
+);
+CREATE TABLE IF NOT EXISTS sentiment (
+    source_id INTEGER NOT NULL REFERENCES sources(id),
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    label INTEGER NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (source_id, run_id)
+);
+CREATE TABLE IF NOT EXISTS source_entities (
+    source_id INTEGER NOT NULL REFERENCES sources(id),
+    entity TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (source_id, entity)
+);
+CREATE TABLE IF NOT EXISTS scores (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    source_id INTEGER NOT NULL REFERENCES sources(id),
+    score REAL NOT NULL,
+    PRIMARY KEY (run_id, source_id)
+);
+CREATE TABLE IF NOT EXISTS source_media (
+    source_id INTEGER PRIMARY KEY REFERENCES sources(id),
+    image_links TEXT,
+    video_links TEXT,
+    embedded_content TEXT
+);
+CREATE TABLE IF NOT EXISTS page_texts (
+    source_id INTEGER PRIMARY KEY REFERENCES sources(id),
+    text BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ner_entities (
+    source_id INTEGER NOT NULL REFERENCES sources(id),
+    entity TEXT NOT NULL,
+    PRIMARY KEY (source_id, entity)
+);
+CREATE TABLE IF NOT EXISTS searches (
+    key TEXT PRIMARY KEY,
+    results TEXT NOT NULL,
+    searched REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS run_queries (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    position INTEGER NOT NULL,
+    query TEXT NOT NULL,
+    PRIMARY KEY (run_id, position)
+);
+CREATE TABLE IF NOT EXISTS run_keyword_groups (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    position INTEGER NOT NULL,
+    keywords TEXT NOT NULL,
+    PRIMARY KEY (run_id, position)
+);
+CREATE INDEX IF NOT EXISTS runs_statement ON runs(statement_id);
+CREATE INDEX IF NOT EXISTS source_entities_entity ON source_entities(entity);
+CREATE INDEX IF NOT EXISTS scores_source ON scores(source_id);
+"""
+
+
+class RunStore:
+    """Provides methods for recording runs and reusing the per-source data of previous runs.
+    """
+
+    def __init__(self, db_path):
+        """Opens (or creates) the run store database.
+
+        Args:
+            db_path: path of the SQLite database file.
+        """
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        """Closes the database connection."""
+        self.connection.close()
+
+    @staticmethod
+    def statement_hash(statement):
+        """Gets the hash used to identify a statement."""
+        return hashlib.sha256(statement.strip().encode("utf-8")).hexdigest()
+
+    def start_run(self, statement):
+        """Records the start of a run.
+
+        Args:
+            statement: the intelligence statement being validated.
+
+        Returns:
+            the id of the new run
+        """
+        with self.connection:
+            self.connection.execute("INSERT OR IGNORE INTO statements (hash, text) VALUES (?, ?)",
+                                    (self.statement_hash(statement), statement))
+            statement_id = self.connection.execute(
+                "SELECT id FROM statements WHERE hash = ?",
+                (self.statement_hash(statement),)).fetchone()[0]
+            cursor = self.connection.execute(
+                "INSERT INTO runs (statement_id, started) VALUES (?, ?)",
+                (statement_id, time.time()))
+        return cursor.lastrowid
+
+    def finish_run(self, run_id):
+        """Records the end of a run."""
+        with self.connection:
+            self.connection.execute("UPDATE runs SET finished = ? WHERE id = ?",
+                                    (time.time(), run_id))
+
+    def _source_ids(self, urls):
+        """Gets the ids of the given (already stored) source URLs, as a dictionary."""
+        source_ids = {}
+        urls = list(urls)
+        # stay below SQLite's limit on the number of parameters
+        for i in range(0, len(urls), 500):
+            chunk = urls[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            source_ids.update(self.connection.execute(
+                f"SELECT url, id FROM sources WHERE url IN ({placeholders})", chunk))
+        return source_ids
+
+    def record_sources(self, run_id, sources):
+        """Stores the sources found in a run, along with their headline sentiment.
+
+        Args:
+            run_id: the id of the run.
+            sources: list of SourceRecord objects.
+        """
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO sources (url, title, description, page_type, time_published) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT(url) DO UPDATE SET title = excluded.title, "
+                "description = excluded.description, page_type = excluded.page_type, "
+                "time_published = excluded.time_published",
+                [(source.url, source.title, source.description, source.page_type,
+                  source.time_published) for source in sources])
+            source_ids = self._source_ids(source.url for source in sources)
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO sentiment (source_id, run_id, label, score) "
+                "VALUES (?, ?, ?, ?)",
+                [(source_ids[source.url], run_id, source.sentiment_label, source.sentiment_score)
+                 for source in sources])
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO source_media "
+                "(source_id, image_links, video_links, embedded_content) VALUES (?, ?, ?, ?)",
+                [(source_ids[source.url], json.dumps(source.image_links),
+                  json.dumps(source.video_links), json.dumps(source.embedded_content))
+                 for source in sources])
+
+    def record_entity_counts(self, entity_counts):
+        """Stores the entities counted in each source, replacing any previous counts.
+
+        Args:
+            entity_counts: dictionary of source URL -> dictionary of entity -> count.
+        """
+        with self.connection:
+            source_ids = self._source_ids(entity_counts)
+            for url, counts in entity_counts.items():
+                if url not in source_ids:
+                    continue
+                self.connection.execute("DELETE FROM source_entities WHERE source_id = ?",
+                                        (source_ids[url],))
+                self.connection.executemany(
+                    "INSERT INTO source_entities (source_id, entity, count) VALUES (?, ?, ?)",
+                    [(source_ids[url], entity, count) for entity, count in counts.items()])
+
+    def record_scores(self, run_id, sources):
+        """Stores the final score of each source in a run.
+
+        Args:
+            run_id: the id of the run.
+            sources: list of scored SourceRecord objects.
+        """
+        with self.connection:
+            source_ids = self._source_ids(source.url for source in sources)
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO scores (run_id, source_id, score) VALUES (?, ?, ?)",
+                [(run_id, source_ids[source.url], source.score) for source in sources
+                 if source.url in source_ids])
+
+    def get_entity_counts(self, urls):
+        """Gets the entity counts stored for the given sources.
+
+        Args:
+            urls: the source URLs to look up.
+
+        Returns:
+            dictionary of source URL -> dictionary of entity -> count, for sources with counts.
+        """
+        entity_counts = {}
+        source_ids = self._source_ids(urls)
+        urls_by_id = {source_id: url for url, source_id in source_ids.items()}
+        ids = list(urls_by_id)
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for source_id, entity, count in self.connection.execute(
+                    "SELECT source_id, entity, count FROM source_entities "
+                    f"WHERE source_id IN ({placeholders})", chunk):
+                entity_counts.setdefault(urls_by_id[source_id], {})[entity] = count
+        return entity_counts
+
+    def corroboration_history(self, url):
+        """Gets every score a source has been given, across all runs.
+
+        Args:
+            url: the source URL.
+
+        Returns:
+            list of (run id, statement, score) tuples, most recent run first.
+        """
+        return self.connection.execute(
+            "SELECT runs.id, statements.text, scores.score FROM scores "
+            "JOIN sources ON sources.id = scores.source_id "
+            "JOIN runs ON runs.id = scores.run_id "
+            "JOIN statements ON statements.id = runs.statement_id "
+            "WHERE sources.url = ? ORDER BY runs.id DESC", (url,)).fetchall()
+
+    def sources_mentioning(self, entity):
+        """Gets the sources in which an entity has been counted, across all runs.
+
+        Args:
+            entity: the entity text.
+
+        Returns:
+            list of (url, count) tuples, highest count first.
+        """
+        return self.connection.execute(
+            "SELECT sources.url, source_entities.count FROM source_entities "
+            "JOIN sources ON sources.id = source_entities.source_id "
+            "WHERE source_entities.entity = ? ORDER BY source_entities.count DESC",
+            (entity,)).fetchall()
+
+    def previous_run(self, before_run_id, statement, min_similarity=0.6):
+        """Gets the id of the last finished run of the same, or an edited, statement.
+
+        Statements are compared word by word, so an edited statement still matches the runs of
+        the original, but an unrelated statement doesn't match anything.
+
+        Args:
+            before_run_id: the id of the current run.
+            statement: the statement of the current run.
+            min_similarity: how similar (0 to 1) a statement must be to match.
+
+        Returns:
+            the id of the last finished run of the most similar statement, or None if no
+            statement is similar enough
+        """
+        words = re.findall(r"\w+", statement.casefold())
+        best = (min_similarity, None)
+        for run_id, text in self.connection.execute(
+                "SELECT MAX(runs.id), statements.text FROM runs "
+                "JOIN statements ON statements.id = runs.statement_id "
+                "WHERE runs.id < ? AND runs.finished IS NOT NULL GROUP BY statements.id",
+                (before_run_id,)):
+            matcher = difflib.SequenceMatcher(None, words, re.findall(r"\w+", text.casefold()),
+                                              autojunk=False)
+            # the quick upper bound skips most unrelated statements
+            if matcher.real_quick_ratio() >= best[0]:
+                # equally similar statements are broken by the most recent run
+                best = max(best, (matcher.ratio(), run_id),
+                           key=lambda match: (match[0], match[1] or 0))
+        return best[1]
+
+    def record_queries(self, run_id, queries, keyword_groups):
+        """Stores the generated queries and the keyword groups searched in a run.
+
+        Args:
+            run_id: the id of the run.
+            queries: list of generated queries.
+            keyword_groups: list of lists of keywords, searched together.
+        """
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO run_queries (run_id, position, query) VALUES (?, ?, ?)",
+                [(run_id, position, query) for position, query in enumerate(queries)])
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO run_keyword_groups (run_id, position, keywords) "
+                "VALUES (?, ?, ?)",
+                [(run_id, position, json.dumps(group))
+                 for position, group in enumerate(keyword_groups)])
+
+    def get_queries(self, run_id):
+        """Gets the generated queries and the keyword groups of a run.
+
+        Args:
+            run_id: the id of the run.
+
+        Returns:
+            (list of queries, list of keyword groups)
+        """
+        queries = [row[0] for row in self.connection.execute(
+            "SELECT query FROM run_queries WHERE run_id = ? ORDER BY position", (run_id,))]
+        keyword_groups = [json.loads(row[0]) for row in self.connection.execute(
+            "SELECT keywords FROM run_keyword_groups WHERE run_id = ? ORDER BY position",
+            (run_id,))]
+        return queries, keyword_groups
+
+    @staticmethod
+    def search_key(search_term, **kwargs):
+        """Gets the key identifying a search, from its search term and parameters."""
+        return json.dumps([search_term, kwargs], sort_keys=True)
+
+    def get_search(self, search_term, **kwargs):
+        """Gets the stored results of a search.
+
+        Returns:
+            the list of search results, or None if the search has not been stored
+        """
+        row = self.connection.execute("SELECT results FROM searches WHERE key = ?",
+                                      (self.search_key(search_term, **kwargs),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def record_search(self, results, search_term, **kwargs):
+        """Stores the results of a search.
+
+        Args:
+            results: the list of search results.
+            search_term: the search term.
+            kwargs: the search parameters.
+        """
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO searches (key, results, searched) VALUES (?, ?, ?)",
+                (self.search_key(search_term, **kwargs), json.dumps(results), time.time()))
+
+    def get_source(self, url):
+        """Gets a stored source, with its media and most recent headline sentiment.
+
+        Args:
+            url: the source URL.
+
+        Returns:
+            the SourceRecord, or None if the source has not been stored
+        """
+        row = self.connection.execute(
+            "SELECT sources.url, title, description, page_type, time_published, image_links, "
+            "video_links, embedded_content, label, score FROM sources "
+            "JOIN source_media ON source_media.source_id = sources.id "
+            "JOIN sentiment ON sentiment.source_id = sources.id "
+            "WHERE sources.url = ? ORDER BY sentiment.run_id DESC LIMIT 1", (url,)).fetchone()
+        if row is None:
+            return None
+        return SourceRecord(*row[:5], *(json.loads(media) for media in row[5:8]), *row[8:])
+
+    def record_page_texts(self, page_texts):
+        """Stores the (compressed) text of each source.
+
+        Empty texts are failed fetches, they are not stored so the sources are fetched again.
+
+        Args:
+            page_texts: dictionary of source URL -> page text.
+        """
+        with self.connection:
+            source_ids = self._source_ids(page_texts)
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO page_texts (source_id, text) VALUES (?, ?)",
+                [(source_ids[url], zlib.compress(text.encode("utf-8")))
+                 for url, text in page_texts.items() if text and url in source_ids])
+
+    def get_page_texts(self, urls):
+        """Gets the stored text of the given sources.
+
+        Args:
+            urls: the source URLs to look up.
+
+        Returns:
+            dictionary of source URL -> page text, for sources with stored text (empty texts of
+            failed fetches are left out)
+        """
+        source_ids = self._source_ids(urls)
+        page_texts = {}
+        for url, source_id in source_ids.items():
+            row = self.connection.execute("SELECT text FROM page_texts WHERE source_id = ?",
+                                          (source_id,)).fetchone()
+            text = None if row is None else zlib.decompress(row[0]).decode("utf-8")
+            if text:
+                page_texts[url] = text
+        return page_texts
+
+    def record_ner_entities(self, source_entities):
+        """Stores the entities found by NER in each source, replacing any previous entities.
+
+        Args:
+            source_entities: dictionary of source URL -> list of entities.
+        """
+        with self.connection:
+            source_ids = self._source_ids(source_entities)
+            for url, entities in source_entities.items():
+                if url not in source_ids:
+                    continue
+                self.connection.execute("DELETE FROM ner_entities WHERE source_id = ?",
+                                        (source_ids[url],))
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO ner_entities (source_id, entity) VALUES (?, ?)",
+                    [(source_ids[url], entity) for entity in entities])
+
+    def get_ner_entities(self, urls):
+        """Gets the entities found by NER in the given sources.
+
+        Sources that have been processed but had no entities are not distinguished from sources
+        that have not been processed, so both are left out.
+
+        Args:
+            urls: the source URLs to look up.
+
+        Returns:
+            dictionary of source URL -> list of entities
+        """
+        source_ids = self._source_ids(urls)
+        urls_by_id = {source_id: url for url, source_id in source_ids.items()}
+        source_entities = {}
+        ids = list(urls_by_id)
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for source_id, entity in self.connection.execute(
+                    f"SELECT source_id, entity FROM ner_entities WHERE source_id IN "
+                    f"({placeholders})", chunk):
+                source_entities.setdefault(urls_by_id[source_id], []).append(entity)
+        return source_entities
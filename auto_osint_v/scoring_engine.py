@@ -0,0 +1,127 @@
+"""This module scores sources from a sparse source x entity count matrix.
+
+The entities counted in each source's text are stored once, as a sparse matrix in coordinate form
+(row, column, count). Scores for any set of entities, weights or weighting scheme are then computed
+as a sparse matrix-vector product with NumPy, so re-weighting or re-ranking sources never scans
+their text again.
+"""
+import numpy as np
+
+# weighting schemes for entity counts
+WEIGHTINGS = ("count", "tfidf", "bm25")
+
+
+class ScoringEngine:
+    """Scores sources on the entities counted in them.
+
+    Weighting schemes:
+        count: the number of distinct entities found in the source (the original scoring).
+        tfidf: log(1 + count) x idf, so rare entities (e.g. a unit's name) count for more than
+            common ones (e.g. 'Russia').
+        bm25: Okapi BM25, which also saturates repeated mentions and normalises by text length.
+    """
+    # BM25 parameters: term frequency saturation and length normalisation
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, weighting="count"):
+        """Initialises the ScoringEngine object.
+
+        Args:
+            weighting: the weighting scheme, one of WEIGHTINGS.
+        """
+        if weighting not in WEIGHTINGS:
+            raise ValueError(f"Unknown weighting '{weighting}', expected one of {WEIGHTINGS}")
+        self.weighting = weighting
+        # url -> row index, entity -> column index
+        self.rows = {}
+        self.columns = {}
+        # the matrix in coordinate form, (row, column) -> count
+        self._counts = {}
+        # length of each source's text, by row
+        self._lengths = []
+        # arrays built from the above the first time they are needed
+        self._arrays = None
+
+    def _row(self, url):
+        """Gets the row of a source, adding the row if it is new."""
+        if url not in self.rows:
+            self.rows[url] = len(self.rows)
+            self._lengths.append(0)
+        return self.rows[url]
+
+    def add(self, url, counts, length=None):
+        """Adds the entities counted in a source to the matrix.
+
+        Args:
+            url: the source URL.
+            counts: dictionary of entity -> number of appearances in the source.
+            length: Optional number of words in the source's text, used by BM25, in the same
+                units as the counts. Defaults to the total of the source's counts.
+        """
+        row = self._row(url)
+        for entity, count in counts.items():
+            column = self.columns.setdefault(entity, len(self.columns))
+            self._counts[row, column] = count
+        if length is not None:
+            self._lengths[row] = length
+        self._arrays = None
+
+    def _build(self):
+        """Builds the NumPy arrays of the matrix: rows, columns, counts and row lengths."""
+        if self._arrays is None:
+            if self._counts:
+                positions = np.array(list(self._counts.keys()), dtype=np.int64)
+                rows, columns = positions[:, 0], positions[:, 1]
+            else:
+                rows = columns = np.zeros(0, dtype=np.int64)
+            counts = np.fromiter(self._counts.values(), dtype=np.float64, count=len(self._counts))
+            lengths = np.array(self._lengths, dtype=np.float64)
+            # sources with no given length use the total of their counts
+            totals = np.bincount(rows, weights=counts, minlength=len(self.rows))
+            lengths = np.where(lengths > 0, lengths, totals)
+            self._arrays = rows, columns, counts, lengths
+        return self._arrays
+
+    def _term_weights(self, rows, counts, lengths):
+        """Weights each count in the matrix according to the weighting scheme."""
+        if self.weighting == "count":
+            return (counts > 0).astype(np.float64)
+        if self.weighting == "tfidf":
+            return np.log1p(counts)
+        average_length = lengths.mean() if len(lengths) and lengths.mean() > 0 else 1.0
+        norm = self.k1 * (1 - self.b + self.b * lengths[rows] / average_length)
+        return counts * (self.k1 + 1) / (counts + norm)
+
+    def _entity_weights(self, columns, counts):
+        """Gets the weight of each entity (column): 1 for counts, or its idf."""
+        ones = np.ones(len(self.columns))
+        if self.weighting == "count":
+            return ones
+        num_sources = len(self.rows)
+        frequency = np.bincount(columns, weights=(counts > 0).astype(np.float64),
+                                minlength=len(self.columns))
+        if self.weighting == "tfidf":
+            return np.log((num_sources + 1) / (frequency + 1)) + 1
+        return np.log(1 + (num_sources - frequency + 0.5) / (frequency + 0.5))
+
+    def scores(self, entities, weight=1.0):
+        """Scores every source on the given entities.
+
+        Args:
+            entities: the entities to score on, e.g. the target entities.
+            weight: the multiplier applied to the scores.
+
+        Returns:
+            dictionary of url -> score
+        """
+        rows, columns, counts, lengths = self._build()
+        query = np.zeros(len(self.columns))
+        for entity in entities:
+            if entity in self.columns:
+                query[self.columns[entity]] = 1.0
+        query *= self._entity_weights(columns, counts)
+        # sparse matrix-vector product: sum of weighted counts x query weight, by row
+        values = self._term_weights(rows, counts, lengths) * query[columns]
+        totals = np.bincount(rows, weights=values, minlength=len(self.rows)) * weight
+        return dict(zip(self.rows, totals.tolist()))
@@ -0,0 +1,543 @@
+"""This module provides the search engines the source aggregator can search.
+
+Backends:
+    GoogleCSEBackend: the Google Custom Search Engine API (needs config.api_key and config.cse_id).
+    LocalIndexBackend: a BM25 inverted index of a local corpus, for offline use. The corpus can be
+        a directory of HTML and text files, JSON Lines files or WARC files.
+
+Every backend answers the same calls as the CSE API (q, num, siteSearch, siteSearchFilter) with
+CSE-shaped results, so the rest of the tool does not know which one it is using.
+
+Build a local index, and try it, from the command line:
+    python -m auto_osint_v.search_backend index --index corpus.sqlite collected_pages/ crawl.warc.gz
+    python -m auto_osint_v.search_backend search --index corpus.sqlite "Wagner Group Bakhmut"
+and validate statements with '--search_index corpus.sqlite'.
+"""
+import argparse
+import gzip
+import json
+import math
+import os
+import re
+import sqlite3
+import time
+import zlib
+from abc import ABCMeta, abstractmethod
+from collections import Counter
+from urllib.parse import urlsplit
+import numpy as np
+
+from auto_osint_v.entity_normaliser import EntityNormaliser
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    -- ids are never reused, so the postings of a replaced document never match its successor
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL UNIQUE,
+    host TEXT NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    page_type TEXT NOT NULL,
+    published TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    text BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    segment INTEGER NOT NULL,
+    doc_ids BLOB NOT NULL,
+    tfs BLOB NOT NULL,
+    lengths BLOB NOT NULL,
+    PRIMARY KEY (term, segment)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stats (
+    key TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+"""
+# extensions of the files indexed from a directory
+HTML_EXTENSIONS = (".html", ".htm")
+TEXT_EXTENSIONS = (".txt", ".md")
+# number of characters either side of the first query term in a snippet
+SNIPPET_CONTEXT = 100
+
+
+class SearchBackend(metaclass=ABCMeta):
+    """Interface of a search engine answering CSE-style calls.
+    """
+    name = "base"
+
+    @abstractmethod
+    def search(self, q, num=10, siteSearch=None, siteSearchFilter="i", **kwargs):
+        """Searches for the query.
+
+        Args:
+            q: the query, a string or a list of strings.
+            num: the maximum number of results.
+            siteSearch: Optional site to restrict the results to (or exclude from them).
+            siteSearchFilter: 'i' to only include results from siteSearch, 'e' to exclude them.
+            kwargs: other CSE parameters, which backends may ignore.
+
+        Returns:
+            list of CSE-shaped results, with at least 'link', 'title' and 'snippet'
+        """
+
+    def page_texts(self, urls):
+        """Gets the text of the given results, for backends that hold it.
+
+        Args:
+            urls: the result URLs.
+
+        Returns:
+            dictionary of url -> text, for the URLs whose text is held
+        """
+        return {}
+
+    def failure_reason(self, error):
+        """Gets the reason a search failed, for the search request metric.
+
+        Args:
+            error: the exception raised by search.
+
+        Returns:
+            the reason, 'error' unless the backend recognises the error
+        """
+        return "error"
+
+
+class GoogleCSEBackend(SearchBackend):
+    """Searches with the Google Custom Search Engine API.
+    """
+    name = "cse"
+
+    def search(self, q, num=10, siteSearch=None, siteSearchFilter="i", **kwargs):
+        """Searches with the Google Custom Search Engine, see SearchBackend.search."""
+        from googleapiclient.discovery import build
+        import auto_osint_v.config as config
+        if siteSearch is not None:
+            kwargs.update(siteSearch=siteSearch, siteSearchFilter=siteSearchFilter)
+        # Google custom search engine API key and engine ID
+        service = build("customsearch", "v1", developerKey=config.api_key)
+        res = service.cse().list(q=q, cx=config.cse_id, hl='en', num=num, **kwargs).execute()
+        try:
+            return res['items']
+        except KeyError:
+            # print("No results found for query:", search_term)
+            return []
+
+    def failure_reason(self, error):
+        """Recognises the errors of an exhausted daily quota or of too many queries per minute."""
+        status = getattr(getattr(error, "resp", None), "status", None)
+        if str(status) in ("403", "429") and "quota" in str(error).lower():
+            return "quota_exceeded"
+        if str(status) == "429":
+            return "rate_limited"
+        return "error"
+
+
+def html_to_text(html):
+    """Gets the title, description and readable text of an HTML page.
+
+    Args:
+        html: the HTML of the page.
+
+    Returns:
+        (title, description, text), the text has a line break between each chunk
+    """
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "lxml")
+    title = soup.title.get_text().strip() if soup.title else ""
+    description = soup.find("meta", attrs={"name": "description"})
+    description = description.get("content", "") if description else ""
+    for script in soup(["script", "style"]):
+        script.extract()
+    lines = (line.strip() for line in soup.get_text().splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return title, description, "\n".join(chunk for chunk in chunks if chunk)
+
+
+def read_warc(path):
+    """Reads the HTML pages of the response records of a WARC file (optionally gzip compressed).
+
+    Args:
+        path: path of the WARC file.
+
+    Yields:
+        (url, html) for each response record with an HTML page
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as warc_file:
+        while True:
+            line = warc_file.readline()
+            if not line:
+                return
+            if not line.startswith(b"WARC/"):
+                continue
+            headers = {}
+            for line in iter(warc_file.readline, b"\r\n"):
+                if not line:
+                    return
+                name, _, value = line.decode("utf-8", "replace").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            block = warc_file.read(int(headers.get("content-length", 0)))
+            if headers.get("warc-type") != "response" or b"\r\n\r\n" not in block:
+                continue
+            http_headers, _, body = block.partition(b"\r\n\r\n")
+            http_headers = http_headers.decode("iso-8859-1").lower()
+            if "text/html" not in http_headers:
+                continue
+            if re.search(r"content-encoding:\s*gzip", http_headers):
+                try:
+                    body = gzip.decompress(body)
+                except OSError:
+                    continue
+            yield headers.get("warc-target-uri", "").strip("<>"), body.decode("utf-8", "replace")
+
+
+def iter_documents(path):
+    """Reads the documents of a corpus.
+
+    Args:
+        path: a directory of HTML and text files, a JSON Lines file (one object per line with
+            'url', 'title', 'text' and optionally 'description', 'page_type' and 'published'),
+            or a WARC file.
+
+    Yields:
+        dictionaries with 'url', 'title', 'description', 'page_type', 'published' and 'text'
+    """
+    if os.path.isdir(path):
+        for directory, _, file_names in sorted(os.walk(path)):
+            for file_name in sorted(file_names):
+                yield from iter_documents(os.path.join(directory, file_name))
+    elif path.endswith((".jsonl", ".jsonl.gz")):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as jsonl_file:
+            for line in jsonl_file:
+                if line.strip():
+                    record = json.loads(line)
+                    yield {"url": record.get("url") or record["link"],
+                           "title": record.get("title", ""),
+                           "description": record.get("description", ""),
+                           "page_type": record.get("page_type", ""),
+                           "published": record.get("published", ""),
+                           "text": record.get("text") or record.get("content", "")}
+    elif path.endswith((".warc", ".warc.gz")):
+        for url, html in read_warc(path):
+            title, description, text = html_to_text(html)
+            yield {"url": url, "title": title, "description": description, "page_type": "",
+                   "published": "", "text": text}
+    elif path.endswith(HTML_EXTENSIONS + TEXT_EXTENSIONS):
+        with open(path, encoding="utf-8", errors="replace") as document_file:
+            content = document_file.read()
+        if path.endswith(HTML_EXTENSIONS):
+            title, description, text = html_to_text(content)
+        else:
+            title, description, text = content.strip().split("\n", 1)[0], "", content
+        yield {"url": "file://" + os.path.abspath(path), "title": title,
+               "description": description, "page_type": "", "published": "", "text": text}
+
+
+class LocalIndexBackend(SearchBackend):
+    """Searches a local corpus with an on-disk BM25 inverted index, stored in SQLite.
+
+    Documents and queries are split into words with the entity normaliser (case-folded, without
+    punctuation). Documents are indexed in segments: each segment stores one row per word, holding
+    the ids, word counts and lengths of the segment's documents containing the word as packed
+    arrays. A query reads each of its words' rows with one index range scan and scores every
+    candidate document at once with NumPy.
+
+    Re-indexed documents get a new id; the postings of their old id are skipped when searching.
+    """
+    name = "local"
+    # BM25 parameters: term frequency saturation and length normalisation
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, index_path):
+        """Opens (or creates) the index.
+
+        Args:
+            index_path: path of the SQLite index database.
+        """
+        self.index_path = index_path
+        self.normaliser = EntityNormaliser(stopwords=())
+        self._connection = None
+        self._pid = None
+
+    def __getstate__(self):
+        # each process opens its own connection
+        state = self.__dict__.copy()
+        state["_connection"] = None
+        state["_pid"] = None
+        return state
+
+    @property
+    def connection(self):
+        """The SQLite connection of the current process."""
+        if self._connection is None or self._pid != os.getpid():
+            # a connection can't be shared with a forked process, so open a new one
+            self._connection = sqlite3.connect(self.index_path, timeout=30)
+            self._connection.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._connection
+
+    def close(self):
+        """Closes the database connection of the current process."""
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+    @staticmethod
+    def site(url):
+        """Gets the site of a URL: its host without 'www.'."""
+        host = urlsplit(url).netloc.lower()
+        return host[4:] if host.startswith("www.") else host
+
+    def add_documents(self, documents, segment_size=5000):
+        """Adds documents to the index, replacing those already indexed with the same URL.
+
+        Args:
+            documents: iterable of dictionaries, see iter_documents.
+            segment_size: the number of documents whose postings are written together.
+
+        Returns:
+            the number of documents added
+        """
+        added = 0
+        # the postings of the current segment: word -> word number, and the word number, document
+        # id, word count and document length of each posting
+        segment = ({}, [], [], [], [])
+        with self.connection:
+            for document in documents:
+                words = self.normaliser.tokens(f"{document['title']}\n{document['text']}")
+                if not words:
+                    continue
+                row = self.connection.execute("SELECT id FROM documents WHERE url = ?",
+                                              (document["url"],)).fetchone()
+                if row is not None:
+                    self.connection.execute("DELETE FROM documents WHERE id = ?", row)
+                    self._add_stat("replaced", 1)
+                doc_id = self.connection.execute(
+                    "INSERT INTO documents (url, host, title, description, page_type, published, "
+                    "length, text) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (document["url"], self.site(document["url"]), document["title"],
+                     document["description"], document["page_type"], document["published"],
+                     len(words), zlib.compress(document["text"].encode("utf-8"), 1))).lastrowid
+                frequencies = Counter(words)
+                segment[1].extend([segment[0].setdefault(term, len(segment[0]))
+                                   for term in frequencies])
+                segment[2].extend([doc_id] * len(frequencies))
+                segment[3].extend(frequencies.values())
+                segment[4].extend([len(words)] * len(frequencies))
+                added += 1
+                if added % segment_size == 0:
+                    self._write_segment(*segment)
+                    segment = ({}, [], [], [], [])
+            self._write_segment(*segment)
+            # the document count and average length, for BM25
+            count, total = self.connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM documents").fetchone()
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO stats (key, value) VALUES (?, ?)",
+                [("documents", count), ("average_length", total / count if count else 0.0)])
+        return added
+
+    def _add_stat(self, key, value):
+        """Adds to one of the index statistics."""
+        self.connection.execute("INSERT OR IGNORE INTO stats (key, value) VALUES (?, 0)", (key,))
+        self.connection.execute("UPDATE stats SET value = value + ? WHERE key = ?", (value, key))
+
+    def _write_segment(self, terms, term_numbers, doc_ids, tfs, lengths):
+        """Writes the postings of a segment of documents, one row per word.
+
+        Args:
+            terms: dictionary of word -> word number.
+            term_numbers, doc_ids, tfs, lengths: the word number, document id, word count and
+                document length of each posting.
+        """
+        if not terms:
+            return
+        self._add_stat("segments", 1)
+        number = self._stats()["segments"]
+        # group the postings by word, keeping them in document order
+        term_numbers = np.array(term_numbers, dtype=np.int64)
+        order = np.argsort(term_numbers, kind="stable")
+        ends = np.cumsum(np.bincount(term_numbers, minlength=len(terms))).tolist()
+        doc_ids = np.array(doc_ids, dtype=np.int64)[order]
+        tfs = np.array(tfs, dtype=np.int32)[order]
+        lengths = np.array(lengths, dtype=np.int32)[order]
+        self.connection.executemany(
+            "INSERT INTO postings (term, segment, doc_ids, tfs, lengths) VALUES (?, ?, ?, ?, ?)",
+            [(term, number, doc_ids[start:end].tobytes(), tfs[start:end].tobytes(),
+              lengths[start:end].tobytes())
+             for term, start, end in zip(terms, [0] + ends[:-1], ends)])
+
+    def _stats(self):
+        """Gets the index statistics: documents, average_length, segments and replaced."""
+        stats = {"documents": 0, "average_length": 0.0, "segments": 0, "replaced": 0}
+        stats.update(self.connection.execute("SELECT key, value FROM stats"))
+        return stats
+
+    def scores(self, query):
+        """Scores every document containing a query word with BM25.
+
+        Args:
+            query: the query text.
+
+        Returns:
+            (array of document ids, array of their scores), the ids may include replaced documents
+        """
+        stats = self._stats()
+        average_length = stats["average_length"] or 1.0
+        doc_ids, scores = [], []
+        for term in set(self.normaliser.tokens(query)):
+            rows = self.connection.execute(
+                "SELECT doc_ids, tfs, lengths FROM postings WHERE term = ?", (term,)).fetchall()
+            if not rows:
+                continue
+            ids = np.concatenate([np.frombuffer(row[0], dtype=np.int64) for row in rows])
+            tfs = np.concatenate([np.frombuffer(row[1], dtype=np.int32) for row in rows])
+            lengths = np.concatenate([np.frombuffer(row[2], dtype=np.int32) for row in rows])
+            frequency = len(ids)
+            idf = math.log(1 + (stats["documents"] - frequency + 0.5) / (frequency + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * lengths / average_length)
+            doc_ids.append(ids)
+            scores.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+        if not doc_ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        # sum the scores of each document over the query words
+        unique_ids, positions = np.unique(np.concatenate(doc_ids), return_inverse=True)
+        return unique_ids, np.bincount(positions, weights=np.concatenate(scores))
+
+    @staticmethod
+    def snippet(text, query_words):
+        """Gets the part of a text around the first query word it contains."""
+        lowered = text.casefold()
+        positions = [match.start() for word in query_words
+                     for match in [re.search(r"\b" + re.escape(word) + r"\b", lowered)] if match]
+        start = max(min(positions) - SNIPPET_CONTEXT, 0) if positions else 0
+        snippet = " ".join(text[start:start + 2 * SNIPPET_CONTEXT].split())
+        return ("..." if start else "") + snippet + "..."
+
+    def search(self, q, num=10, siteSearch=None, siteSearchFilter="i", **kwargs):
+        """Searches the local index, see SearchBackend.search.
+
+        A list of queries is searched as a single query made of all their words.
+        """
+        query = " ".join(q) if isinstance(q, (list, tuple)) else q
+        doc_ids, scores = self.scores(query)
+        site = self.site("//" + siteSearch) if siteSearch else None
+        query_words = set(self.normaliser.tokens(query))
+        results = []
+        if site is None:
+            # only the top documents are needed, allowing for replaced documents being skipped
+            top = min(len(scores), num + int(self._stats()["replaced"]))
+            candidates = np.argpartition(-scores, top - 1)[:top] if top else []
+            ranked = doc_ids[sorted(candidates, key=lambda i: -scores[i])].tolist()
+        else:
+            ranked = self._on_site(doc_ids[np.argsort(-scores, kind="stable")].tolist(), site,
+                                   siteSearchFilter != "e", num)
+        for doc_id in ranked:
+            row = self.connection.execute(
+                "SELECT url, host, title, description, page_type, published, text "
+                "FROM documents WHERE id = ?", (doc_id,)).fetchone()
+            if row is None:
+                # the document has been re-indexed under a new id
+                continue
+            url, host, title, description, page_type, published, text = row
+            text = zlib.decompress(text).decode("utf-8")
+            results.append(self._result(url, host, title, description, page_type, published,
+                                        self.snippet(text, query_words)))
+            if len(results) >= num:
+                break
+        return results
+
+    def _on_site(self, doc_ids, site, include, num):
+        """Gets the first num documents on (or off) a site, checking their hosts in SQL.
+
+        The documents are checked 500 at a time, in the given order, so a site search makes a
+        query per 500 matching documents at most, and usually just one.
+
+        Args:
+            doc_ids: the ids of the documents, best first. Replaced documents are skipped.
+            site: the site, a host without 'www.'.
+            include: whether to keep the documents on the site, or those off it.
+            num: the number of documents wanted.
+
+        Returns:
+            list of the ids of the documents kept, in the given order
+        """
+        pattern = "%." + re.sub(r"([\\%_])", r"\\\1", site)
+        condition = "(host = ? OR host LIKE ? ESCAPE '\\')"
+        if not include:
+            condition = "NOT " + condition
+        kept = []
+        # stay below SQLite's limit on the number of parameters
+        for i in range(0, len(doc_ids), 500):
+            chunk = doc_ids[i:i + 500]
+            found = {row[0] for row in self.connection.execute(
+                f"SELECT id FROM documents WHERE id IN ({','.join('?' * len(chunk))}) "
+                f"AND {condition}", chunk + [site, pattern])}
+            kept += [doc_id for doc_id in chunk if doc_id in found]
+            if len(kept) >= num:
+                break
+        return kept[:num]
+
+    @staticmethod
+    def _result(url, host, title, description, page_type, published, snippet):
+        """Builds a CSE-shaped result."""
+        result = {"kind": "customsearch#result", "title": title or url, "link": url,
+                  "displayLink": host, "snippet": snippet}
+        metatags = {key: value for key, value in (("og:description", description),
+                                                  ("og:type", page_type),
+                                                  ("article:published_time", published))
+                    if value}
+        if metatags:
+            result["pagemap"] = {"metatags": [metatags]}
+        return result
+
+    def page_texts(self, urls):
+        """Gets the indexed text of the given documents, see SearchBackend.page_texts."""
+        page_texts = {}
+        urls = list(urls)
+        # stay below SQLite's limit on the number of parameters
+        for i in range(0, len(urls), 500):
+            chunk = urls[i:i + 500]
+            rows = self.connection.execute(
+                f"SELECT url, text FROM documents WHERE url IN ({','.join('?' * len(chunk))})",
+                chunk)
+            page_texts.update((url, zlib.decompress(text).decode("utf-8")) for url, text in rows)
+        return page_texts
+
+
+def parse_args(argv=None):
+    """Interprets the command line arguments of the local index tools."""
+    parser = argparse.ArgumentParser(prog="python -m auto_osint_v.search_backend")
+    commands = parser.add_subparsers(dest="command", required=True)
+    index = commands.add_parser("index", help="Add a corpus to a local search index")
+    index.add_argument("--index", required=True, help="Path of the index database")
+    index.add_argument("paths", nargs="+",
+                       help="Directories of HTML and text files, JSON Lines or WARC files")
+    search = commands.add_parser("search", help="Search a local search index")
+    search.add_argument("--index", required=True, help="Path of the index database")
+    search.add_argument("--num", type=int, default=10, help="Number of results (default: 10)")
+    search.add_argument("--site", help="Only show results from this site")
+    search.add_argument("query", help="The search query")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    backend = LocalIndexBackend(args.index)
+    if args.command == "index":
+        for corpus_path in args.paths:
+            print(f"Indexed {backend.add_documents(iter_documents(corpus_path))} documents from "
+                  f"{corpus_path}")
+    else:
+        start = time.perf_counter()
+        search_results = backend.search(args.query, num=args.num, siteSearch=args.site)
+        for search_result in search_results:
+            print(f"{search_result['title']}\n  {search_result['link']}\n  "
+                  f"{search_result['snippet']}")
+        print(f"{len(search_results)} results in {time.perf_counter() - start:.3f}s")
+    backend.close()
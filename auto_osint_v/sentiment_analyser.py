@@ -2,8 +2,7 @@
 
 This module will likely be reused/modified within source aggregation.
 """
-
-from transformers import pipeline
+from auto_osint_v.inference_cache import get_cache
 
 
 class SentimentAnalyser:
@@ -24,15 +23,34 @@ class SentimentAnalyser:
         self.statement = read_statement
         self.file_name = statement_title
         self.file_handler = file_handler_object
+        import transformers
         # Trying a variety of models. Need one with 3 labels for +ve, -ve and neutral.
         # We want intelligence statements to be neutral and not too +ve or -ve
-        self.sentiment_analysis = pipeline("sentiment-analysis",
-                                           model="Souvikcmsa/BERT_sentiment_analysis")
+        self.model_name = "Souvikcmsa/BERT_sentiment_analysis"
+        self.sentiment_analysis = transformers.pipeline("sentiment-analysis",
+                                                        model=self.model_name)
+        # results are cached by model version, see InferenceCache
+        self.model_version = getattr(self.sentiment_analysis.model.config, "_commit_hash",
+                                     None) or transformers.__version__
 
     def set_statement(self, new_statement):
         """Setter for the self.statement initial variable"""
         self.statement = new_statement
 
+    def classify(self, texts):
+        """Gets the sentiment of each text, only running the model on texts it has not seen.
+
+        Args:
+            texts: list of texts.
+
+        Returns:
+            list of [label, score] pairs, one per text
+        """
+        return get_cache().map(self.model_name, self.model_version, texts,
+                               lambda missing: [[classification["label"], classification["score"]]
+                                                for classification in
+                                                self.sentiment_analysis(missing)])
+
     def statement_analyser(self):
         """This method analyses the overall sentiment of the intelligence statement.
 
@@ -42,7 +60,7 @@ class SentimentAnalyser:
         Returns:
             Nothing - outputs to file
         """
-        classification = self.sentiment_analysis(self.statement)
+        classification_label, classification_score = self.classify([self.statement])[0]
         # print(classification)
         # create a sentiment threshold for the intel statement
         # If the threshold is exceeded add extra information to warn user that their statement is
@@ -53,8 +71,6 @@ class SentimentAnalyser:
 
         # Thought to offer better readability to user
         evidence_type = "sentiment-analysis-of-" + self.file_name
-        classification_label = classification[0]["label"]
-        classification_score = classification[0]["score"]
         if classification_label != 'neutral' and classification_score > threshold:
             # write analysis info and a warning as extra info
             warning = ("Warning: analysis of your statement indicates it is likely biased or "
@@ -75,8 +91,6 @@ class SentimentAnalyser:
             the sentiment label (positive, negative, neutral) and the confidence score.
         """
         headline = headline.strip()
-        classification = self.sentiment_analysis(headline)
-        # get the label and score
-        classification_label = classification[0]["label"]
-        classification_score = classification[0]["score"]
+        # get the label and score, duplicate headlines are only analysed once
+        classification_label, classification_score = self.classify([headline])[0]
         return classification_label, classification_score
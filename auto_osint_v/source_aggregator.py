@@ -6,9 +6,13 @@ This includes using search engines (Google) and searching social media websites
 from tqdm import tqdm
 import requests
 from bs4 import BeautifulSoup
-from transformers import T5Tokenizer, T5ForConditionalGeneration
-from googleapiclient.discovery import build
-import auto_osint_v.config as config
+from auto_osint_v.host_scheduler import get_scheduler
+from auto_osint_v.metrics import SEARCH_REQUESTS, SEARCHES_REUSED, SOURCES_DROPPED, get_metrics
+from auto_osint_v.query_generator import QueryGenerator
+from auto_osint_v.query_planner import CANDIDATE_QUERIES, QueryPlanner
+from auto_osint_v.run_store import RunStore
+from auto_osint_v.search_backend import GoogleCSEBackend
+from auto_osint_v.source_record import SourceRecord, sentiment_label_code
 
 
 class SourceAggregator:
@@ -21,13 +25,24 @@ class SourceAggregator:
     """
 
     # Initialise object
-    def __init__(self, intel_statement, file_handler_object, sentiment_analyser_object):
+    def __init__(self, intel_statement, file_handler_object, sentiment_analyser_object,
+                 pre_ranker=None, run_store=None, incremental=False, checkpointer=None,
+                 search_backend=None, query_planner=None):
         """
         Initialises the SourceAggregator object.
 
         Args:
             intel_statement: The original intel statement
             file_handler_object: The FileHandler object passed from __main__.py
+            pre_ranker: Optional PreRanker object, results it rejects are never fetched.
+            run_store: Optional RunStore object, every search is recorded in it.
+            incremental: whether to reuse the searches and sources stored in the run store.
+            checkpointer: Optional Checkpointer object, the results of every search are
+                checkpointed in it and reused from it.
+            search_backend: Optional SearchBackend to search, defaults to the Google Custom Search
+                Engine.
+            query_planner: Optional QueryPlanner removing near-duplicate queries and keyword
+                groups, defaults to the QueryPlanner's default similarity threshold.
         """
         self.intel_statement = intel_statement
         self.sentiment_analyser = sentiment_analyser_object
@@ -35,69 +50,125 @@ class SourceAggregator:
         self.queries = []
         # Keywords here because they are used throughout the class
         self.keywords = self.file_handler.get_keywords_from_target_info()
-        # create the list of dictionaries
+        # create the list of source records
         self.results_list_dict = []
         # list to store unique urls
         self.urls_present = []
+        self.pre_ranker = pre_ranker
+        self.run_store = run_store
+        self.incremental = incremental
+        self.checkpointer = checkpointer
+        self.search_backend = search_backend or GoogleCSEBackend()
+        self.query_planner = query_planner or QueryPlanner()
+        # results of the searches made (or resumed) in this run, keyed by RunStore.search_key
+        self.searches = checkpointer.load("searches", {}) if checkpointer is not None else {}
+        # groups of keywords searched together, see plan_keyword_groups
+        self.keyword_groups = []
+        self.plan_keyword_groups()
 
     # For searching, I think the key information needs to be extracted from the intel statement
     # Don't want to search using just the intel statement itself.
     # Statement keyword or key info generator (generating search query)
-    def search_query_generator(self):
+    def search_query_generator(self, seed=None, previous_queries=None):
         """Generates a search queries based on the given statement.
 
         This is a resource (particularly memory) intensive process. Limit usage.
-        Uses the BeIR/query-gen-msmarco-t5-large-v1 pre-trained model and example code available on
-        HuggingFace.co
-        Currently uses the 'large' model for accuracy. This can be downgraded to 'base' for reduced
-        accuracy but better performance.
+        Queries are cached by statement, so re-running the same statement reuses its queries.
+        See QueryGenerator for the models used. More queries are generated than searched: the
+        QueryPlanner picks the most diverse, and removes keyword groups that a query already covers.
+
+        Args:
+            seed: Optional seed, so that new statements always generate the same queries.
+            previous_queries: Optional queries of a previous run of a similar statement. They
+                replace the generated queries they are near-duplicates of, so their stored
+                searches are reused.
 
         Returns:
             List of queries
         """
-        # Query generation based on the context of the intelligence statement
-        tokenizer = T5Tokenizer.from_pretrained('BeIR/query-gen-msmarco-t5-large-v1')
-        model = T5ForConditionalGeneration.from_pretrained('BeIR/query-gen-msmarco-t5-large-v1')
-        # WARNING: If you are getting out of memory errors the model will need to be changed from
-        # 'large' to 'base'.
-        # Potential future fix to this problem - wrap in a try-except to auto switch to base model.
-        # If it is borderline try to change the max_length and num_return_sequences parameters
-        # below.
-
-        input_ids = tokenizer.encode(self.intel_statement, return_tensors='pt')
-        # number of queries to generate - increase in this massively impact performance
-        num_queries = 3
-        outputs = model.generate(
-            input_ids=input_ids,
-            max_length=128,  # default = 64
-            do_sample=True,
-            top_p=0.95,  # default = 0.95
-            num_return_sequences=num_queries)  # Returns x queries, default = 3
-
-        for output in outputs:
-            query = tokenizer.decode(output, skip_special_tokens=True)
-            self.queries.append(str(query))
-
-    # the searcher method to search using a custom programmable search engine
-    @staticmethod
-    def searcher(search_term, **kwargs):
-        """Using the Google Custom Search Engine to search for results to the search_term.
+        query_generator = QueryGenerator(self.file_handler.data_file_path + "query_cache.json",
+                                         num_queries=CANDIDATE_QUERIES, seed=seed)
+        candidates = self.queries + query_generator.generate([self.intel_statement])[0]
+        self.queries, self.keyword_groups = self.query_planner.plan(
+            candidates, self.keyword_groups, previous_queries)
+        return self.queries
+
+    # the searcher method to search using the search backend (by default a custom programmable
+    # search engine)
+    def searcher(self, search_term, **kwargs):
+        """Using the search backend to search for results to the search_term.
 
         Args:
             search_term: The keyword/query to search for. This can be a string or a list of strings.
-            kwargs: Extra arguments to pass to service.cse().list
+            kwargs: Extra CSE arguments, e.g. num, siteSearch and siteSearchFilter.
 
         Returns:
             the results or nothing if none are found.
         """
-        # Google custom search engine API key and engine ID
-        service = build("customsearch", "v1", developerKey=config.api_key)
-        res = service.cse().list(q=search_term, cx=config.cse_id, hl='en', **kwargs).execute()
+        backend = self.search_backend
         try:
-            return res['items']
-        except KeyError:
-            # print("No results found for query:", search_term)
-            return []
+            results = backend.search(search_term, **kwargs)
+        except Exception as error:
+            get_metrics().inc(SEARCH_REQUESTS, backend=backend.name,
+                              outcome=backend.failure_reason(error))
+            raise
+        get_metrics().inc(SEARCH_REQUESTS, backend=backend.name, outcome="ok")
+        return results
+
+    def search(self, search_term, **kwargs):
+        """Searches for the search_term, reusing stored results in incremental mode.
+
+        Searches already made by a resumed run are never made again.
+
+        Args:
+            search_term: The keyword/query to search for. This can be a string or a list of strings.
+            kwargs: Extra arguments to pass to service.cse().list
+
+        Returns:
+            the results or nothing if none are found.
+        """
+        key = RunStore.search_key(search_term, **kwargs)
+        if key in self.searches:
+            get_metrics().inc(SEARCHES_REUSED, source="cached")
+            return self.searches[key]
+        results = None
+        if self.run_store is not None and self.incremental:
+            results = self.run_store.get_search(search_term, **kwargs)
+            if results is not None:
+                get_metrics().inc(SEARCHES_REUSED, source="run_store")
+        if results is None:
+            results = self.searcher(search_term, **kwargs)
+            if self.run_store is not None:
+                self.run_store.record_search(results, search_term, **kwargs)
+        self.searches[key] = results
+        if self.checkpointer is not None:
+            # the searches are small, so they are all checkpointed after each one
+            self.checkpointer.save("searches", self.searches)
+        return results
+
+    def plan_keyword_groups(self, previous_groups=None, length_of_split=7):
+        """Splits the keywords into the groups that are searched together.
+
+        Groups from a previous run are kept if all their keywords are still present, so that the
+        same searches are made (and can be reused) when the statement has only been edited.
+
+        Args:
+            previous_groups: Optional list of the keyword groups searched in a previous run.
+            length_of_split: the maximum number of keywords in a group.
+
+        Returns:
+            the list of keyword groups
+        """
+        remaining = list(self.keywords)
+        self.keyword_groups = []
+        for group in previous_groups or []:
+            if group and all(keyword in remaining for keyword in group):
+                self.keyword_groups.append(group)
+                remaining = [keyword for keyword in remaining if keyword not in group]
+        # search for the remaining keywords, only 7 at a time
+        self.keyword_groups += [remaining[i:i + length_of_split]
+                                for i in range(0, len(remaining), length_of_split)]
+        return self.keyword_groups
 
     # Google Search
     def google_search(self):
@@ -112,17 +183,14 @@ class SourceAggregator:
         query_results = []
         for query in self.queries:
             # searches google using the generated queries
-            query_results += self.searcher(query, num=3)
+            query_results += self.search(query, num=3)
         for result in tqdm(query_results, desc="Search Google using generated queries"):
             # write link to dict
             self.process_result(result)
         # search for the keywords, only 7 at a time
         keyword_results = []
-        length_of_split = 7
-        split_keywords = [self.keywords[i:i + length_of_split]
-                          for i in range(0, len(self.keywords), length_of_split)]
-        for keywords in split_keywords:
-            keyword_results += self.searcher(keywords, num=10//len(split_keywords))
+        for keywords in self.keyword_groups:
+            keyword_results += self.search(keywords, num=10//len(self.keyword_groups))
         # loop through results
         for result in tqdm(keyword_results, desc="Search Google using extracted keywords"):
             # write link to dict
@@ -156,26 +224,23 @@ class SourceAggregator:
         for site in tqdm(social_media_sites, desc="Searching Social Media Sites"):
             # this for loop is clearly inefficient, I don't know how to improve it
             # I'm unsure of this behaviour as the siteSearch parameter doesn't seem to work
-            query_results = self.searcher(self.queries, siteSearch=site, siteSearchFilter='i',
-                                          num=5)
+            query_results = self.search(self.queries, siteSearch=site, siteSearchFilter='i',
+                                        num=5)
             # loop through results
             for result in query_results:
                 # write link to dict
                 self.process_result(result)
             # search for the keywords, only 7 at a time
             keyword_results = []
-            length_of_split = 7
-            split_keywords = [self.keywords[i:i + length_of_split]
-                              for i in range(0, len(self.keywords), length_of_split)]
-            for keywords in split_keywords:
-                keyword_results += self.searcher(keywords, siteSearch=site,
-                                                 siteSearchFilter='i', num=5)
+            for keywords in self.keyword_groups:
+                keyword_results += self.search(keywords, siteSearch=site,
+                                               siteSearchFilter='i', num=5)
             for result in keyword_results:
                 # get process the result
                 self.process_result(result)
 
     def process_result(self, result):
-        """Takes the result from the search, extracts information and saves it all in a dictionary.
+        """Takes the result from the search, extracts information and saves it all in a record.
 
         This is the main processing step.
         Sentiment analysis is done to filter bias and inflammatory sources.
@@ -188,9 +253,14 @@ class SourceAggregator:
             result: Result type from Google Search API
 
         Returns:
-            nothing, stores info in instance dictionary variable
+            nothing, stores a SourceRecord in the instance results list
         """
         link = result['link']
+        # discard any duplicates before doing any work on them
+        if link in self.urls_present:
+            get_metrics().inc(SOURCES_DROPPED, stage="duplicate")
+            return
+        self.urls_present.append(link)
         try:
             title = result['pagemap']['metatags'][0]['og:title']
         except KeyError:
@@ -207,32 +277,38 @@ class SourceAggregator:
             publish_time = result['pagemap']['metatags'][0]['article:published_time']
         except KeyError:
             publish_time = ""
+        # reject clearly irrelevant results using the title and snippet, before fetching anything
+        if self.pre_ranker is not None and not self.pre_ranker.is_relevant(title, desc):
+            get_metrics().inc(SOURCES_DROPPED, stage="pre_ranker")
+            return
+        if self.run_store is not None and self.incremental:
+            # reuse the media and headline sentiment of sources found in previous runs
+            stored_source = self.run_store.get_source(link)
+            if stored_source is not None:
+                self.results_list_dict.append(stored_source)
+                return
         try:
             iframes, images, videos = self.media_finder(link)
-        except (requests.exceptions.SSLError, requests.exceptions.Timeout):
+        except requests.exceptions.RequestException:
+            # e.g. SSL errors, timeouts, or results from a local corpus that can't be fetched
             iframes, images, videos = "NaN", "NaN", "NaN"
         # sentiment analysis check - will discard headlines that appear inflammatory or bias
         # keep threshold relatively high (>0.8), see process_result() documentation.
         max_sentiment_threshold = 0.9
         label, score = self.sentiment_analyser.headline_analyser(title)
-        # discard any duplicates
-        if link not in self.urls_present:
-            self.urls_present.append(link)
-            # Very poor scores will lead to the source being discarded
-            if not (label != "neutral" and score > max_sentiment_threshold):
-                self.results_list_dict.append({"url": link, "title": title, "description": desc,
-                                               "page_type": page_type,
-                                               "time_published": publish_time,
-                                               "image_links": images, "video_links": videos,
-                                               "embedded_content": iframes,
-                                               "title_sentiment":
-                                                   f"{label} sentiment, score={score}"})
+        # Very poor scores will lead to the source being discarded
+        if not (label != "neutral" and score > max_sentiment_threshold):
+            self.results_list_dict.append(SourceRecord(link, title, desc, page_type, publish_time,
+                                                        images, videos, iframes,
+                                                        sentiment_label_code(label), score))
+        else:
+            get_metrics().inc(SOURCES_DROPPED, stage="sentiment")
 
     def find_sources(self):
         """Runs the various search operations.
 
         Returns:
-            results in the form of a list of dictionaries
+            results in the form of a list of SourceRecord objects
         """
         # in both methods reduce number of queries
         self.google_search()
@@ -304,7 +380,8 @@ class SourceAggregator:
             The info we want: website title, description, images & videos
         """
         # retrieve html from URL
-        response = requests.get(url, timeout=10)  # timeout 10 seconds
+        # timeout of at most 10 seconds, shorter for hosts known to respond quickly
+        response = get_scheduler().get(url, max_timeout=10)
         # get the content type
         try:
             content_type = response.headers['Content-Type']
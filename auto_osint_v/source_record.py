@@ -0,0 +1,166 @@
+"""This module defines the record used to store each potentially corroborating source.
+
+Sources flow through every stage of the tool (aggregation, scoring in worker processes and output),
+so the record is kept compact: it uses __slots__, stores the headline sentiment as numbers and
+pickles as a plain tuple.
+"""
+
+# sentiment labels given by the sentiment analysis model, stored by their index
+SENTIMENT_LABELS = ("negative", "neutral", "positive")
+
+
+def sentiment_label_code(label):
+    """Gets the number used to store a sentiment label.
+
+    Args:
+        label: the sentiment label, e.g. 'neutral'.
+
+    Returns:
+        The index of the label in SENTIMENT_LABELS, or -1 if the label is unknown.
+    """
+    try:
+        return SENTIMENT_LABELS.index(label)
+    except ValueError:
+        return -1
+
+
+class SourceRecord:
+    """A single potentially corroborating source.
+
+    Fields can be read and written as attributes or, like the dictionaries previously used for
+    sources, by key (e.g. source["url"]). The 'title_sentiment' key gives the headline sentiment in
+    its readable form, e.g. 'neutral sentiment, score=0.86'.
+    """
+    __slots__ = ("url", "title", "description", "page_type", "time_published", "image_links",
+                 "video_links", "embedded_content", "sentiment_label", "sentiment_score", "score")
+    # fields written to the potential corroboration file, in order
+    csv_fields = ("url", "title", "description", "page_type", "time_published", "image_links",
+                  "video_links", "embedded_content", "title_sentiment", "score")
+
+    def __init__(self, url, title="", description="", page_type="", time_published="",
+                 image_links=None, video_links=None, embedded_content=None, sentiment_label=-1,
+                 sentiment_score=0.0, score=0):
+        """Initialises the SourceRecord object.
+
+        Args:
+            url: the URL of the source.
+            title: the title of the source.
+            description: the description (or search snippet) of the source.
+            page_type: the page type given in the source's metadata.
+            time_published: the publication time given in the source's metadata.
+            image_links: the images found on the source's page.
+            video_links: the videos found on the source's page.
+            embedded_content: the embedded content (iframes) found on the source's page.
+            sentiment_label: the headline sentiment label, as an index into SENTIMENT_LABELS.
+            sentiment_score: the confidence score of the headline sentiment label.
+            score: the priority score of the source.
+        """
+        self.url = url
+        self.title = title
+        self.description = description
+        self.page_type = page_type
+        self.time_published = time_published
+        self.image_links = image_links if image_links is not None else []
+        self.video_links = video_links if video_links is not None else []
+        self.embedded_content = embedded_content if embedded_content is not None else []
+        self.sentiment_label = sentiment_label
+        self.sentiment_score = sentiment_score
+        self.score = score
+
+    def __reduce__(self):
+        # pickle as a tuple of values, much smaller than a pickled dictionary
+        return SourceRecord, self.as_tuple()
+
+    def __repr__(self):
+        return f"SourceRecord(url={self.url!r}, score={self.score!r})"
+
+    def __eq__(self, other):
+        if not isinstance(other, SourceRecord):
+            return NotImplemented
+        return self.as_tuple() == other.as_tuple()
+
+    __hash__ = None
+
+    @property
+    def title_sentiment(self):
+        """The headline sentiment in its readable form."""
+        if 0 <= self.sentiment_label < len(SENTIMENT_LABELS):
+            label = SENTIMENT_LABELS[self.sentiment_label]
+        else:
+            label = "unknown"
+        return f"{label} sentiment, score={self.sentiment_score}"
+
+    def __getitem__(self, key):
+        if key == "title_sentiment" or key in self.__slots__:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        """Gets the value of a field, or the default if there is no such field."""
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        """The field names, in the same order as the potential corroboration file."""
+        return self.csv_fields
+
+    def as_tuple(self):
+        """All field values, in the order of __slots__."""
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def as_row(self):
+        """All field values, in the order of csv_fields."""
+        return [self[field] for field in self.csv_fields]
+
+    @classmethod
+    def from_dict(cls, source):
+        """Creates a record from a source dictionary, e.g. a row of the corroboration file.
+
+        Args:
+            source: dictionary of source information. The headline sentiment can be given in its
+                readable form ('title_sentiment') or as numbers.
+
+        Returns:
+            The SourceRecord object.
+        """
+        label = source.get("sentiment_label", -1)
+        sentiment_score = source.get("sentiment_score", 0.0)
+        title_sentiment = source.get("title_sentiment")
+        if isinstance(title_sentiment, str) and " sentiment, score=" in title_sentiment:
+            label_name, sentiment_score = title_sentiment.split(" sentiment, score=", 1)
+            label = sentiment_label_code(label_name)
+        try:
+            score = float(source.get("score", 0))
+        except (TypeError, ValueError):
+            # missing scores
+            score = 0.0
+        if score != score:
+            # NaN scores (e.g. from pandas)
+            score = 0.0
+        if score.is_integer():
+            # entity count scores stay integers, tfidf and bm25 scores keep their fraction
+            score = int(score)
+        return cls(source["url"], source.get("title", ""), source.get("description", ""),
+                   source.get("page_type", ""), source.get("time_published", ""),
+                   source.get("image_links"), source.get("video_links"),
+                   source.get("embedded_content"), int(label), float(sentiment_score), score)
+
+
+def to_records(sources):
+    """Converts a list of sources to SourceRecord objects, leaving existing records as they are.
+
+    Args:
+        sources: list of source dictionaries and/or SourceRecord objects.
+
+    Returns:
+        List of SourceRecord objects.
+    """
+    return [source if isinstance(source, SourceRecord) else SourceRecord.from_dict(source)
+            for source in sources]
@@ -4,21 +4,75 @@ These entities are extracted from the intelligence statement and
 stored in appropriate stores.
 Subprocesses to this module attempt to interrogate some of this information.
 """
+import json
 import os
-import spacy
-from spacy.tokens import DocBin
+from auto_osint_v.entity_normaliser import get_normaliser
+from auto_osint_v.inference_cache import get_cache
 
-# Load the best model trained using Google Colab
-try:
-    NER = spacy.load(os.getcwd() + "/NER_training_testing/train/model/model-best-from-colab")
-except OSError:
+# path of the best model trained using Google Colab
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "NER_training_testing",
+                          "train", "model", "model-best-from-colab")
+# the NER model, loaded the first time it is needed (see get_ner)
+_NER = None
+
+
+def get_ner():
+    """Gets the NER model, loading it the first time this is called.
+
+    Loading the model takes several seconds, so it is not loaded when this module is imported.
+
+    Returns:
+        the spaCy NER pipeline
+    """
+    global _NER
+    if _NER is None:
+        import spacy
+        _NER = spacy.load(MODEL_PATH)
+        _NER.add_pipe('sentencizer')
+    return _NER
+
+
+def ner_version():
+    """Gets the version of the NER model, from its metadata, without loading the model."""
     try:
-        os.chdir("../auto_osint_v/")
-        NER = spacy.load("NER_training_testing/train/model/model-best-from-colab")
-    except FileNotFoundError:
-        os.chdir(os.getcwd() + "/auto_osint_v/")
-        NER = spacy.load("NER_training_testing/train/model/model-best-from-colab")
-NER.add_pipe('sentencizer')
+        with open(os.path.join(MODEL_PATH, "meta.json"), encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+    except (OSError, ValueError):
+        return ""
+    return f"{meta.get('name', '')}-{meta.get('version', '')}"
+
+
+def ner_entities(texts):
+    """Finds the entities in each text, only running the NER model on texts it has not seen.
+
+    Args:
+        texts: list of texts.
+
+    Returns:
+        list of [entity text, label] pairs for each text
+    """
+    return get_cache().map("auto_osint_v/model-best-from-colab", ner_version(), texts,
+                           lambda missing: [[[ent.text, ent.label_] for ent in doc.ents]
+                                            for doc in get_ner().pipe(missing)])
+
+
+def ner_document_entities(texts):
+    """Finds the entities in a document split into texts, e.g. the lines of a page.
+
+    The result is cached once for the whole document rather than once per text, so a page takes
+    one entry of the inference cache.
+
+    Args:
+        texts: list of the texts of the document.
+
+    Returns:
+        list of [entity text, label] pairs, for every text in turn
+    """
+    def infer(documents):
+        return [[[ent.text, ent.label_] for doc in get_ner().pipe(json.loads(document))
+                 for ent in doc.ents] for document in documents]
+    return get_cache().map("auto_osint_v/model-best-from-colab", ner_version(),
+                           [json.dumps(texts)], infer)[0]
 
 
 class EntityProcessor:
@@ -34,44 +88,33 @@ class EntityProcessor:
          file_handler_object: the file handler to be used for file IO operations
         """
         self.file_handler = file_handler_object
-        self.irrelevant_words = ["it", "them", "they", "the", "he", "she", "his", "her", "we", "i",
-                                 "us", "me", "my", "here", "our"]
+        # matches the different forms of an entity, and knows the words with no meaning
+        self.normaliser = get_normaliser()
 
     def store_words_from_label(self, read_statement):
-        """This function stores recognised words in csv files
+        """This function stores recognised words in the file handler's target entity store
 
-        These files are associated with the label given to
-        the word.
+        The store indexes each word by the label given to it, and is written to a single
+        snapshot file.
 
         Args:
             read_statement: the intelligence statement read into current python instance
 
         Returns
-            Nothing - stores info in files
+            Nothing - stores info in self.file_handler.target_entities
         """
-        # Clean any leftover files from previous runs
-        self.file_handler.clean_directory("data_files/target_info_files")
-        text1 = NER(read_statement)
+        # Clean any leftover entities from previous runs
+        target_entities = self.file_handler.target_entities
+        target_entities.clear()
+        text1 = ner_entities([read_statement])[0]
 
-        # changes added to eliminate duplicates and count number of mentions
-        # define list of words present
-        words_present = {}
-
-        for word in text1.ents:
+        for text, label in text1:
             # prints the entity and its label. e.g., "MARS LOC"
-            # print(word.text, "LABEL: ", word.label_)
-            # append the word to the list of words
-            key = word.text
-            # see python EAFP
-            try:
-                words_present[key][1] += 1
-            except KeyError:
-                words_present[key] = [word.label_, 1]
-
-        for text, [label, mentions] in words_present.items():
-            # Opens the relevant (based on word label) csv file and store the word text
-            # and number of mentions.
-            self.file_handler.open_label_file(label, text, mentions=mentions)
+            # print(text, "LABEL: ", label)
+            # the store eliminates duplicates and counts the number of mentions
+            target_entities.add(label, text)
+
+        self.file_handler.write_target_info_snapshot()
 
     def get_entities_and_count(self, text_list, entity_dict):
         """Finds the entities from the given text. If they appear multiple times, increment value.
@@ -98,7 +141,7 @@ class EntityProcessor:
         return list(entity_dict.items())
 
     def add_entities_to_dict(self, entity_dict, texts):
-        """Uses the NER.pipe to add entities to a given dictionary.
+        """Uses the NER.pipe (through the inference cache) to add entities to a given dictionary.
 
         Args:
             entity_dict: the given dictionary to add entities to.
@@ -107,18 +150,18 @@ class EntityProcessor:
         Returns:
             entity_dict, the given dictionary with added entities.
         """
-        words_present = []
+        words_present = set()
         # just add entities to dictionary as each key needs to be unique.
-        for doc in NER.pipe(texts):
-            for ent in doc.ents:
-                # set to lowercase for easy comparison
-                key = ent.text.lower()
-                # if the entity has not already been counted and is not an irrelevant word
-                if (key not in words_present) and (key not in self.irrelevant_words):
-                    try:
-                        entity_dict[key] += 1
-                    except KeyError:
-                        entity_dict[key] = 1
-                    words_present.append(key)
+        for text, _ in ner_document_entities(texts):
+            # use the canonical form for easy comparison, e.g. 'russian mod' and
+            # 'Russian Ministry of Defence' are the same entity
+            key = self.normaliser.canonical(text)
+            # if the entity has not already been counted and is not an irrelevant word
+            if (key not in words_present) and not self.normaliser.is_stopword(text):
+                try:
+                    entity_dict[key] += 1
+                except KeyError:
+                    entity_dict[key] = 1
+                words_present.add(key)
 
         return entity_dict
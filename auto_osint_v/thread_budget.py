@@ -0,0 +1,169 @@
+"""This module shares the CPU cores between the worker pools and the threads of each worker.
+
+torch, tokenizers and the BLAS/OpenMP libraries each start one thread per core by default. In a
+pool of one worker per core that gives cores x cores threads, which thrash the CPU. Instead every
+stage is given workers x threads_per_worker <= cores, from a single budget of cores.
+
+The budget also records the configuration and duration of each stage, for the profiling report
+(see --profile) and the stage duration metric.
+"""
+import os
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from auto_osint_v.metrics import STAGE_SECONDS, get_metrics
+
+# environment variables read by the OpenMP and BLAS libraries when they are loaded
+THREAD_ENVIRONMENT_VARIABLES = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+                                "NUMEXPR_NUM_THREADS", "VECLIB_MAXIMUM_THREADS")
+
+# the budget shared by every stage, created the first time it is needed
+_BUDGET = None
+
+
+def available_cores():
+    """Gets the number of cores this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # not available on Windows or macOS
+        return os.cpu_count() or 1
+
+
+def limit_threads(threads):
+    """Limits the number of threads used by torch, BLAS and OpenMP in this process.
+
+    Used as the initializer of each pool worker, the limits last as long as the worker. Libraries
+    that have not been loaded yet read the environment variables; those already loaded are limited
+    with threadpoolctl and torch. Stages run in the main process use thread_limits instead.
+
+    Args:
+        threads: the number of threads to use.
+
+    Returns:
+        the threadpoolctl limiter, which can restore the previous limits, or None if threadpoolctl
+        isn't installed
+    """
+    for variable in THREAD_ENVIRONMENT_VARIABLES:
+        os.environ[variable] = str(threads)
+    limiter = None
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        pass
+    else:
+        limiter = threadpool_limits(threads)
+    # only limit torch if it is loaded, importing it takes several seconds
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+    return limiter
+
+
+@contextmanager
+def thread_limits(threads):
+    """Limits the threads of torch, BLAS and OpenMP in this process while a block runs.
+
+    The previous environment variables, library limits and torch threads are restored afterwards,
+    so a stage run in the main process doesn't change the limits of the stages after it.
+
+    Args:
+        threads: the number of threads to use.
+    """
+    environment = {variable: os.environ.get(variable)
+                   for variable in THREAD_ENVIRONMENT_VARIABLES}
+    torch_threads = sys.modules["torch"].get_num_threads() if "torch" in sys.modules else None
+    limiter = limit_threads(threads)
+    try:
+        yield
+    finally:
+        for variable, value in environment.items():
+            if value is None:
+                os.environ.pop(variable, None)
+            else:
+                os.environ[variable] = value
+        if limiter is not None:
+            limiter.restore_original_limits()
+        if torch_threads is not None:
+            sys.modules["torch"].set_num_threads(torch_threads)
+
+
+class ThreadBudget:
+    """Assigns worker and thread counts to each stage from a single budget of cores.
+    """
+
+    def __init__(self, cores=None):
+        """Initialises the ThreadBudget object.
+
+        Args:
+            cores: Optional number of cores to share, defaults to every core available.
+        """
+        self.cores = cores or available_cores()
+        # stage name -> {"workers": int, "threads": int, "seconds": float}
+        self.stages = {}
+
+    def plan(self, stage, workers=1):
+        """Assigns the workers and threads per worker of a stage.
+
+        Args:
+            stage: the name of the stage.
+            workers: the number of workers wanted, limited to the number of cores.
+
+        Returns:
+            (number of workers, number of threads per worker)
+        """
+        workers = max(1, min(int(workers), self.cores))
+        threads = max(1, self.cores // workers)
+        self.stages.setdefault(stage, {"workers": workers, "threads": threads, "seconds": 0.0})
+        self.stages[stage].update(workers=workers, threads=threads)
+        return workers, threads
+
+    @contextmanager
+    def run_stage(self, stage, workers=1):
+        """Plans a stage and times it. Stages run in the main process should use one worker.
+
+        Args:
+            stage: the name of the stage.
+            workers: the number of workers wanted.
+
+        Yields:
+            (number of workers, number of threads per worker)
+        """
+        workers, threads = self.plan(stage, workers)
+        # the stage runs in this process, so let it use every core; pool workers are limited by
+        # their initializer instead
+        limits = thread_limits(threads) if workers == 1 else nullcontext()
+        start = time.perf_counter()
+        try:
+            with limits:
+                yield workers, threads
+        finally:
+            seconds = time.perf_counter() - start
+            self.stages[stage]["seconds"] += seconds
+            get_metrics().observe(STAGE_SECONDS, seconds, stage=stage)
+
+    def report(self):
+        """Gets the profiling report: the configuration and duration of each stage.
+
+        Returns:
+            the report, as a printable table
+        """
+        width = max([len("Stage")] + [len(stage) for stage in self.stages])
+        lines = [f"Cores: {self.cores}, tokenizers parallelism: "
+                 f"{os.environ.get('TOKENIZERS_PARALLELISM', 'default')}",
+                 f"{'Stage':<{width}}  Workers  Threads/worker  Seconds"]
+        for stage, config in self.stages.items():
+            lines.append(f"{stage:<{width}}  {config['workers']:>7}  {config['threads']:>14}  "
+                         f"{config['seconds']:>7.2f}")
+        return "\n".join(lines)
+
+
+def get_budget():
+    """Gets the thread budget shared by every stage, creating it the first time.
+
+    Returns:
+        the ThreadBudget object
+    """
+    global _BUDGET
+    if _BUDGET is None:
+        _BUDGET = ThreadBudget()
+    return _BUDGET
@@ -0,0 +1,562 @@
+"""This module spreads the per-source work (fetching, counting entities, NER) over worker nodes.
+
+The main process submits one task per source to a broker, and worker processes - on this machine
+or on other nodes - claim tasks, run them and push back the extracted text, entity counts or
+entities. Claimed tasks are leased: if a worker dies, its task is handed to another worker once the
+lease expires.
+
+Brokers:
+    SQLiteBroker: a SQLite database, for workers on the same machine (or a shared filesystem).
+    XMLRPCBroker: a client for a broker served over the network with create_server().
+
+Payloads and results are sent over the network as JSON, which escapes the characters XML can't
+carry (e.g. '\x00' in a page's text). A server listening on anything but a loopback address
+requires a shared token, set with --token or the AUTO_OSINT_V_BROKER_TOKEN environment variable on
+the server and every client, as anyone who can reach it could make the workers fetch any URL.
+
+Run a broker server and workers from the command line:
+    python -m auto_osint_v.work_queue serve --db queue.sqlite --host 0.0.0.0 --port 8765
+    python -m auto_osint_v.work_queue work --broker http://coordinator:8765
+and validate statements with '--broker http://coordinator:8765'.
+"""
+import argparse
+import hmac
+import ipaddress
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+import xmlrpc.client
+from abc import ABCMeta, abstractmethod
+from xmlrpc.server import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
+
+# environment variable holding the token shared by a broker server and its clients
+TOKEN_VARIABLE = "AUTO_OSINT_V_BROKER_TOKEN"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    job_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_until REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    taken INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, id);
+CREATE INDEX IF NOT EXISTS tasks_job ON tasks (job_id, taken);
+CREATE TABLE IF NOT EXISTS workers (
+    id TEXT PRIMARY KEY,
+    last_seen REAL NOT NULL
+);
+"""
+
+
+class NoWorkersError(RuntimeError):
+    """Raised when a job's tasks are waiting but no worker has been seen for too long."""
+
+
+class Broker(metaclass=ABCMeta):
+    """Interface of a task broker. Payloads and results are JSON serialisable dictionaries.
+    """
+
+    @abstractmethod
+    def submit(self, job_id, kind, payloads):
+        """Adds one task per payload to a job.
+
+        Args:
+            job_id: the id of the job the tasks belong to.
+            kind: the kind of task, see TASK_HANDLERS.
+            payloads: list of task payloads.
+        """
+
+    @abstractmethod
+    def claim(self, worker_id, kinds=None, lease_seconds=300):
+        """Claims the oldest pending task, or a task whose lease has expired.
+
+        Args:
+            worker_id: the id of the claiming worker.
+            kinds: Optional list of the kinds of task the worker can run.
+            lease_seconds: how long the worker has to complete the task.
+
+        Returns:
+            dictionary with the task's 'id', 'kind' and 'payload', or None if there are no tasks
+        """
+
+    @abstractmethod
+    def complete(self, task_id, result):
+        """Stores the result of a task."""
+
+    @abstractmethod
+    def fail(self, task_id, error):
+        """Records a failed attempt at a task, giving up on it after max_attempts."""
+
+    @abstractmethod
+    def take_results(self, job_id):
+        """Gets the results of the finished tasks of a job that have not been taken yet.
+
+        Tasks that failed every attempt are returned with a result of None.
+
+        Returns:
+            list of dictionaries with each task's 'payload' and 'result'
+        """
+
+    @abstractmethod
+    def clear(self, job_id):
+        """Removes every task of a job."""
+
+    @abstractmethod
+    def active_workers(self, seconds):
+        """Counts the workers that claimed a task, or are running one, in the last seconds.
+
+        Args:
+            seconds: how recently a worker must have been seen.
+
+        Returns:
+            the number of active workers
+        """
+
+
+class SQLiteBroker(Broker):
+    """Broker storing the tasks in a SQLite database.
+    """
+    max_attempts = 3
+
+    def __init__(self, db_path):
+        """Initialises the SQLiteBroker object.
+
+        Args:
+            db_path: path of the SQLite database storing the tasks.
+        """
+        self.db_path = db_path
+        self._connection = None
+        self._pid = None
+
+    def __getstate__(self):
+        # each process opens its own connection
+        state = self.__dict__.copy()
+        state["_connection"] = None
+        state["_pid"] = None
+        return state
+
+    @property
+    def connection(self):
+        """The SQLite connection of the current process."""
+        if self._connection is None or self._pid != os.getpid():
+            # transactions are managed explicitly, so claims can take the write lock up front
+            self._connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._connection
+
+    def close(self):
+        """Closes the database connection of the current process."""
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+    def submit(self, job_id, kind, payloads):
+        with self.connection:
+            self.connection.execute("BEGIN")
+            self.connection.executemany(
+                "INSERT INTO tasks (job_id, kind, payload) VALUES (?, ?, ?)",
+                [(job_id, kind, json.dumps(payload)) for payload in payloads])
+
+    def claim(self, worker_id, kinds=None, lease_seconds=300):
+        now = time.time()
+        query = ("SELECT id, kind, payload FROM tasks WHERE (status = 'pending' OR "
+                 "(status = 'running' AND lease_until < ?))")
+        parameters = [now]
+        if kinds:
+            query += f" AND kind IN ({', '.join('?' * len(kinds))})"
+            parameters += list(kinds)
+        with self.connection:
+            # take the write lock before reading, so no two workers claim the same task
+            self.connection.execute("BEGIN IMMEDIATE")
+            # give up on tasks whose workers keep dying
+            self.connection.execute(
+                "UPDATE tasks SET status = 'failed' WHERE status = 'running' AND lease_until < ? "
+                "AND attempts >= ?", (now, self.max_attempts))
+            # claiming is the workers' heartbeat, see active_workers
+            self.connection.execute(
+                "INSERT OR REPLACE INTO workers (id, last_seen) VALUES (?, ?)", (worker_id, now))
+            row = self.connection.execute(query + " ORDER BY id LIMIT 1", parameters).fetchone()
+            if row is None:
+                return None
+            self.connection.execute(
+                "UPDATE tasks SET status = 'running', worker = ?, lease_until = ?, "
+                "attempts = attempts + 1 WHERE id = ?", (worker_id, now + lease_seconds, row[0]))
+        return {"id": row[0], "kind": row[1], "payload": json.loads(row[2])}
+
+    def complete(self, task_id, result):
+        with self.connection:
+            self.connection.execute("BEGIN")
+            self.connection.execute("UPDATE tasks SET status = 'done', result = ? WHERE id = ?",
+                                    (json.dumps(result), task_id))
+
+    def fail(self, task_id, error):
+        with self.connection:
+            self.connection.execute("BEGIN")
+            self.connection.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' "
+                "END, result = ?, lease_until = 0 WHERE id = ?",
+                (self.max_attempts, json.dumps({"error": str(error)}), task_id))
+
+    def take_results(self, job_id):
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            rows = self.connection.execute(
+                "SELECT id, status, payload, result FROM tasks WHERE job_id = ? AND taken = 0 "
+                "AND status IN ('done', 'failed')", (job_id,)).fetchall()
+            self.connection.executemany("UPDATE tasks SET taken = 1 WHERE id = ?",
+                                        [(row[0],) for row in rows])
+        return [{"payload": json.loads(payload),
+                 "result": json.loads(result) if status == "done" else None}
+                for _, status, payload, result in rows]
+
+    def clear(self, job_id):
+        with self.connection:
+            self.connection.execute("BEGIN")
+            self.connection.execute("DELETE FROM tasks WHERE job_id = ?", (job_id,))
+
+    def active_workers(self, seconds):
+        now = time.time()
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM workers WHERE last_seen >= ? OR id IN "
+            "(SELECT worker FROM tasks WHERE status = 'running' AND lease_until >= ?)",
+            (now - seconds, now)).fetchone()[0]
+
+
+class XMLRPCBroker(Broker):
+    """Client for a broker served over the network (see create_server).
+    """
+
+    def __init__(self, url, token=None):
+        """Initialises the XMLRPCBroker object.
+
+        Args:
+            url: the URL of the broker server, e.g. 'http://coordinator:8765'.
+            token: Optional token shared with the server, defaults to the AUTO_OSINT_V_BROKER_TOKEN
+                environment variable.
+        """
+        self.url = url
+        self.token = token or os.environ.get(TOKEN_VARIABLE)
+        self._proxy = None
+
+    def __getstate__(self):
+        # proxies can't be pickled, each process creates its own
+        state = self.__dict__.copy()
+        state["_proxy"] = None
+        return state
+
+    @property
+    def proxy(self):
+        """The XML-RPC proxy for the broker server."""
+        if self._proxy is None:
+            headers = [("Authorization", f"Bearer {self.token}")] if self.token else []
+            self._proxy = xmlrpc.client.ServerProxy(self.url, allow_none=True, headers=headers)
+        return self._proxy
+
+    def submit(self, job_id, kind, payloads):
+        self.proxy.submit(job_id, kind, json.dumps(payloads))
+
+    def claim(self, worker_id, kinds=None, lease_seconds=300):
+        return json.loads(self.proxy.claim(worker_id, kinds, lease_seconds))
+
+    def complete(self, task_id, result):
+        self.proxy.complete(task_id, json.dumps(result))
+
+    def fail(self, task_id, error):
+        self.proxy.fail(task_id, json.dumps(str(error)))
+
+    def take_results(self, job_id):
+        return json.loads(self.proxy.take_results(job_id))
+
+    def clear(self, job_id):
+        self.proxy.clear(job_id)
+
+    def active_workers(self, seconds):
+        return self.proxy.active_workers(seconds)
+
+
+class BrokerService:
+    """Gives XML-RPC access to a broker, with the payloads and results sent as JSON strings.
+    """
+
+    def __init__(self, broker):
+        """Initialises the BrokerService object.
+
+        Args:
+            broker: the broker to serve.
+        """
+        self.broker = broker
+
+    def submit(self, job_id, kind, payloads):
+        """See Broker.submit, payloads is a JSON list."""
+        self.broker.submit(job_id, kind, json.loads(payloads))
+
+    def claim(self, worker_id, kinds, lease_seconds):
+        """See Broker.claim, the task is returned as JSON."""
+        return json.dumps(self.broker.claim(worker_id, kinds, lease_seconds))
+
+    def complete(self, task_id, result):
+        """See Broker.complete, result is JSON."""
+        self.broker.complete(task_id, json.loads(result))
+
+    def fail(self, task_id, error):
+        """See Broker.fail, error is a JSON string."""
+        self.broker.fail(task_id, json.loads(error))
+
+    def take_results(self, job_id):
+        """See Broker.take_results, the results are returned as JSON."""
+        return json.dumps(self.broker.take_results(job_id))
+
+    def clear(self, job_id):
+        """See Broker.clear."""
+        self.broker.clear(job_id)
+
+    def active_workers(self, seconds):
+        """See Broker.active_workers."""
+        return self.broker.active_workers(seconds)
+
+
+class TokenRequestHandler(SimpleXMLRPCRequestHandler):
+    """Request handler rejecting requests without the server's token, if it has one.
+    """
+    token = None
+
+    def parse_request(self):
+        if not super().parse_request():
+            return False
+        if self.token is None:
+            return True
+        expected = f"Bearer {self.token}".encode("utf-8")
+        if hmac.compare_digest(self.headers.get("Authorization", "").encode("utf-8"), expected):
+            return True
+        self.send_error(401, "Missing or wrong broker token")
+        return False
+
+
+def connect_broker(address, token=None):
+    """Connects to a broker.
+
+    Args:
+        address: the URL of a broker server (http://...), or the path of a SQLite broker database.
+        token: Optional token shared with a broker server, see XMLRPCBroker.
+
+    Returns:
+        the Broker object
+    """
+    if address.startswith(("http://", "https://")):
+        return XMLRPCBroker(address, token)
+    return SQLiteBroker(address)
+
+
+def is_loopback(host):
+    """Checks whether an address can only be reached from this machine."""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def create_server(broker, host="127.0.0.1", port=8765, token=None):
+    """Creates an XML-RPC server giving network access to a broker.
+
+    Args:
+        broker: the broker to serve, e.g. a SQLiteBroker.
+        host: the address to listen on.
+        port: the port to listen on.
+        token: the token clients must send, required unless host is a loopback address.
+
+    Returns:
+        the server, call serve_forever() to run it
+
+    Raises:
+        ValueError: if no token is given for a non-loopback host.
+    """
+    if token is None and not is_loopback(host):
+        raise ValueError(f"A token is needed to serve the broker on {host}, as anyone who can "
+                         "reach it could queue URLs for the workers to fetch")
+    handler = type("BrokerRequestHandler", (TokenRequestHandler,), {"token": token})
+    server = SimpleXMLRPCServer((host, port), handler, allow_none=True, logRequests=False)
+    service = BrokerService(broker)
+    for method in ("submit", "claim", "complete", "fail", "take_results", "clear",
+                   "active_workers"):
+        server.register_function(getattr(service, method), method)
+    return server
+
+
+def count_task(payload):
+    """Fetches a source and counts the given entities in its text.
+
+    Args:
+        payload: dictionary with the source 'url' and the 'entities' to count.
+
+    Returns:
+        dictionary with the source 'url', its 'text', the entity 'counts' and the 'length' of the
+        text in words
+    """
+    from auto_osint_v.priority_manager import PriorityManager, count_words
+    text = PriorityManager.get_text_from_site(payload["url"])
+    counts, length = count_words(payload["entities"], text)
+    return {"url": payload["url"], "text": text, "counts": counts, "length": length}
+
+
+def entities_task(payload):
+    """Finds the entities in a source, fetching its text if it is not given.
+
+    Args:
+        payload: dictionary with the source 'url' and optionally its 'text'.
+
+    Returns:
+        dictionary with the source 'url' and the list of 'entities' found in it
+    """
+    from auto_osint_v.popular_information_finder import PopularInformationFinder
+    from auto_osint_v.specific_entity_processor import EntityProcessor
+    finder = PopularInformationFinder(None, EntityProcessor(None))
+    return {"url": payload["url"],
+            "entities": finder.get_text_process_entities(payload, payload.get("text"))}
+
+
+# functions running each kind of task
+TASK_HANDLERS = {"count": count_task, "entities": entities_task}
+
+
+def report_failure(broker, task_id, error):
+    """Records a failed attempt at a task, if the broker can be reached.
+
+    If it can't, the task is handed to another worker once its lease expires.
+
+    Args:
+        broker: the broker the task was claimed from.
+        task_id: the id of the task.
+        error: the error the task failed with.
+    """
+    try:
+        broker.fail(task_id, repr(error))
+    except Exception as fail_error:  # the worker keeps going, whatever happened to the broker
+        print(f"Couldn't report the failure of task {task_id}: {fail_error!r}")
+
+
+def run_worker(broker, kinds=None, handlers=None, poll_interval=1.0, idle_timeout=None):
+    """Claims and runs tasks until there are none left for idle_timeout seconds.
+
+    Args:
+        broker: the broker to claim tasks from.
+        kinds: Optional list of the kinds of task to run, defaults to every kind handled.
+        handlers: Optional dictionary of kind -> function, defaults to TASK_HANDLERS.
+        poll_interval: how long to wait (seconds) before checking for new tasks.
+        idle_timeout: Optional time (seconds) without tasks after which the worker stops.
+
+    Returns:
+        the number of tasks run
+    """
+    handlers = handlers or TASK_HANDLERS
+    kinds = list(kinds or handlers)
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    tasks_run = 0
+    idle_since = time.monotonic()
+    while idle_timeout is None or time.monotonic() - idle_since < idle_timeout:
+        task = broker.claim(worker_id, kinds)
+        if task is None:
+            time.sleep(poll_interval)
+            continue
+        try:
+            result = handlers[task["kind"]](task["payload"])
+        except Exception as error:  # report any failure, so the task can be retried elsewhere
+            report_failure(broker, task["id"], error)
+        else:
+            try:
+                broker.complete(task["id"], result)
+            except Exception as error:  # e.g. a result the broker can't store
+                report_failure(broker, task["id"], error)
+        tasks_run += 1
+        idle_since = time.monotonic()
+    return tasks_run
+
+
+def run_job(broker, kind, payloads, desc=None, poll_interval=0.5, worker_timeout=60):
+    """Submits a job and yields the results of its tasks as they finish.
+
+    Args:
+        broker: the broker to submit the tasks to.
+        kind: the kind of task.
+        payloads: list of task payloads.
+        desc: Optional description for the progress bar.
+        poll_interval: how long to wait (seconds) before checking for new results.
+        worker_timeout: how long to wait (seconds) without results or any active worker.
+
+    Yields:
+        (payload, result) tuples, where result is None if the task failed every attempt
+
+    Raises:
+        NoWorkersError: if no result came and no worker was seen for worker_timeout seconds.
+    """
+    from tqdm import tqdm
+    job_id = uuid.uuid4().hex
+    broker.submit(job_id, kind, payloads)
+    remaining = len(payloads)
+    try:
+        with tqdm(total=remaining, desc=desc) as progress:
+            waiting_since = time.monotonic()
+            while remaining:
+                finished = broker.take_results(job_id)
+                if not finished:
+                    if time.monotonic() - waiting_since >= worker_timeout:
+                        if not broker.active_workers(worker_timeout):
+                            raise NoWorkersError(
+                                f"No worker has been seen for {worker_timeout} seconds, start "
+                                "workers with 'python -m auto_osint_v.work_queue work'")
+                        waiting_since = time.monotonic()
+                    time.sleep(poll_interval)
+                    continue
+                waiting_since = time.monotonic()
+                for task in finished:
+                    yield task["payload"], task["result"]
+                remaining -= len(finished)
+                progress.update(len(finished))
+    finally:
+        broker.clear(job_id)
+
+
+def parse_args(argv=None):
+    """Interprets the command line arguments of the broker server and worker."""
+    parser = argparse.ArgumentParser(prog="python -m auto_osint_v.work_queue")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="Serve a SQLite broker over the network")
+    serve.add_argument("--db", default="queue.sqlite", help="Path of the broker database")
+    serve.add_argument("--host", default="127.0.0.1",
+                       help="Address to listen on, e.g. 0.0.0.0 for workers on other machines "
+                            "(needs a token)")
+    serve.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    serve.add_argument("--token", default=os.environ.get(TOKEN_VARIABLE),
+                       help=f"Token clients must send (default: ${TOKEN_VARIABLE})")
+    work = commands.add_parser("work", help="Run tasks from a broker")
+    work.add_argument("--broker", required=True,
+                      help="URL of a broker server, or path of a SQLite broker database")
+    work.add_argument("--token", help=f"Token of the broker server (default: ${TOKEN_VARIABLE})")
+    work.add_argument("--kinds", nargs="+", choices=sorted(TASK_HANDLERS),
+                      help="Kinds of task to run (default: all)")
+    work.add_argument("--idle_timeout", type=float,
+                      help="Stop after this many seconds without tasks (default: never)")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.command == "serve":
+        print(f"Serving broker {args.db} on {args.host}:{args.port}")
+        create_server(SQLiteBroker(args.db), args.host, args.port, args.token).serve_forever()
+    else:
+        tasks_run = run_worker(connect_broker(args.broker, args.token), args.kinds,
+                               idle_timeout=args.idle_timeout)
+        print(f"Ran {tasks_run} tasks")
@@ -0,0 +1,107 @@
+"""This module creates the worker pools used by the priority manager and popular info finder.
+
+Pools are sized from the memory available rather than only the number of cores, so that scaling to
+every core never runs the machine out of memory. The NER pool's workers are forked from a
+forkserver that has already loaded the NER model, so the model's weights are shared between the
+workers (copy-on-write) instead of being loaded once per worker.
+
+Each pool is a stage of the thread budget (see thread_budget): its workers' torch, BLAS and OpenMP
+threads are limited so that the pool as a whole uses each core once.
+"""
+import multiprocessing
+import os
+from contextlib import contextmanager
+from auto_osint_v.thread_budget import get_budget, limit_threads
+
+# module imported by the forkserver before any NER worker is forked, see ner_preload
+NER_PRELOAD_MODULE = "auto_osint_v.ner_preload"
+# start methods of the NER and fetch workers (None is the platform's default). With "fork" the
+# workers are forked from the main process, and share its module state (e.g. the stores the load
+# test replaces)
+NER_START_METHOD = "forkserver"
+FETCH_START_METHOD = None
+# rough amount of private memory (bytes) used by each worker, on top of any shared model weights
+NER_WORKER_MEMORY = 768 * 1024 ** 2
+FETCH_WORKER_MEMORY = 256 * 1024 ** 2
+# memory (bytes) left for the main process and the rest of the system
+RESERVED_MEMORY = 1024 ** 3
+
+
+def available_memory():
+    """Gets the memory available to new processes.
+
+    Returns:
+        the available memory in bytes, or None if it can't be found
+    """
+    try:
+        import psutil
+    except ImportError:
+        try:
+            return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        except (AttributeError, ValueError, OSError):
+            # e.g. on Windows without psutil
+            return None
+    return psutil.virtual_memory().available
+
+
+def pool_size(worker_memory, max_workers=None):
+    """Gets the number of workers that fit in the available memory.
+
+    Args:
+        worker_memory: the memory (bytes) used by each worker.
+        max_workers: Optional maximum number of workers, defaults to the number of cores in the
+            thread budget.
+
+    Returns:
+        the number of workers, at least 1
+    """
+    workers = max_workers or get_budget().cores
+    memory = available_memory()
+    if memory is not None:
+        workers = min(workers, (memory - RESERVED_MEMORY) // worker_memory)
+    return max(int(workers), 1)
+
+
+@contextmanager
+def _pool(context, stage, worker_memory, max_workers):
+    """Runs a pool as a stage of the thread budget, closing it when the stage ends."""
+    with get_budget().run_stage(stage, pool_size(worker_memory, max_workers)) as (workers, threads):
+        with context.Pool(workers, initializer=limit_threads, initargs=(threads,)) as pool:
+            yield pool
+
+
+def ner_pool(stage="NER", max_workers=None):
+    """Creates a pool for workers that run the NER model.
+
+    Where the platform supports it, workers are forked from a forkserver that has preloaded the NER
+    model. Otherwise (e.g. on Windows) the platform's default start method is used.
+
+    Args:
+        stage: the name of the stage, for the profiling report.
+        max_workers: Optional maximum number of workers, defaults to the number of cores.
+
+    Returns:
+        context manager giving the multiprocessing pool
+    """
+    if NER_START_METHOD in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context(NER_START_METHOD)
+        if NER_START_METHOD == "forkserver":
+            # only has an effect before the forkserver is started, i.e. for the first pool
+            context.set_forkserver_preload([NER_PRELOAD_MODULE])
+    else:
+        context = multiprocessing.get_context()
+    return _pool(context, stage, NER_WORKER_MEMORY, max_workers)
+
+
+def fetch_pool(stage="Fetching", max_workers=None):
+    """Creates a pool for workers that fetch webpages and count entities in them.
+
+    Args:
+        stage: the name of the stage, for the profiling report.
+        max_workers: Optional maximum number of workers, defaults to the number of cores.
+
+    Returns:
+        context manager giving the multiprocessing pool
+    """
+    return _pool(multiprocessing.get_context(FETCH_START_METHOD), stage, FETCH_WORKER_MEMORY,
+                 max_workers)
@@ -0,0 +1,507 @@
+"""Load test of the pipeline on a synthetic web, at scales the search API can't give us.
+
+The Custom Search API returns at most 100 results a query, so we don't know how the pipeline
+behaves with thousands of sources. The load test generates:
+    - a statement and its target entities, and popular entities mentioned across the pages,
+    - CSE-shaped search results, one per source,
+    - the HTML page of each source, of a given size and density of target entities, with a
+      lognormal response time and a share of pages that time out, drop the connection or fail,
+and serves the pages from stand-in websites on localhost (one port per site, so the host
+scheduler sees separate hosts). Every page is generated from its index and a seed, so the same
+web is served at every scale without holding it in memory.
+
+The pipeline then runs on the sources, stage by stage: aggregation (fetching each result's media
+and analysing its headline), target info scoring, popular info scoring and output. The time
+taken, throughput and peak memory (of this process and its workers) of each stage are recorded at
+each scale, and stages whose time per source grows more than twofold are flagged as not scaling.
+
+Stages whose model or library isn't installed are skipped: without the sentiment model the
+sources are built straight from the search results, and without pandas the output is written as
+JSON Lines. Pages that fail with an HTTP error send the pipeline to its Selenium fallback, so
+--error_rate needs Chrome and seleniumwire.
+
+The host history, metrics and inference cache of the run are kept in a temporary directory, so
+the pipeline's own stores are untouched. The pools' workers share the temporary stores by being
+forked from the load test's process (the NER workers too, rather than from the forkserver), so
+the load test needs a platform with the fork start method, i.e. not Windows.
+
+    python -m benchmarks.load_test --sources 100 1000 10000 --output load_test_results
+"""
+import argparse
+import csv
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from auto_osint_v import host_scheduler, inference_cache, metrics, worker_pool
+from auto_osint_v.file_handler import FileHandler
+from auto_osint_v.host_scheduler import HostScheduler
+from auto_osint_v.inference_cache import InferenceCache
+from auto_osint_v.metrics import MetricsRegistry
+from auto_osint_v.source_record import SourceRecord
+from benchmarks.micro_benchmarks import (SEED, synthetic_entities, synthetic_words,
+                                         temporary_directory)
+
+# the stages of the pipeline that are load tested, in the order they run
+STAGES = ("aggregation", "target_scoring", "popular_scoring", "output")
+# labels given to the synthetic target entities, as the NER model would
+ENTITY_LABELS = ("Person", "Location", "Organisation", "Weapon", "MilitaryPlatform")
+PAGE_PATH = re.compile(r"/page/(\d+)")
+
+
+class SyntheticWeb:
+    """Generates the statement, search results and pages of a synthetic web.
+    """
+
+    def __init__(self, sources=1000, sites=50, page_words=800, entity_density=0.2,
+                 latency=0.05, latency_sigma=1.0, timeout_rate=0.01, reset_rate=0.01,
+                 error_rate=0.0, timeout_delay=12.0, seed=SEED):
+        """Initialises the SyntheticWeb object.
+
+        Args:
+            sources: the number of sources (search results and pages).
+            sites: the number of websites the pages are spread over.
+            page_words: the number of words of each page.
+            entity_density: the share of sentences mentioning a target entity.
+            latency: the median response time of a page, in seconds.
+            latency_sigma: the spread of the (lognormal) response times.
+            timeout_rate: the share of pages that respond after timeout_delay.
+            reset_rate: the share of pages whose connection is dropped without a response.
+            error_rate: the share of pages answering with a server error.
+            timeout_delay: the response time of the pages that time out, in seconds.
+            seed: the seed the web is generated from.
+        """
+        self.sources = sources
+        self.sites = sites
+        self.page_words = page_words
+        self.entity_density = entity_density
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.timeout_rate = timeout_rate
+        self.reset_rate = reset_rate
+        self.error_rate = error_rate
+        self.timeout_delay = timeout_delay
+        self.seed = seed
+        rng = random.Random(seed)
+        self.vocabulary = synthetic_words(rng, 5000)
+        self.target_entities = [(ENTITY_LABELS[i % len(ENTITY_LABELS)], entity)
+                                for i, entity in enumerate(synthetic_entities(rng, 12))]
+        # a few popular entities are mentioned much more often than the rest
+        self.popular_entities = synthetic_entities(rng, 300)
+        self.popular_weights = [1 / (rank + 1) for rank in range(len(self.popular_entities))]
+        self.statement = " ".join(
+            f"{entity} {' '.join(rng.choices(self.vocabulary, k=8))}."
+            for _, entity in self.target_entities)
+        # the address of each site, see serve
+        self.base_urls = []
+
+    def _rng(self, index, stream):
+        """Gets a random generator of a source, so its result and page never change.
+
+        Args:
+            index: the index of the source.
+            stream: 'result' or 'page', each is generated from its own stream.
+        """
+        return random.Random(f"{self.seed}:{stream}:{index}")
+
+    def url(self, index):
+        """Gets the URL of a source's page."""
+        return f"{self.base_urls[index % len(self.base_urls)]}/page/{index}"
+
+    def _sentence(self, rng, entity_density):
+        """Generates a sentence, mentioning a target entity with the given probability."""
+        words = rng.choices(self.vocabulary, k=12)
+        if rng.random() < entity_density:
+            words[rng.randrange(12)] = rng.choice(self.target_entities)[1]
+        if rng.random() < 0.3:
+            words[rng.randrange(12)] = rng.choices(self.popular_entities,
+                                                   self.popular_weights)[0]
+        return " ".join(words).capitalize() + "."
+
+    def result(self, index):
+        """Gets the CSE-shaped search result of a source."""
+        rng = self._rng(index, "result")
+        title = self._sentence(rng, 0.5)[:-1]
+        snippet = self._sentence(rng, self.entity_density)
+        return {"link": self.url(index), "title": title, "snippet": snippet,
+                "pagemap": {"metatags": [{"og:title": title, "og:description": snippet,
+                                          "og:type": "article",
+                                          "article:published_time": "2023-05-01T12:00:00Z"}]}}
+
+    def page(self, index):
+        """Gets how a source's page responds.
+
+        Returns:
+            (kind, delay, html): kind is 'ok', 'timeout', 'reset' or 'error', delay is the
+            response time in seconds
+        """
+        result = self.result(index)
+        rng = self._rng(index, "page")
+        draw = rng.random()
+        delay = rng.lognormvariate(math.log(self.latency), self.latency_sigma)
+        if draw < self.timeout_rate:
+            return "timeout", self.timeout_delay, ""
+        if draw < self.timeout_rate + self.reset_rate:
+            return "reset", delay, ""
+        kind = "error" if draw < self.timeout_rate + self.reset_rate + self.error_rate else "ok"
+        paragraphs = []
+        for _ in range(max(1, self.page_words // 120)):
+            paragraphs.append("<p>" + " ".join(self._sentence(rng, self.entity_density)
+                                               for _ in range(10)) + "</p>")
+        html = (f"<!DOCTYPE html><html><head><title>{result['title']}</title>"
+                f"<meta name='description' content='{result['snippet']}'>"
+                "<script>window.dataLayer = [];</script></head><body><article>"
+                f"<h1>{result['title']}</h1><img src='/images/{index}.jpg'>"
+                + "\n".join(paragraphs) + "</article></body></html>")
+        return kind, delay, html
+
+
+class SyntheticSiteHandler(BaseHTTPRequestHandler):
+    """Serves the pages of the synthetic web, with their response times and failures.
+    """
+    # keep connections alive, as real sites do
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        """Sends a source's page, after its response time."""
+        match = PAGE_PATH.fullmatch(urlsplit(self.path).path)
+        if match is None:
+            self.send_error(404)
+            return
+        kind, delay, html = self.server.web.page(int(match.group(1)))
+        time.sleep(delay)
+        if kind == "reset":
+            self.close_connection = True
+            return
+        body = html.encode("utf-8")
+        try:
+            self.send_response(500 if kind == "error" else 200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up waiting, e.g. for a page that times out
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        # there are thousands of requests
+        pass
+
+
+def serve(web):
+    """Serves every site of a synthetic web on localhost, from background threads.
+
+    Args:
+        web: the SyntheticWeb to serve, its base_urls are set to the sites' addresses.
+
+    Returns:
+        list of the servers, call shutdown() on each to stop them
+    """
+    servers = []
+    web.base_urls = []
+    for _ in range(web.sites):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), SyntheticSiteHandler)
+        server.daemon_threads = True
+        server.web = web
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        web.base_urls.append(f"http://127.0.0.1:{server.server_address[1]}")
+    return servers
+
+
+class MemorySampler:
+    """Samples the memory used by this process and its workers while a stage runs.
+
+    Uses psutil when it is installed, otherwise only the peak memory of this process and of its
+    finished workers is known (from getrusage).
+    """
+
+    def __init__(self, interval=0.1):
+        """Initialises the MemorySampler object.
+
+        Args:
+            interval: the time between samples, in seconds.
+        """
+        self.interval = interval
+        # (seconds since the start, bytes used) of each sample
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._start = None
+
+    @staticmethod
+    def used():
+        """Gets the memory (resident set size, in bytes) used by this process and its workers."""
+        try:
+            import psutil
+        except ImportError:
+            try:
+                import resource
+            except ImportError:
+                # e.g. on Windows without psutil
+                return 0
+            # the peak sizes, in kilobytes on Linux
+            return 1024 * (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                           + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+        process = psutil.Process()
+        used = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                used += child.memory_info().rss
+            except psutil.Error:
+                # the worker has just exited
+                pass
+        return used
+
+    def _sample(self):
+        """Adds a sample every interval until stopped."""
+        while not self._stop.wait(self.interval):
+            self.samples.append((time.perf_counter() - self._start, self.used()))
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        self.samples.append((0.0, self.used()))
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.samples.append((time.perf_counter() - self._start, self.used()))
+
+    @property
+    def peak(self):
+        """The most memory used, in bytes."""
+        return max(used for _, used in self.samples)
+
+
+class LoadTest:
+    """Runs the stages of the pipeline on the sources of a synthetic web.
+    """
+
+    def __init__(self, web, data_directory):
+        """Initialises the LoadTest object.
+
+        Args:
+            web: the SyntheticWeb, already served.
+            data_directory: the directory of the run's data files.
+        """
+        self.web = web
+        self.file_handler = FileHandler(data_directory + os.sep)
+        # the target entities the NER model would find in the statement
+        for label, entity in web.target_entities:
+            self.file_handler.target_entities.add(label, entity)
+        self.file_handler.write_target_info_snapshot()
+        self.file_handler.open_evidence_file(["sentiment-analysis-of-load-test",
+                                              "neutral sentiment, score: 0.9"])
+        with open(os.path.join(data_directory, "bias_sources.csv"), "w",
+                  encoding="utf-8") as bias_file:
+            bias_file.write("Type/Link,Key Info,Info Sentiment\n")
+        self.results = [web.result(index) for index in range(web.sources)]
+        self.sources = []
+        self.priority_manager = None
+
+    def aggregation(self):
+        """Fetches each result's media and analyses its headline, as the source aggregator does."""
+        from auto_osint_v.source_aggregator import SourceAggregator
+        try:
+            from auto_osint_v.sentiment_analyser import SentimentAnalyser
+            analyser = SentimentAnalyser(self.web.statement, "load_test", self.file_handler)
+        except Exception as error:
+            # the sources are built straight from the results, as if every headline was neutral
+            self.sources = [SourceRecord(result["link"], result["title"], result["snippet"],
+                                         "article") for result in self.results]
+            return f"skipped, no sentiment model ({type(error).__name__})"
+        aggregator = SourceAggregator(self.web.statement, self.file_handler, analyser)
+        for result in self.results:
+            aggregator.process_result(result)
+        self.sources = aggregator.results_list_dict
+        return ""
+
+    def target_scoring(self):
+        """Fetches every source and scores it on the target entities."""
+        from auto_osint_v.priority_manager import PriorityManager
+        from auto_osint_v.specific_entity_processor import EntityProcessor
+        self.priority_manager = PriorityManager(self.file_handler,
+                                                EntityProcessor(self.file_handler), self.sources)
+        self.priority_manager.target_info_scorer()
+        self.priority_manager.remove_sources()
+        self.sources = self.priority_manager.sources
+        return f"{len(self.sources)} sources kept"
+
+    def popular_scoring(self):
+        """Finds the popular entities with the NER model and scores every source on them."""
+        import importlib.util
+        if importlib.util.find_spec("spacy") is None:
+            return "skipped, spacy not installed"
+        self.priority_manager.popular_info_scorer()
+        self.priority_manager.sort_sources_desc()
+        self.sources = self.priority_manager.sources
+        return ""
+
+    def output(self):
+        """Formats the results table, or writes it as JSON Lines without pandas."""
+        import importlib.util
+        from auto_osint_v.__main__ import format_output, output_rows
+        self.priority_manager.close()
+        if importlib.util.find_spec("pandas") is None:
+            self.file_handler.write_jsonl_output(output_rows(self.sources, self.file_handler),
+                                                 "_load_test")
+            return "JSON Lines, pandas not installed"
+        format_output(self.sources, self.file_handler)
+        return ""
+
+
+def run_load_test(sources, stages=STAGES, **web_options):
+    """Runs the pipeline on a synthetic web of the given number of sources.
+
+    Args:
+        sources: the number of sources.
+        stages: the stages to run, see STAGES. Later stages need the earlier ones.
+        web_options: keyword arguments for SyntheticWeb.
+
+    Returns:
+        list of dictionaries, one per stage, with the 'sources', 'stage', 'seconds',
+        'sources_per_second', 'peak_memory_mb', 'note' and the memory 'samples'
+    """
+    web = SyntheticWeb(sources, **web_options)
+    servers = serve(web)
+    data_directory = temporary_directory()
+    # the run's host history, metrics and inference cache are kept apart from the pipeline's own,
+    # and the workers are forked so they use them too
+    saved_stores = (host_scheduler._SCHEDULER, metrics._METRICS, inference_cache._CACHE,
+                    worker_pool.NER_START_METHOD, worker_pool.FETCH_START_METHOD)
+    host_scheduler._SCHEDULER = HostScheduler(os.path.join(data_directory, "hosts.sqlite"))
+    metrics._METRICS = MetricsRegistry(os.path.join(data_directory, "metrics.sqlite"))
+    inference_cache._CACHE = InferenceCache(os.path.join(data_directory,
+                                                         "inference_cache.sqlite"))
+    worker_pool.NER_START_METHOD = worker_pool.FETCH_START_METHOD = "fork"
+    rows = []
+    try:
+        load_test = LoadTest(web, data_directory)
+        for stage in STAGES:
+            if stage not in stages:
+                continue
+            start = time.perf_counter()
+            with MemorySampler() as sampler:
+                note = getattr(load_test, stage)()
+            seconds = time.perf_counter() - start
+            rows.append({"sources": sources, "stage": stage, "seconds": seconds,
+                         "sources_per_second": sources / seconds if seconds else 0,
+                         "peak_memory_mb": sampler.peak / 1024 ** 2, "note": note,
+                         "samples": sampler.samples})
+        metrics._METRICS.write_textfile(os.path.join(data_directory, "metrics.prom"))
+    finally:
+        for store in (host_scheduler._SCHEDULER, metrics._METRICS, inference_cache._CACHE):
+            store.close()
+        (host_scheduler._SCHEDULER, metrics._METRICS, inference_cache._CACHE,
+         worker_pool.NER_START_METHOD, worker_pool.FETCH_START_METHOD) = saved_stores
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+    return rows
+
+
+def scaling_limits(rows, factor=2.0):
+    """Finds, for each stage, the first scale at which its time per source has grown too much.
+
+    Args:
+        rows: the rows of run_load_test at several scales.
+        factor: how much the time per source may grow from the smallest scale.
+
+    Returns:
+        dictionary of stage -> (number of sources, growth of the time per source)
+    """
+    limits = {}
+    smallest = {}
+    for row in sorted(rows, key=lambda x: x["sources"]):
+        if row["note"].startswith("skipped"):
+            continue
+        per_source = row["seconds"] / row["sources"]
+        first = smallest.setdefault(row["stage"], per_source)
+        if row["stage"] not in limits and first and per_source > first * factor:
+            limits[row["stage"]] = (row["sources"], per_source / first)
+    return limits
+
+
+def write_results(rows, directory):
+    """Writes the throughput and memory curves to CSV files in a directory."""
+    os.makedirs(directory, exist_ok=True)
+    fields = ["sources", "stage", "seconds", "sources_per_second", "peak_memory_mb", "note"]
+    with open(os.path.join(directory, "throughput.csv"), "w", newline="",
+              encoding="utf-8") as throughput_file:
+        writer = csv.DictWriter(throughput_file, fields, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(os.path.join(directory, "memory.csv"), "w", newline="",
+              encoding="utf-8") as memory_file:
+        writer = csv.writer(memory_file)
+        writer.writerow(["sources", "stage", "seconds", "memory_mb"])
+        for row in rows:
+            writer.writerows([row["sources"], row["stage"], f"{seconds:.2f}",
+                              f"{used / 1024 ** 2:.1f}"] for seconds, used in row["samples"])
+
+
+def parse_args(argv=None):
+    """Interprets the command line arguments of the load test."""
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load_test")
+    parser.add_argument("--sources", type=int, nargs="+", default=[100, 1000],
+                        help="Numbers of sources to run the pipeline on (default: 100 1000)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES),
+                        help="Stages to run (default: all)")
+    parser.add_argument("--sites", type=int, default=50,
+                        help="Number of websites the pages are spread over (default: 50)")
+    parser.add_argument("--page_words", type=int, default=800,
+                        help="Number of words of each page (default: 800)")
+    parser.add_argument("--entity_density", type=float, default=0.2,
+                        help="Share of sentences mentioning a target entity (default: 0.2)")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="Median response time of a page, in seconds (default: 0.05)")
+    parser.add_argument("--latency_sigma", type=float, default=1.0,
+                        help="Spread of the lognormal response times (default: 1.0)")
+    parser.add_argument("--timeout_rate", type=float, default=0.01,
+                        help="Share of pages that time out (default: 0.01)")
+    parser.add_argument("--reset_rate", type=float, default=0.01,
+                        help="Share of pages that drop the connection (default: 0.01)")
+    parser.add_argument("--error_rate", type=float, default=0.0,
+                        help="Share of pages answering with a server error, these go to the "
+                             "Selenium fallback (default: 0)")
+    parser.add_argument("--seed", type=int, default=SEED, help="Seed of the synthetic web")
+    parser.add_argument("--output", help="Directory to write throughput.csv and memory.csv to")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Runs the load test at each scale and prints the throughput and memory of each stage."""
+    args = parse_args(argv)
+    web_options = {"sites": args.sites, "page_words": args.page_words,
+                   "entity_density": args.entity_density, "latency": args.latency,
+                   "latency_sigma": args.latency_sigma, "timeout_rate": args.timeout_rate,
+                   "reset_rate": args.reset_rate, "error_rate": args.error_rate,
+                   "seed": args.seed}
+    rows = []
+    for sources in args.sources:
+        rows += run_load_test(sources, args.stages, **web_options)
+    print("Sources, stage: time, throughput, peak memory")
+    for row in rows:
+        note = f" ({row['note']})" if row["note"] else ""
+        print(f"{row['sources']}, {row['stage']}: {row['seconds']:.1f}s, "
+              f"{row['sources_per_second']:.1f} sources/s, {row['peak_memory_mb']:.0f}MB{note}")
+    for stage, (sources, growth) in scaling_limits(rows).items():
+        print(f"{stage} stops scaling at {sources} sources: {growth:.1f}x the time per source")
+    if args.output:
+        write_results(rows, args.output)
+        print(f"Wrote the throughput and memory curves to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
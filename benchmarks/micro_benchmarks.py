@@ -0,0 +1,423 @@
+"""Micro-benchmarks of the tool's hot functions, with a stored baseline to catch regressions.
+
+Each benchmark times one function on synthetic data (generated from a fixed seed, so every run
+times the same work) or on data recorded in the repository (the re3d NER test set and the sources
+of the unit tests):
+    - count_entities, on a long synthetic page and on the re3d test set,
+    - the HTML to text extraction of get_text_from_site (extract_text),
+    - EntityProcessor.get_entities_and_count (and so add_entities_to_dict) on the re3d test set,
+    - SentimentAnalyser.headline_analyser,
+    - format_output, on the recorded sources of the unit tests,
+    - FileHandler.get_keywords_from_target_info, loading a target info snapshot.
+
+The models always run on an empty, in-memory inference cache, so their real cost is measured, and
+the benchmarks never add to the pipeline's metrics. Benchmarks whose dependencies (a model,
+pandas) aren't available are skipped.
+
+Save a baseline on a quiet machine, then compare later runs with it: the run fails (exit status 1)
+if any benchmark is more than --threshold slower than its baseline.
+
+    python -m benchmarks.micro_benchmarks --save_baseline
+    python -m benchmarks.micro_benchmarks --threshold 0.25
+"""
+import argparse
+import atexit
+import csv
+import importlib.util
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from auto_osint_v import inference_cache, metrics
+from auto_osint_v.entity_store import EntityStore
+from auto_osint_v.file_handler import FileHandler
+from auto_osint_v.inference_cache import InferenceCache
+from auto_osint_v.metrics import MetricsRegistry
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# recorded data
+RE3D_TEST_PATH = os.path.join(REPO_PATH, "auto_osint_v", "NER_training_testing", "test",
+                              "re3d-test.conll")
+SOURCES_PATH = os.path.join(REPO_PATH, "unit_tests", "sources_test.csv")
+# path of the default baseline, it is specific to the machine it was measured on
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+# seed of the synthetic data
+SEED = 1234
+
+# every benchmark, by name, in the order they are run
+BENCHMARKS = {}
+
+
+class Benchmark:
+    """A function to time, and the work it does.
+    """
+
+    def __init__(self, name, setup, unit, requires=()):
+        """Initialises the Benchmark object.
+
+        Args:
+            name: the name of the benchmark.
+            setup: function preparing the data and returning (function to time, amount of work
+                done by each call), the work is counted in units.
+            unit: the unit of work, e.g. 'words'.
+            requires: modules that must be installed for the benchmark to run.
+        """
+        self.name = name
+        self.setup = setup
+        self.unit = unit
+        self.requires = tuple(requires)
+
+    def missing(self):
+        """Gets the required modules that aren't installed."""
+        return [module for module in self.requires if importlib.util.find_spec(module) is None]
+
+
+def benchmark(name, unit, requires=()):
+    """Registers a setup function as a benchmark, see Benchmark."""
+    def register(setup):
+        BENCHMARKS[name] = Benchmark(name, setup, unit, requires)
+        return setup
+    return register
+
+
+@contextmanager
+def isolated_metrics():
+    """Records the metrics of the code in the with block into an in-memory database."""
+    saved_metrics = metrics._METRICS
+    metrics._METRICS = MetricsRegistry(":memory:")
+    try:
+        yield
+    finally:
+        metrics._METRICS = saved_metrics
+
+
+def empty_cache():
+    """Gives the models an empty, in-memory inference cache, so the next texts are all misses."""
+    inference_cache._CACHE = InferenceCache(":memory:")
+
+
+def temporary_directory():
+    """Creates a directory for a benchmark's files, deleted when the benchmarks finish."""
+    directory = tempfile.mkdtemp(prefix="auto_osint_v_benchmark_")
+    atexit.register(shutil.rmtree, directory, True)
+    return directory
+
+
+def load_re3d(file_path=RE3D_TEST_PATH):
+    """Reads the sentences and labelled entities of a CoNLL file.
+
+    Returns:
+        (list of sentences, list of entity texts), the tokens are joined by spaces
+    """
+    sentences, entities = [], []
+    tokens, entity = [], []
+    with open(file_path, encoding="utf-8") as conll_file:
+        for line in list(conll_file) + [""]:
+            fields = line.split()
+            tag = fields[1] if len(fields) == 2 else "O"
+            if entity and not tag.startswith("I-"):
+                entities.append(" ".join(entity))
+                entity = []
+            if tag != "O":
+                entity.append(fields[0])
+            if fields:
+                tokens.append(fields[0])
+            elif tokens:
+                sentences.append(" ".join(tokens))
+                tokens = []
+    return sentences, entities
+
+
+def synthetic_words(rng, count):
+    """Generates pseudo-words, e.g. 'lovaki'."""
+    syllables = ["ka", "lo", "vi", "ra", "ne", "to", "mu", "si", "de", "pa", "gri", "ost"]
+    return ["".join(rng.choice(syllables) for _ in range(rng.randint(1, 4)))
+            for _ in range(count)]
+
+
+def synthetic_entities(rng, count):
+    """Generates entities of one to three capitalised words."""
+    return [" ".join(word.capitalize() for word in synthetic_words(rng, rng.randint(1, 3)))
+            for _ in range(count)]
+
+
+def synthetic_text(rng, entities, words):
+    """Generates a text of about the given number of words, mentioning some of the entities."""
+    vocabulary = synthetic_words(rng, 2000)
+    chunks = []
+    for _ in range(words // 10):
+        sentence = rng.choices(vocabulary, k=10)
+        if rng.random() < 0.3:
+            sentence[rng.randrange(10)] = rng.choice(entities) + "'s"
+        chunks.append(" ".join(sentence).capitalize() + ".")
+    return " ".join(chunks)
+
+
+def synthetic_html(rng, paragraphs):
+    """Generates a news page with scripts, styles, navigation and the given number of paragraphs."""
+    entities = synthetic_entities(rng, 50)
+    navigation = "".join(f'<li><a href="/{word}">{word}</a></li>'
+                         for word in synthetic_words(rng, 40))
+    body = "".join(f"<p>{synthetic_text(rng, entities, 80)}</p>\n  <div class='ad'>  </div>"
+                   for _ in range(paragraphs))
+    return ("<!DOCTYPE html><html><head><title>Synthetic article</title>"
+            "<style>body { font-family: sans-serif; }</style>"
+            "<script>window.dataLayer = window.dataLayer || [];</script></head>"
+            f"<body><nav><ul>{navigation}</ul></nav><article><h1>Headline  Subtitle</h1>{body}"
+            "</article><script>console.log('loaded');</script></body></html>")
+
+
+@benchmark("count_entities_synthetic", "words")
+def count_entities_synthetic():
+    """Counts 300 entities in a 20,000 word page."""
+    from auto_osint_v.priority_manager import count_entities
+    rng = random.Random(SEED)
+    entities = synthetic_entities(rng, 300)
+    text = synthetic_text(rng, entities, 20000)
+    return lambda: count_entities(entities, text), len(text.split())
+
+
+@benchmark("count_entities_re3d", "words")
+def count_entities_re3d():
+    """Counts the labelled entities of the re3d test set in its sentences."""
+    from auto_osint_v.priority_manager import count_entities
+    sentences, entities = load_re3d()
+    text = "\n".join(sentences)
+    return lambda: count_entities(entities, text), len(text.split())
+
+
+@benchmark("extract_text", "bytes", requires=("lxml",))
+def extract_text_html():
+    """Extracts the text of a 200 paragraph page."""
+    from auto_osint_v.priority_manager import extract_text
+    html = synthetic_html(random.Random(SEED), 200)
+    return lambda: extract_text(html), len(html.encode("utf-8"))
+
+
+@benchmark("get_entities_and_count_re3d", "words", requires=("spacy",))
+def get_entities_and_count_re3d():
+    """Finds and counts the entities of the re3d test set sentences, with an empty cache."""
+    from auto_osint_v.specific_entity_processor import EntityProcessor, get_ner
+    sentences, _ = load_re3d()
+    processor = EntityProcessor(None)
+    get_ner()
+
+    def run():
+        empty_cache()
+        processor.get_entities_and_count(list(sentences), {})
+    return run, sum(len(sentence.split()) for sentence in sentences)
+
+
+@benchmark("headline_analyser", "headlines", requires=("transformers", "torch"))
+def headline_analyser():
+    """Analyses the sentiment of 50 headlines, with an empty cache."""
+    from auto_osint_v.sentiment_analyser import SentimentAnalyser
+    sentences, _ = load_re3d()
+    headlines = [" ".join(sentence.split()[:12]) for sentence in sentences[:50]]
+    analyser = SentimentAnalyser("", "benchmark", None)
+
+    def run():
+        empty_cache()
+        for headline in headlines:
+            analyser.headline_analyser(headline)
+    return run, len(headlines)
+
+
+@benchmark("format_output", "rows", requires=("pandas",))
+def format_output_sources():
+    """Formats the recorded sources of the unit tests, repeated to 500 sources."""
+    from auto_osint_v.__main__ import format_output
+    with open(SOURCES_PATH, encoding="utf-8") as sources_file:
+        recorded = list(csv.DictReader(sources_file))
+    sources = [recorded[i % len(recorded)] for i in range(500)]
+    data_directory = temporary_directory()
+    file_handler = FileHandler(data_directory + os.sep)
+    file_handler.open_evidence_file(["sentiment-analysis-of-benchmark",
+                                     "neutral sentiment, score: 0.9"])
+    with open(os.path.join(data_directory, "bias_sources.csv"), "w", encoding="utf-8") as bias:
+        bias.write("Type/Link,Key Info,Info Sentiment\nHUMINT,Benchmark,neutral\n")
+    return lambda: format_output(sources, file_handler), len(sources)
+
+
+@benchmark("get_keywords_from_target_info", "entities")
+def get_keywords_from_target_info():
+    """Loads a snapshot of 2,000 target entities and gets their keywords."""
+    rng = random.Random(SEED)
+    data_directory = temporary_directory()
+    store = EntityStore()
+    labels = ["Person", "Location", "Organisation", "Weapon", "MilitaryPlatform"]
+    for entity in synthetic_entities(rng, 2000):
+        store.add(rng.choice(labels), rng.choice([entity, entity.upper(), entity + "'s"]))
+    store.write_snapshot(os.path.join(data_directory, "target_info.csv"))
+    return (lambda: FileHandler(data_directory + os.sep).get_keywords_from_target_info(),
+            len(store))
+
+
+def time_function(function, repeat=5, min_time=0.2):
+    """Times a function, calling it enough times for each measurement to take at least min_time.
+
+    Args:
+        function: the function to time.
+        repeat: the number of measurements.
+        min_time: the shortest time of a measurement, in seconds.
+
+    Returns:
+        list of the time taken by one call, in seconds, for each measurement
+    """
+    # the first call warms up caches (e.g. memoised entity keys), as in a real run
+    start = time.perf_counter()
+    function()
+    calls = max(1, int(min_time / max(time.perf_counter() - start, 1e-9)))
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        timings.append((time.perf_counter() - start) / calls)
+    return timings
+
+
+def run_benchmarks(names=None, repeat=5, min_time=0.2):
+    """Runs the benchmarks.
+
+    Args:
+        names: Optional names of the benchmarks to run, by default all of them.
+        repeat: the number of measurements of each benchmark.
+        min_time: the shortest time of a measurement, in seconds.
+
+    Returns:
+        dictionary of name -> result, with the median 'seconds' per call, the 'units' of work per
+        call and the 'unit', or the reason it was 'skipped'
+    """
+    results = {}
+    with isolated_metrics():
+        saved_cache = inference_cache._CACHE
+        try:
+            for name, bench in BENCHMARKS.items():
+                if names and name not in names:
+                    continue
+                missing = bench.missing()
+                if missing:
+                    results[name] = {"skipped": f"{', '.join(missing)} not installed"}
+                    continue
+                try:
+                    function, units = bench.setup()
+                except Exception as error:
+                    # e.g. a model that can't be loaded or downloaded here
+                    results[name] = {"skipped": f"{type(error).__name__}: {error}"}
+                    continue
+                timings = time_function(function, repeat, min_time)
+                results[name] = {"seconds": statistics.median(timings), "units": units,
+                                 "unit": bench.unit}
+        finally:
+            inference_cache._CACHE = saved_cache
+    return results
+
+
+def compare(results, baseline, threshold=0.25):
+    """Finds the benchmarks that got slower than their baseline.
+
+    Args:
+        results: the results of run_benchmarks.
+        baseline: earlier results of run_benchmarks.
+        threshold: the slowdown allowed, e.g. 0.25 for 25% slower.
+
+    Returns:
+        list of (name, baseline seconds, seconds) for each benchmark slower than allowed
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name, {})
+        if "seconds" in result and "seconds" in before \
+                and result["seconds"] > before["seconds"] * (1 + threshold):
+            regressions.append((name, before["seconds"], result["seconds"]))
+    return regressions
+
+
+def load_baseline(file_path=BASELINE_PATH):
+    """Loads the benchmark results saved as a baseline, or an empty baseline if there is none."""
+    try:
+        with open(file_path, encoding="utf-8") as baseline_file:
+            return json.load(baseline_file)["benchmarks"]
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(results, file_path=BASELINE_PATH):
+    """Saves benchmark results as the baseline, with the machine they were measured on."""
+    baseline = {"machine": platform.platform(), "processor": platform.processor(),
+                "python": platform.python_version(),
+                "benchmarks": {name: result for name, result in results.items()
+                               if "seconds" in result}}
+    with open(file_path + ".tmp", "w", encoding="utf-8") as baseline_file:
+        json.dump(baseline, baseline_file, indent=2)
+    os.replace(file_path + ".tmp", file_path)
+
+
+def report(results, baseline):
+    """Gets the results and their change from the baseline, as a printable table."""
+    lines = ["Benchmark: time per call, throughput, change from baseline"]
+    for name, result in results.items():
+        if "skipped" in result:
+            lines.append(f"{name}: skipped ({result['skipped']})")
+            continue
+        line = (f"{name}: {result['seconds'] * 1000:.2f}ms, "
+                f"{result['units'] / result['seconds']:,.0f} {result['unit']}/s")
+        if name in baseline:
+            line += f", {result['seconds'] / baseline[name]['seconds'] - 1:+.1%}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    """Interprets the command line arguments of the benchmark runner."""
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.micro_benchmarks")
+    parser.add_argument("--baseline", default=BASELINE_PATH,
+                        help="Path of the baseline results (default: benchmarks/baseline.json)")
+    parser.add_argument("--save_baseline", action="store_true",
+                        help="Save the results as the new baseline rather than comparing them")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Fail if a benchmark is this much slower than its baseline, e.g. "
+                             "0.25 for 25%% slower (default: 0.25)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Number of measurements of each benchmark (default: 5)")
+    parser.add_argument("--min_time", type=float, default=0.2,
+                        help="Shortest time of a measurement, in seconds (default: 0.2)")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), metavar="BENCHMARK",
+                        help="Only run these benchmarks")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Runs the benchmarks and compares them with the baseline.
+
+    Returns:
+        the exit status: 1 if a benchmark regressed, otherwise 0
+    """
+    args = parse_args(argv)
+    results = run_benchmarks(args.only, args.repeat, args.min_time)
+    baseline = load_baseline(args.baseline)
+    print(report(results, baseline))
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+        print(f"Saved the baseline to {args.baseline}")
+        return 0
+    if not baseline:
+        print("No baseline to compare with, save one with --save_baseline")
+        return 0
+    regressions = compare(results, baseline, args.threshold)
+    for name, before, after in regressions:
+        print(f"REGRESSION {name}: {before * 1000:.2f}ms -> {after * 1000:.2f}ms "
+              f"(more than {args.threshold:.0%} slower)")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""Unit test for the priority manager's anytime ranking, with stubbed fetches"""
+import time
+from contextlib import contextmanager, redirect_stderr
+from io import StringIO
+from multiprocessing.pool import ThreadPool
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+from auto_osint_v.__main__ import parse_args
+from auto_osint_v.priority_manager import PriorityManager, prior_score
+
+ENTITIES = ["Wagner", "Bakhmut", "Soledar"]
+
+
+@contextmanager
+def thread_pool(*args, **kwargs):
+    """Stands in for fetch_pool: one thread, so the sources are fetched in priority order."""
+    with ThreadPool(1) as pool:
+        yield pool
+
+
+class TestAnytimeManager(TestCase):
+    """Provides test cases for PriorityManager.anytime_manager"""
+    def rank(self, sources, texts, delays=None, **budget):
+        """Ranks the sources with the given page texts, returning the ranked and fetched URLs."""
+        delays = delays or {}
+        fetched = []
+
+        def get_text_from_site(url):
+            fetched.append(url)
+            time.sleep(delays.get(url, 0))
+            return texts.get(url, "")
+        file_handler = SimpleNamespace(get_keywords_from_target_info=lambda: ENTITIES)
+        priority_manager = PriorityManager(file_handler, None, sources)
+        with patch("auto_osint_v.priority_manager.fetch_pool", thread_pool), \
+                patch.object(PriorityManager, "get_text_from_site",
+                             staticmethod(get_text_from_site)):
+            ranked = priority_manager.anytime_manager(**budget)
+        priority_manager.close()
+        return [source.url for source in ranked], list(priority_manager.entity_counts), fetched
+
+    def test_prior_score(self):
+        """Checks the prior only uses the title and description of a source"""
+        source = {"url": "https://example.com/wagner", "title": "Wagner Group in Bakhmut",
+                  "description": "Mercenaries advance on the city."}
+        self.assertEqual(prior_score(ENTITIES, source), 2)
+        self.assertEqual(prior_score(["example"], source), 0)
+
+    def test_stops_when_top_k_is_stable(self):
+        """Scoring stops once the top-k hasn't changed for top_k sources"""
+        sources = [{"url": f"https://{i}.com", "title": "Wagner" if i < 2 else "",
+                    "description": ""} for i in range(20)]
+        texts = {"https://0.com": "Wagner in Bakhmut", "https://1.com": "Wagner"}
+        ranked, scored, _ = self.rank(sources, texts, top_k=2, fetch_budget=20)
+        self.assertEqual(ranked, ["https://0.com", "https://1.com"])
+        # the top 2 was the same after the 3rd and 4th sources
+        self.assertEqual(scored, [f"https://{i}.com" for i in range(4)])
+
+    def test_stops_on_the_fetch_budget(self):
+        """Only the fetch budget's most promising sources are fetched"""
+        sources = [{"url": f"https://{i}.com", "title": " ".join(ENTITIES[:i]),
+                    "description": ""} for i in range(4)]
+        sources += [{"url": f"https://{i}.com", "title": "", "description": ""}
+                    for i in range(4, 8)]
+        texts = {source["url"]: source["title"] for source in sources}
+        ranked, scored, fetched = self.rank(sources, texts, top_k=5, fetch_budget=3)
+        self.assertEqual(fetched, ["https://3.com", "https://2.com", "https://1.com"])
+        self.assertEqual(scored, fetched)
+        self.assertEqual(ranked, fetched)
+
+    def test_stops_on_the_time_budget(self):
+        """Sources not scored in time are dropped, and the rest are ranked by score"""
+        sources = [{"url": f"https://{i}.com", "title": " ".join(ENTITIES[:3 - i // 2]),
+                    "description": ""} for i in range(6)]
+        # the most promising sources score lowest, and the later sources are slow
+        texts = {"https://0.com": "Wagner", "https://1.com": "Wagner",
+                 "https://2.com": "Wagner in Bakhmut", "https://3.com": "Wagner in Bakhmut",
+                 "https://4.com": "Wagner in Bakhmut near Soledar"}
+        delays = {"https://4.com": 1.0, "https://5.com": 1.0}
+        ranked, scored, _ = self.rank(sources, texts, delays, top_k=10, time_budget=0.5)
+        self.assertEqual(sorted(scored), [f"https://{i}.com" for i in range(4)])
+        self.assertEqual(sorted(ranked[:2]), ["https://2.com", "https://3.com"])
+        self.assertEqual(sorted(ranked[2:]), ["https://0.com", "https://1.com"])
+
+    def test_budgets_and_broker_are_exclusive(self):
+        """Anytime ranking fetches locally, so it can't be combined with a work queue broker"""
+        self.assertEqual(parse_args(["--fetch_budget", "5"]).fetch_budget, 5)
+        with redirect_stderr(StringIO()), self.assertRaises(SystemExit):
+            parse_args(["--time_budget", "60", "--broker", "broker.sqlite"])
@@ -0,0 +1,45 @@
+"""Unit test for the checkpointer"""
+import os
+import tempfile
+from unittest import TestCase
+from auto_osint_v.checkpoint import Checkpointer
+from auto_osint_v.source_record import SourceRecord
+
+
+class TestCheckpointer(TestCase):
+    """Provides test cases for saving, loading and clearing checkpoints"""
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.checkpointer = Checkpointer("Russian forces crossed the river.", self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_save_and_load(self):
+        """Checkpoints are loaded as they were saved, and only completed stages are reported"""
+        self.assertIsNone(self.checkpointer.load("sources"))
+        self.assertEqual(self.checkpointer.load("searches", {}), {})
+        sources = [SourceRecord("https://example.com", "title", "description", score=3)]
+        self.checkpointer.save("sources", sources)
+        self.checkpointer.save("queries", (["query"], [["Russia"]]))
+        loaded = self.checkpointer.load("sources")
+        self.assertEqual(loaded[0].url, "https://example.com")
+        self.assertEqual(loaded[0].score, 3)
+        self.assertEqual(self.checkpointer.completed(), ["queries", "sources"])
+        # no temporary files are left behind
+        self.assertEqual(sorted(os.listdir(self.checkpointer.directory)),
+                         ["queries.pickle", "sources.pickle"])
+        with self.assertRaises(ValueError):
+            self.checkpointer.save("unknown", [])
+
+    def test_statements_and_clear(self):
+        """Each statement has its own checkpoints, and clearing only removes its own"""
+        other = Checkpointer("A different statement.", self.tmp_dir.name)
+        self.checkpointer.save("scores", [])
+        other.save("scores", [1])
+        self.checkpointer.clear()
+        self.assertEqual(self.checkpointer.completed(), [])
+        self.assertEqual(other.load("scores"), [1])
+        # the same statement, with different surrounding whitespace, shares the checkpoints
+        same = Checkpointer("  Russian forces crossed the river.\n", self.tmp_dir.name)
+        self.assertEqual(same.directory, self.checkpointer.directory)
@@ -0,0 +1,57 @@
+"""Unit test for the entity normaliser"""
+import json
+import os
+import tempfile
+from unittest import TestCase
+from auto_osint_v.entity_normaliser import EntityNormaliser, load_normaliser
+
+
+class TestEntityNormaliser(TestCase):
+    """Provides test cases for normalising, deduplicating and counting entities"""
+    def setUp(self):
+        self.normaliser = EntityNormaliser({"Russian Ministry of Defence": ["Russian MoD"]})
+
+    def test_keys_and_aliases(self):
+        """Case, whitespace, punctuation, possessives and aliases give the same canonical key"""
+        self.assertEqual(self.normaliser.key("  Wagner   Group's "), "wagner group")
+        self.assertEqual(self.normaliser.key("T-72"), "t 72")
+        self.assertEqual(self.normaliser.canonical("the Russian M.o.D"), "the russian m o d")
+        self.assertEqual(self.normaliser.canonical("RUSSIAN MoD"), "russian ministry of defence")
+        self.assertTrue(self.normaliser.is_stopword("They"))
+        self.assertTrue(self.normaliser.is_stopword("--"))
+        self.assertFalse(self.normaliser.is_stopword("Bakhmut"))
+        self.assertEqual(self.normaliser.deduplicate(["Russian MoD", "he", "Bakhmut",
+                                                      "Russian Ministry of Defence", "bakhmut"]),
+                         ["Russian MoD", "Bakhmut"])
+
+    def test_count(self):
+        """Entities are counted on whole words, in any of their forms"""
+        text = "The Russian Ministry of Defence said Russian MoD troops left Bakhmut. " \
+               "Russians returned to bakhmut's outskirts."
+        self.assertEqual(self.normaliser.count(["Russian MoD", "Bakhmut", "Russia", "it"], text),
+                         {"Russian MoD": 2, "Bakhmut": 2})
+        self.assertEqual(self.normaliser.count([], text), {})
+
+    def test_lemmatiser_and_config(self):
+        """A lemmatiser matches word forms, and aliases and stopwords can be configured"""
+        normaliser = EntityNormaliser(lemmatiser=lambda word: word.rstrip("s"))
+        self.assertEqual(normaliser.count(["tank"], "Two tanks and a tank."), {"tank": 2})
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config_path = os.path.join(tmp_dir, "entity_normalisation.json")
+            with open(config_path, "w", encoding="utf-8") as config_file:
+                json.dump({"aliases": {"Kyiv": ["Kiev"]}, "stopwords": ["this"]}, config_file)
+            normaliser = load_normaliser(config_path)
+            self.assertIsNotNone(load_normaliser(os.path.join(tmp_dir, "missing.json")))
+        self.assertEqual(normaliser.canonical("Kiev"), "kyiv")
+        self.assertTrue(normaliser.is_stopword("This"))
+        self.assertTrue(normaliser.is_stopword("our"))
+
+    def test_memo_is_bounded(self):
+        """The memoised keys and lemmas are emptied when full, so they don't grow with the run"""
+        normaliser = EntityNormaliser(lemmatiser=lambda word: word.rstrip("s"))
+        normaliser.max_memoised = 10
+        for i in range(25):
+            self.assertEqual(normaliser.key(f"Tanks {i}"), f"tank {i}")
+            self.assertLessEqual(len(normaliser._keys), 10)
+            self.assertLessEqual(len(normaliser._lemmas), 10)
+        self.assertEqual(normaliser.key("Tanks 0"), "tank 0")
@@ -0,0 +1,33 @@
+"""Unit test for the target entity store"""
+import os
+import tempfile
+from unittest import TestCase
+from auto_osint_v.entity_store import EntityStore
+
+
+class TestEntityStore(TestCase):
+    """Provides test cases for the EntityStore class"""
+    def test_add_and_lookup(self):
+        """Entities are counted once per text and can be looked up by label or normalised text"""
+        store = EntityStore()
+        store.add("Location", "Bakhmut")
+        store.add("Location", "Bakhmut")
+        store.add("Organisation", "Wagner  Group")
+        store.add("Person", "he")
+        self.assertEqual(store.by_label("Location"), [("Bakhmut", 2)])
+        self.assertEqual(store.lookup("wagner group"), ("Wagner  Group", "Organisation", 1))
+        self.assertIsNone(store.lookup("Soledar"))
+        self.assertEqual(store.keywords(), ["Bakhmut", "Wagner  Group"])
+
+    def test_snapshot(self):
+        """A snapshot written to disk loads back into an identical store"""
+        store = EntityStore()
+        store.add("Location", "Bakhmut", 3)
+        store.add("Organisation", "Wagner, PMC")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            snapshot_path = os.path.join(tmp_dir, "target_info.csv")
+            store.write_snapshot(snapshot_path)
+            loaded = EntityStore()
+            loaded.load_snapshot(snapshot_path)
+        self.assertEqual(loaded.by_label("Location"), [("Bakhmut", 3)])
+        self.assertEqual(loaded.keywords(), store.keywords())
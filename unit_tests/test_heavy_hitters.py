@@ -0,0 +1,95 @@
+"""Unit test for the heavy hitters tracker"""
+import random
+from collections import Counter
+from contextlib import contextmanager
+from unittest import TestCase
+from unittest.mock import patch
+from auto_osint_v.heavy_hitters import SpaceSaving
+from auto_osint_v.popular_information_finder import PopularInformationFinder
+
+
+class TestSpaceSaving(TestCase):
+    """Provides test cases for the SpaceSaving class"""
+    def test_exact_below_capacity(self):
+        """Counts are exact while there are no more items than counters"""
+        summary = SpaceSaving(capacity=10)
+        summary.update(["Bakhmut", "Wagner", "Bakhmut", "Soledar", "Bakhmut", "Wagner"])
+        self.assertEqual(summary.top(2), [("Bakhmut", 3), ("Wagner", 2)])
+        self.assertEqual(summary.distinct(), 3)
+        with self.assertRaises(ValueError):
+            SpaceSaving(capacity=0)
+
+    def test_bounded_memory(self):
+        """Frequent items are found in a long stream, with a fixed number of counters"""
+        rng = random.Random(0)
+        stream = [f"rare{rng.randrange(5000)}" for _ in range(20000)]
+        stream += ["Bakhmut"] * 900 + ["Wagner"] * 600 + ["Soledar"] * 400
+        rng.shuffle(stream)
+        summary = SpaceSaving(capacity=100)
+        summary.update(stream)
+        self.assertLessEqual(len(summary), 100)
+        self.assertLessEqual(len(summary._heap), 400)
+        self.assertIsNone(summary.distinct())
+        self.assertEqual([item for item, _ in summary.top(3)], ["Bakhmut", "Wagner", "Soledar"])
+        exact = Counter(stream)
+        for item, count in summary.top(3):
+            # counts are overestimated by at most total / capacity
+            self.assertGreaterEqual(count, exact[item])
+            self.assertLessEqual(count, exact[item] + summary.total / summary.capacity)
+
+    def test_popular_entities(self):
+        """The popular entities are the top 10% of the entities found, and at most 30"""
+        finder = PopularInformationFinder(None, None)
+        for i in range(5):
+            finder._add_source_entities(f"https://{i}.com", ["bakhmut"] + [f"entity{i}{j}"
+                                                                          for j in range(3)])
+        finder._add_source_entities("https://5.com", ["wagner group", "bakhmut"])
+        # 17 entities found, so only the most popular one is kept
+        self.assertEqual(finder.popular_entities(), ["bakhmut"])
+        self.assertEqual(finder.source_entities["https://5.com"], ["wagner group", "bakhmut"])
+        finder = PopularInformationFinder(None, None, capacity=50)
+        for i in range(100):
+            finder._add_source_entities(f"https://{i}.com", [f"entity{i}", "bakhmut"])
+        self.assertEqual(len(finder.popular_entities()), 30)
+        self.assertEqual(finder.popular_entities()[0], "bakhmut")
+
+    def test_source_entities_are_pruned(self):
+        """Only the entities that can still be popular are kept for each source"""
+        finder = PopularInformationFinder(None, None, capacity=20)
+        for i in range(1000):
+            finder._add_source_entities(f"https://{i}.com",
+                                        ["bakhmut", "wagner group"] + [f"rare{i}{j}"
+                                                                       for j in range(5)],
+                                        found=i == 0)
+        finder._prune_source_entities()
+        kept = sum(len(entities) for entities in finder.source_entities.values())
+        self.assertLessEqual(kept, 2 * 1000 + 20)
+        self.assertEqual(finder.source_entities["https://0.com"], ["bakhmut", "wagner group"])
+        self.assertEqual(finder.popular_entities()[:2], ["bakhmut", "wagner group"])
+        # the complete NER results are kept for storing, and only for the sources NER ran on
+        self.assertEqual(finder.found_entities, {"https://0.com": ["bakhmut", "wagner group"] +
+                                                 [f"rare0{j}" for j in range(5)]})
+
+    def test_local_ner_pool(self):
+        """The NER pool is only started for tasks, in one chunk per worker"""
+        chunksizes = []
+
+        class FakePool:
+            """Stands in for the NER pool, finding no entities."""
+            @staticmethod
+            def imap_unordered(function, tasks, chunksize):
+                chunksizes.append(chunksize)
+                return [(url, []) for url, _ in tasks]
+
+        @contextmanager
+        def ner_pool(stage, max_workers):
+            self.assertEqual(max_workers, 3)
+            yield FakePool()
+        finder = PopularInformationFinder(None, None)
+        with patch("auto_osint_v.popular_information_finder.ner_pool", ner_pool), \
+                patch("auto_osint_v.popular_information_finder.pool_size", return_value=3):
+            finder._find_entities_locally([])
+            self.assertEqual(chunksizes, [])
+            finder._find_entities_locally([(f"https://{i}.com", None) for i in range(7)])
+        self.assertEqual(chunksizes, [3])
+        self.assertEqual(len(finder.found_entities), 7)
@@ -0,0 +1,103 @@
+"""Unit test for the per-host request scheduler"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase, mock
+from auto_osint_v import host_scheduler
+from auto_osint_v.host_scheduler import HostScheduler, get_scheduler
+from auto_osint_v.priority_manager import PriorityManager
+
+
+class ForbiddenHandler(BaseHTTPRequestHandler):
+    """Turns away every request, like a social media site does with scripted clients."""
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Responds 403 Forbidden."""
+        self.send_response(403)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """Keeps the test output quiet."""
+
+
+class FallbackReached(Exception):
+    """Raised by the stand-in browser, showing that the Selenium fallback was reached."""
+
+
+class TestHostScheduler(TestCase):
+    """Provides test cases for the HostScheduler class"""
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.scheduler = HostScheduler(os.path.join(self.tmp_dir.name, "hosts.sqlite"))
+
+    def tearDown(self):
+        self.scheduler.close()
+        self.tmp_dir.cleanup()
+
+    def test_timeout_adapts_to_latency(self):
+        """Hosts with no history get the maximum timeout, fast hosts get a shorter one"""
+        url = "https://fast.com/article"
+        self.assertEqual(self.scheduler.timeout(url, 10), 10)
+        for _ in range(10):
+            self.scheduler.record_success(url, 0.5)
+        self.assertLess(self.scheduler.timeout("https://fast.com/other", 10), 2)
+        self.assertGreaterEqual(self.scheduler.timeout(url, 10), self.scheduler.min_timeout)
+
+    def test_failed_urls_are_skipped(self):
+        """A failed URL is skipped until its entry is cleared, other URLs on the host are not"""
+        url = "https://example.com/missing"
+        self.scheduler.record_failure(url, 0.2, 404)
+        self.assertFalse(self.scheduler.allow(url))
+        self.assertTrue(self.scheduler.allow("https://example.com/other"))
+        self.scheduler.clear_failure(url)
+        self.assertTrue(self.scheduler.allow(url))
+
+    def test_circuit_breaker(self):
+        """A host that keeps failing is skipped until it recovers"""
+        for i in range(self.scheduler.failure_threshold):
+            self.scheduler.record_failure(f"https://down.com/{i}", 5.0)
+        self.assertFalse(self.scheduler.allow("https://down.com/new"))
+        self.assertTrue(self.scheduler.allow("https://up.com/new"))
+        self.scheduler.record_success("https://down.com/new", 1.0)
+        self.assertTrue(self.scheduler.allow("https://down.com/new"))
+
+    def test_blocked_requests_leave_the_circuit(self):
+        """A blocked request neither opens a host's circuit nor extends its cool-down"""
+        self.scheduler.cool_down = 0.2
+        for i in range(self.scheduler.failure_threshold):
+            self.scheduler.record_failure(f"https://down.com/{i}", 5.0)
+        self.scheduler.record_blocked("https://down.com/blocked", 1.0)
+        self.assertFalse(self.scheduler.allow("https://down.com/new"))
+        time.sleep(0.15)
+        self.scheduler.record_blocked("https://down.com/blocked", 1.0)
+        time.sleep(0.1)
+        self.assertTrue(self.scheduler.allow("https://down.com/new"))
+        self.scheduler.record_blocked("https://up.com/blocked", 1.0)
+        self.assertTrue(self.scheduler.allow("https://up.com/new"))
+
+    def test_blocked_responses_reach_the_fallback(self):
+        """A 403 doesn't skip the URL or open the circuit, so scoring can fall back to a browser"""
+        server = ThreadingHTTPServer(("127.0.0.1", 0), ForbiddenHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/post"
+        try:
+            with mock.patch.object(host_scheduler, "_SCHEDULER", self.scheduler):
+                # the media fetch of source aggregation
+                for _ in range(self.scheduler.failure_threshold):
+                    self.assertEqual(get_scheduler().get(url, max_timeout=10).status_code, 403)
+                self.assertTrue(self.scheduler.allow(url))
+                selenium = mock.MagicMock()
+                selenium.common.exceptions.SessionNotCreatedException = RuntimeError
+                seleniumwire = mock.MagicMock()
+                seleniumwire.webdriver.Chrome.side_effect = FallbackReached
+                modules = {"selenium": selenium, "selenium.common": selenium.common,
+                           "selenium.common.exceptions": selenium.common.exceptions,
+                           "seleniumwire": seleniumwire}
+                with mock.patch.dict(sys.modules, modules), self.assertRaises(FallbackReached):
+                    PriorityManager.get_text_from_site(url)
+        finally:
+            server.shutdown()
+            server.server_close()
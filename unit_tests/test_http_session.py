@@ -0,0 +1,79 @@
+"""Unit test for the shared HTTP session"""
+import gzip
+import importlib.util
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+import requests
+from auto_osint_v.http_session import HTTPSession
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    """Serves a gzip compressed page, recording the headers and client port of each request"""
+    protocol_version = "HTTP/1.1"
+    requests_seen = []
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serves the page"""
+        self.requests_seen.append((dict(self.headers), self.client_address[1]))
+        body = gzip.compress(b"<html><body>Wagner Group in Bakhmut</body></html>")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHTTPSession(TestCase):
+    """Provides test cases for the HTTPSession class"""
+    def setUp(self):
+        PageHandler.requests_seen = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/page"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+
+    def check_session(self, session):
+        """Fetches the page twice, checking the headers, decompression and connection reuse"""
+        try:
+            for _ in range(2):
+                response = session.get(self.url, timeout=5)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn("Wagner Group", response.text)
+                self.assertEqual(response.headers["content-type"], "text/html; charset=utf-8")
+            response = session.get(self.url, timeout=5, headers={"User-Agent": "test"})
+        finally:
+            session.close()
+        (first_headers, first_port), (_, second_port), (third_headers, _) = \
+            PageHandler.requests_seen
+        self.assertIn("Chrome", first_headers["User-Agent"])
+        self.assertIn("gzip", first_headers["Accept-Encoding"])
+        self.assertEqual(third_headers["User-Agent"], "test")
+        # the second request reused the first request's connection
+        self.assertEqual(first_port, second_port)
+
+    def test_requests_session(self):
+        """The requests session sends browser headers over a kept-alive connection"""
+        self.check_session(HTTPSession(http2=False))
+
+    @unittest.skipIf(importlib.util.find_spec("httpx") is None, "httpx is not installed")
+    def test_httpx_session(self):
+        """The httpx session gives the same responses as requests"""
+        self.check_session(HTTPSession(http2=True))
+
+    def test_errors_are_requests_errors(self):
+        """Failed requests raise requests' exceptions"""
+        session = HTTPSession(http2=False)
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            session.get("http://127.0.0.1:1/", timeout=1)
+        session.close()
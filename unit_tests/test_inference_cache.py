@@ -0,0 +1,80 @@
+"""Unit test for the model inference cache"""
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+from auto_osint_v.inference_cache import InferenceCache
+from auto_osint_v.specific_entity_processor import ner_document_entities
+
+
+class TestInferenceCache(TestCase):
+    """Provides test cases for the InferenceCache class"""
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = InferenceCache(os.path.join(self.tmp_dir.name, "cache.sqlite"),
+                                    max_entries=10)
+        self.inferred = []
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp_dir.cleanup()
+
+    def infer(self, texts):
+        """A fake model giving the length of each text, remembering what it was given."""
+        self.inferred.extend(texts)
+        return [len(text) for text in texts]
+
+    def test_repeated_texts_are_inferred_once(self):
+        """Duplicate and previously seen texts never reach the model"""
+        self.assertEqual(self.cache.map("model", "1", ["a", "bb", "a"], self.infer), [1, 2, 1])
+        self.assertEqual(self.cache.map("model", "1", ["bb", "ccc"], self.infer), [2, 3])
+        self.assertEqual(self.inferred, ["a", "bb", "ccc"])
+        self.assertEqual(self.cache.stats(), {"model": (2, 3)})
+
+    def test_versions_are_separate(self):
+        """A new model version does not reuse the results of the old one"""
+        self.cache.map("model", "1", ["a"], self.infer)
+        self.cache.map("model", "2", ["a"], self.infer)
+        self.assertEqual(self.inferred, ["a", "a"])
+
+    def test_eviction(self):
+        """The cache never grows beyond max_entries"""
+        self.cache.map("model", "1", [str(i) for i in range(25)], self.infer)
+        count = self.cache.connection.execute("SELECT COUNT(*) FROM inferences").fetchone()[0]
+        self.assertLessEqual(count, 10)
+
+    def test_table_is_only_counted_when_full(self):
+        """The number of results is kept as they are added, the table is counted to evict"""
+        self.cache.max_entries = 100
+        statements = []
+        self.cache.connection.set_trace_callback(statements.append)
+        for i in range(250):
+            self.cache.map("model", "1", [str(i)], self.infer)
+        # counted once the cache is full, then every 10 results (evicting down to 90%)
+        counts = [statement for statement in statements if "COUNT(*)" in statement]
+        self.assertLessEqual(len(counts), 15)
+        count = self.cache.connection.execute("SELECT COUNT(*) FROM inferences").fetchone()[0]
+        self.assertLessEqual(count, 100)
+        # a new connection (e.g. another process) starts from the stored count
+        self.cache.close()
+        self.assertEqual(self.cache.connection.execute("SELECT entries FROM size").fetchone()[0],
+                         count)
+
+    def test_ner_results_are_cached_per_document(self):
+        """The entities of a page's lines are cached once, for the whole page"""
+        def pipe(texts):
+            self.inferred.extend(texts)
+            return [SimpleNamespace(ents=[SimpleNamespace(text=word, label_="Location")
+                                          for word in text.split() if word.istitle()])
+                    for text in texts]
+        lines = ["Wagner left Bakhmut", "for Soledar"]
+        with patch("auto_osint_v.specific_entity_processor.get_cache", return_value=self.cache), \
+                patch("auto_osint_v.specific_entity_processor.get_ner",
+                      return_value=SimpleNamespace(pipe=pipe)):
+            for _ in range(2):
+                self.assertEqual(ner_document_entities(lines),
+                                 [["Wagner", "Location"], ["Bakhmut", "Location"],
+                                  ["Soledar", "Location"]])
+        self.assertEqual(self.inferred, lines)
+        self.assertEqual(self.cache.stats(), {"auto_osint_v/model-best-from-colab": (1, 1)})
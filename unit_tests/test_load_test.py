@@ -0,0 +1,87 @@
+"""Unit test for the synthetic web and load test"""
+import os
+import tempfile
+import requests
+from unittest import TestCase
+from unittest.mock import patch
+from auto_osint_v import host_scheduler, inference_cache, metrics, worker_pool
+from benchmarks.load_test import SyntheticWeb, run_load_test, scaling_limits, serve, write_results
+
+
+class TestLoadTest(TestCase):
+    """Provides test cases for the synthetic web and the load test"""
+    def test_synthetic_web(self):
+        """Pages are the same at every request and fail at the given rates"""
+        web = SyntheticWeb(2000, sites=3, latency=0.01, timeout_rate=0.1, reset_rate=0.1,
+                           error_rate=0.1)
+        web.base_urls = ["http://a", "http://b", "http://c"]
+        same_web = SyntheticWeb(2000, sites=3, latency=0.01, timeout_rate=0.1, reset_rate=0.1,
+                                error_rate=0.1)
+        same_web.base_urls = web.base_urls
+        self.assertEqual(web.page(7), same_web.page(7))
+        self.assertEqual(web.result(4)["link"], "http://b/page/4")
+        kinds = [web.page(index)[0] for index in range(2000)]
+        for kind in ("timeout", "reset", "error"):
+            self.assertAlmostEqual(kinds.count(kind) / 2000, 0.1, delta=0.03)
+        _, _, html = web.page(kinds.index("ok"))
+        self.assertIn(web.result(kinds.index("ok"))["title"], html)
+        self.assertGreater(len(html.split()), 700)
+
+    def test_served_pages(self):
+        """The stand-in sites serve the pages, with their failures"""
+        web = SyntheticWeb(200, sites=2, latency=0.001, timeout_rate=0, reset_rate=0.2,
+                           error_rate=0.2)
+        servers = serve(web)
+        try:
+            kinds = [web.page(index)[0] for index in range(200)]
+            response = requests.get(web.url(kinds.index("ok")), timeout=5)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(requests.get(web.url(kinds.index("error")), timeout=5).status_code,
+                             500)
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                requests.get(web.url(kinds.index("reset")), timeout=5)
+        finally:
+            for server in servers:
+                server.shutdown()
+                server.server_close()
+
+    def test_run_load_test(self):
+        """The pipeline's stages run on the synthetic sources, and their curves are written"""
+        rows = run_load_test(20, ("aggregation", "target_scoring", "output"), sites=4,
+                             latency=0.001, timeout_rate=0, reset_rate=0)
+        self.assertEqual([row["stage"] for row in rows],
+                         ["aggregation", "target_scoring", "output"])
+        self.assertEqual(rows[1]["note"], "20 sources kept")
+        self.assertTrue(all(row["peak_memory_mb"] > 0 for row in rows))
+        with tempfile.TemporaryDirectory() as directory:
+            write_results(rows, directory)
+            self.assertEqual(sorted(os.listdir(directory)), ["memory.csv", "throughput.csv"])
+
+    def test_pipeline_stores_are_untouched(self):
+        """The load test's hosts, metrics and inferences go to its own stores, not the pipeline's"""
+        with tempfile.TemporaryDirectory() as directory, \
+                patch.object(host_scheduler, "HOSTS_DB_PATH", os.path.join(directory, "h")), \
+                patch.object(metrics, "METRICS_DB_PATH", os.path.join(directory, "m")), \
+                patch.object(inference_cache, "INFERENCE_CACHE_PATH",
+                             os.path.join(directory, "i")), \
+                patch.object(host_scheduler, "_SCHEDULER", None), \
+                patch.object(metrics, "_METRICS", None), \
+                patch.object(inference_cache, "_CACHE", None):
+            run_load_test(10, ("aggregation", "target_scoring"), sites=2, latency=0.001,
+                          timeout_rate=0, reset_rate=0)
+            self.assertEqual(os.listdir(directory), [])
+            self.assertIsNone(inference_cache._CACHE)
+        self.assertEqual(worker_pool.NER_START_METHOD, "forkserver")
+        self.assertIsNone(worker_pool.FETCH_START_METHOD)
+
+    def test_scaling_limits(self):
+        """A stage stops scaling when its time per source grows more than the factor"""
+        rows = [{"sources": 100, "stage": "target_scoring", "seconds": 10, "note": ""},
+                {"sources": 1000, "stage": "target_scoring", "seconds": 120, "note": ""},
+                {"sources": 10000, "stage": "target_scoring", "seconds": 3000, "note": ""},
+                {"sources": 100, "stage": "output", "seconds": 1, "note": ""},
+                {"sources": 10000, "stage": "output", "seconds": 150, "note": ""}]
+        limits = scaling_limits(rows)
+        self.assertEqual(list(limits), ["target_scoring"])
+        self.assertEqual(limits["target_scoring"][0], 10000)
+        self.assertAlmostEqual(limits["target_scoring"][1], 3.0)
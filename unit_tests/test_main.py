@@ -1,7 +1,7 @@
 import csv
 from unittest import TestCase
 import os
-from auto_osint_v.__main__ import format_output
+from auto_osint_v.__main__ import format_output, output_rows, OUTPUT_COLUMNS
 from auto_osint_v.file_handler import FileHandler
 
 
@@ -26,3 +26,14 @@ class Test(TestCase):
         out_df = format_output(sources, file_handler)
         # display the dataframe
         out_df.to_html(file_handler.get_output_path("", "html"))
+
+    def test_output_rows(self):
+        sources = [{"url": "https://example.com", "title": "Title", "description": "Desc",
+                    "page_type": "article", "time_published": "", "score": 20,
+                    "title_sentiment": "neutral sentiment, score=0.5"}]
+        file_handler = FileHandler(os.path.join(os.path.dirname(__file__),
+                                                "../auto_osint_v/data_files/"))
+        file_handler.read_evidence_file = lambda: [{"evidence type": "sentiment", "info": "x"}]
+        rows = list(output_rows(sources, file_handler))
+        self.assertEqual(rows[-1]["Priority Score"], 20)
+        self.assertTrue(all(set(row) <= set(OUTPUT_COLUMNS) for row in rows))
@@ -0,0 +1,97 @@
+"""Unit test for the Prometheus metrics registry and exporter"""
+import multiprocessing
+import os
+import tempfile
+import threading
+import urllib.request
+from unittest import TestCase
+from auto_osint_v.metrics import (FETCH_FAILURES, FETCH_SECONDS, LAST_RUN, MetricsRegistry,
+                                  create_server)
+
+
+def count_failures(db_path):
+    """Records fetch failures from a worker process."""
+    registry = MetricsRegistry(db_path)
+    for _ in range(10):
+        registry.inc(FETCH_FAILURES, reason="timeout")
+
+
+class TestMetrics(TestCase):
+    """Provides test cases for the MetricsRegistry class"""
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "metrics.sqlite")
+        self.registry = MetricsRegistry(self.db_path)
+
+    def tearDown(self):
+        self.registry.close()
+        self.tmp_dir.cleanup()
+
+    def test_counters_and_gauges(self):
+        """Counters add up per label value, gauges keep their last value"""
+        self.registry.inc(FETCH_FAILURES, reason="timeout")
+        self.registry.inc(FETCH_FAILURES, 2, reason="timeout")
+        self.registry.inc(FETCH_FAILURES, reason='http_"4xx"')
+        self.registry.set(LAST_RUN, 10)
+        self.registry.set(LAST_RUN, 12.5)
+        text = self.registry.render()
+        self.assertIn("# TYPE auto_osint_v_fetch_failures_total counter", text)
+        self.assertIn('auto_osint_v_fetch_failures_total{reason="timeout"} 3\n', text)
+        self.assertIn('auto_osint_v_fetch_failures_total{reason="http_\\"4xx\\""} 1\n', text)
+        self.assertIn("auto_osint_v_last_run_timestamp_seconds 12.5\n", text)
+        with self.assertRaises(ValueError):
+            self.registry.inc(FETCH_FAILURES, host="example.com")
+        with self.assertRaises(ValueError):
+            self.registry.inc(FETCH_FAILURES, -1, reason="timeout")
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Each bucket counts the observations at or below its bound"""
+        for value in (0.01, 0.3, 0.5, 4, 100):
+            self.registry.observe(FETCH_SECONDS, value)
+        # samples recorded when the histogram was labelled by host are not exported
+        self.registry._add([(FETCH_SECONDS.name, '["bbc.co.uk"]', "count", 1)])
+        text = self.registry.render()
+        self.assertIn('auto_osint_v_fetch_duration_seconds_bucket{le="0.05"} 1\n', text)
+        self.assertIn('auto_osint_v_fetch_duration_seconds_bucket{le="0.5"} 3\n', text)
+        self.assertIn('auto_osint_v_fetch_duration_seconds_bucket{le="5"} 4\n', text)
+        self.assertIn('auto_osint_v_fetch_duration_seconds_bucket{le="+Inf"} 5\n', text)
+        self.assertIn('auto_osint_v_fetch_duration_seconds_count 5\n', text)
+        self.assertIn('auto_osint_v_fetch_duration_seconds_sum 104.81\n', text)
+        self.assertNotIn("bbc.co.uk", text)
+        with self.assertRaises(ValueError):
+            self.registry.observe(FETCH_SECONDS, 1.0, host="bbc.co.uk")
+
+    def test_processes_share_the_metrics(self):
+        """Metrics recorded by worker processes are added to those of the main process"""
+        self.registry.inc(FETCH_FAILURES, reason="timeout")
+        with multiprocessing.get_context("spawn").Pool(2) as pool:
+            pool.map(count_failures, [self.db_path] * 4)
+        self.assertIn('auto_osint_v_fetch_failures_total{reason="timeout"} 41\n',
+                      self.registry.render())
+
+    def test_textfile_and_http_endpoint(self):
+        """The metrics are written to a textfile and served over HTTP, in either format"""
+        self.registry.inc(FETCH_FAILURES, reason="skipped")
+        file_path = os.path.join(self.tmp_dir.name, "auto_osint_v.prom")
+        self.registry.write_textfile(file_path)
+        with open(file_path, encoding="utf-8") as metrics_file:
+            self.assertEqual(metrics_file.read(), self.registry.render())
+        self.assertFalse(os.path.exists(file_path + ".tmp"))
+        server = create_server(self.registry, port=0)
+        try:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            with urllib.request.urlopen(url) as response:
+                self.assertTrue(response.headers["Content-Type"].startswith("text/plain"))
+                self.assertIn('auto_osint_v_fetch_failures_total{reason="skipped"} 1',
+                              response.read().decode("utf-8"))
+            request = urllib.request.Request(
+                url, headers={"Accept": "application/openmetrics-text; version=1.0.0"})
+            with urllib.request.urlopen(request) as response:
+                text = response.read().decode("utf-8")
+            self.assertIn("# TYPE auto_osint_v_fetch_failures counter", text)
+            self.assertIn('auto_osint_v_fetch_failures_total{reason="skipped"} 1', text)
+            self.assertTrue(text.endswith("# EOF\n"))
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,50 @@
+"""Unit test for the micro-benchmark runner and its regression gate"""
+import contextlib
+import io
+import os
+import tempfile
+from unittest import TestCase
+from benchmarks.micro_benchmarks import (compare, load_baseline, load_re3d, main, run_benchmarks,
+                                         save_baseline)
+
+
+class TestMicroBenchmarks(TestCase):
+    """Provides test cases for the micro-benchmark runner"""
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.baseline_path = os.path.join(self.tmp_dir.name, "baseline.json")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_load_re3d(self):
+        """The recorded re3d test set is read as sentences and multi-word entities"""
+        sentences, entities = load_re3d()
+        self.assertEqual(len(sentences), 200)
+        self.assertTrue(sentences[0].startswith("Carter thanked Abadi"))
+        self.assertIn("the United States", entities)
+
+    def test_compare(self):
+        """Only benchmarks slower than the threshold allows are regressions"""
+        baseline = {"fast": {"seconds": 1.0}, "slow": {"seconds": 1.0}}
+        results = {"fast": {"seconds": 1.2}, "slow": {"seconds": 1.3},
+                   "new": {"seconds": 5.0}, "model": {"skipped": "spacy not installed"}}
+        self.assertEqual(compare(results, baseline, 0.25), [("slow", 1.0, 1.3)])
+        self.assertEqual(compare(results, baseline, 0.5), [])
+
+    def test_regression_fails_the_run(self):
+        """A run is compared with the saved baseline, and fails when a benchmark regressed"""
+        results = run_benchmarks(["count_entities_re3d", "get_keywords_from_target_info"],
+                                 repeat=1, min_time=0)
+        self.assertEqual(results["count_entities_re3d"]["unit"], "words")
+        self.assertGreater(results["get_keywords_from_target_info"]["seconds"], 0)
+        save_baseline(results, self.baseline_path)
+        self.assertEqual(set(load_baseline(self.baseline_path)), set(results))
+        arguments = ["--baseline", self.baseline_path, "--only", "count_entities_re3d",
+                     "--repeat", "1", "--min_time", "0"]
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(main(arguments + ["--threshold", "100"]), 0)
+            # a baseline much faster than this machine can be
+            results["count_entities_re3d"]["seconds"] = 1e-9
+            save_baseline(results, self.baseline_path)
+            self.assertEqual(main(arguments), 1)
@@ -0,0 +1,45 @@
+"""Unit test for the memory-mapped page corpus"""
+import os
+import pickle
+from multiprocessing import Pool
+from unittest import TestCase
+from auto_osint_v.page_corpus import PageCorpus
+
+
+def add_text(task):
+    """Adds a text to the corpus in a worker process."""
+    corpus, text = task
+    return corpus.add(text)
+
+
+class TestPageCorpus(TestCase):
+    """Provides test cases for the PageCorpus class"""
+    def setUp(self):
+        self.corpus = PageCorpus()
+
+    def tearDown(self):
+        self.corpus.close()
+
+    def test_add_and_get(self):
+        """Texts are read back from their handles, including non-ASCII and empty texts"""
+        handles = [self.corpus.add(text) for text in ("Wagner", "Бахмут", "", "Soledar")]
+        self.assertEqual([self.corpus.get(handle) for handle in handles],
+                         ["Wagner", "Бахмут", "", "Soledar"])
+        # the file is remapped when it grows after being read
+        handle = self.corpus.add("Donetsk")
+        self.assertEqual(self.corpus.get(handle), "Donetsk")
+
+    def test_workers_share_the_corpus(self):
+        """Texts added by worker processes can be read in the main process"""
+        texts = [f"text {i} " * i for i in range(1, 50)]
+        with Pool(2) as pool:
+            handles = pool.map(add_text, [(self.corpus, text) for text in texts])
+        self.assertEqual([self.corpus.get(handle) for handle in handles], texts)
+
+    def test_only_owner_deletes_file(self):
+        """Copies sent to workers never delete the corpus file"""
+        copy = pickle.loads(pickle.dumps(self.corpus))
+        copy.close()
+        self.assertTrue(os.path.exists(self.corpus.path))
+        self.corpus.close()
+        self.assertFalse(os.path.exists(self.corpus.path))
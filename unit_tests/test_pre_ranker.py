@@ -0,0 +1,34 @@
+"""Unit test for the snippet pre-ranker"""
+from unittest import TestCase
+from unittest.mock import patch
+from auto_osint_v.pre_ranker import PreRanker
+
+
+class TestPreRanker(TestCase):
+    """Provides test cases for the PreRanker class"""
+    def test_filter_sources(self):
+        """Sources with too few target entities in their title and snippet are rejected"""
+        pre_ranker = PreRanker(["Wagner", "Bakhmut"], relevance_floor=1)
+        sources = [{"url": "a", "title": "Wagner in Bakhmut", "description": ""},
+                   {"url": "b", "title": "Weather today", "description": "Sunny spells."}]
+        self.assertEqual([source["url"] for source in pre_ranker.filter_sources(sources)], ["a"])
+        self.assertEqual(pre_ranker.relevance("Wagner in Bakhmut", ""), 2)
+
+    def test_embedding_similarity(self):
+        """Embeddings come from the inference cache, and the statement is only embedded once"""
+        vectors = {"statement": [1.0, 0.0], "Wagner in Bakhmut ": [1.0, 1.0],
+                   "Weather today Sunny spells.": [0.0, 1.0]}
+        calls = []
+
+        def embed(texts):
+            calls.append(list(texts))
+            return [vectors[text] for text in texts]
+        pre_ranker = PreRanker(["Wagner"], "statement", relevance_floor=1.5, use_embeddings=True)
+        sources = [{"url": "a", "title": "Wagner in Bakhmut", "description": ""},
+                   {"url": "b", "title": "Weather today", "description": "Sunny spells."}]
+        with patch("auto_osint_v.pre_ranker.embed", embed):
+            self.assertEqual([source["url"] for source in pre_ranker.filter_sources(sources)],
+                             ["a"])
+            self.assertAlmostEqual(pre_ranker.relevance("Wagner in Bakhmut", ""), 1 + 2 ** -0.5)
+        self.assertEqual(calls[0], ["Wagner in Bakhmut ", "Weather today Sunny spells."])
+        self.assertEqual(sum(call == ["statement"] for call in calls), 1)
@@ -0,0 +1,82 @@
+"""Unit test for the query generator's cache"""
+import gc
+import os
+import sys
+import tempfile
+import weakref
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+from auto_osint_v.query_generator import QueryGenerator
+
+
+class FakeTokenizer:
+    """Stands in for the T5 tokenizer, its outputs are the statements themselves."""
+    def __call__(self, statements, **kwargs):
+        return {"input_ids": statements, "attention_mask": None}
+
+    @staticmethod
+    def decode(output, **kwargs):
+        """Decodes an output of FakeModel."""
+        return output
+
+
+class FakeModel:
+    """Stands in for the T5 model, generating each statement in upper case."""
+    def __init__(self, name):
+        self.name = name
+
+    def generate(self, input_ids, num_return_sequences, **kwargs):
+        """Generates the queries, or runs out of memory for the large model."""
+        if "large" in self.name:
+            raise RuntimeError("CUDA out of memory")
+        return [statement.upper() for statement in input_ids
+                for _ in range(num_return_sequences)]
+
+
+class TestQueryGenerator(TestCase):
+    """Provides test cases for the QueryGenerator class"""
+    def test_generate_uses_cache(self):
+        """Only statements missing from the cache are generated, in a single batch"""
+        batches = []
+
+        def fake_generate(statements):
+            batches.append(statements)
+            return [[statement.upper()] for statement in statements]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache_path = os.path.join(tmp_dir, "query_cache.json")
+            query_generator = QueryGenerator(cache_path, num_queries=1, seed=1)
+            query_generator._generate = fake_generate
+            self.assertEqual(query_generator.generate(["a", "b"]), [["A"], ["B"]])
+            # a new generator reads the cache from disk
+            query_generator = QueryGenerator(cache_path, num_queries=1, seed=1)
+            query_generator._generate = fake_generate
+            self.assertEqual(query_generator.generate(["b", "c"]), [["B"], ["C"]])
+        self.assertEqual(batches, [["a", "b"], ["c"]])
+
+    def test_models_are_freed_after_generating(self):
+        """The models are only kept while a batch is generated"""
+        models = []
+
+        def from_pretrained(model_name):
+            models.append(FakeModel(model_name))
+            return models[-1]
+        transformers = SimpleNamespace(
+            T5Tokenizer=SimpleNamespace(from_pretrained=lambda model_name: FakeTokenizer()),
+            T5ForConditionalGeneration=SimpleNamespace(from_pretrained=from_pretrained))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            query_generator = QueryGenerator(os.path.join(tmp_dir, "query_cache.json"),
+                                             num_queries=2)
+            with patch.dict(sys.modules, transformers=transformers), \
+                    patch.object(QueryGenerator, "_enough_memory_for_large_model",
+                                 return_value=True):
+                self.assertEqual(query_generator.generate(["a"]), [["A", "A"]])
+        # the large model ran out of memory, and the base model generated the queries
+        self.assertEqual([model.name for model in models],
+                         [QueryGenerator.large_model, QueryGenerator.base_model])
+        references = [weakref.ref(model) for model in models]
+        models.clear()
+        gc.collect()
+        self.assertEqual([reference() for reference in references], [None, None])
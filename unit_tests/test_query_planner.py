@@ -0,0 +1,48 @@
+"""Unit test for the query planner"""
+from unittest import TestCase
+from auto_osint_v.query_planner import QueryPlanner, cosine_similarity
+
+
+class TestQueryPlanner(TestCase):
+    """Provides test cases for the QueryPlanner class"""
+    def setUp(self):
+        self.planner = QueryPlanner(0.6, num_queries=2, use_embeddings=False)
+
+    def test_cosine_similarity(self):
+        """Embeddings and word counts are compared the same way"""
+        self.assertAlmostEqual(cosine_similarity([1.0, 0.0], [1.0, 1.0]), 2 ** -0.5)
+        self.assertAlmostEqual(cosine_similarity({"wagner": 1, "bakhmut": 1}, {"wagner": 2}),
+                               2 ** -0.5)
+        self.assertEqual(cosine_similarity({}, {"wagner": 1}), 0.0)
+
+    def test_near_duplicate_queries_are_removed(self):
+        """Queries similar to a planned query are replaced by the least similar candidates"""
+        candidates = ["wagner group in bakhmut", "wagner group in bakhmut",
+                      "the wagner group bakhmut", "russian artillery shelling",
+                      "ukraine counteroffensive"]
+        queries, groups = self.planner.plan(candidates, [])
+        self.assertEqual(queries, ["wagner group in bakhmut", "russian artillery shelling"])
+        self.assertEqual(groups, [])
+        self.assertEqual(self.planner.removed, [("query", "wagner group in bakhmut"),
+                                                ("query", "the wagner group bakhmut")])
+
+    def test_saved_searches_buy_queries(self):
+        """Keyword groups a query already covers are removed, and more queries searched instead"""
+        candidates = ["wagner group bakhmut", "russian artillery shelling",
+                      "ukraine counteroffensive", "prigozhin statement"]
+        groups = [["Wagner Group", "Bakhmut"], ["Soledar", "Kharkiv"], ["Soledar", "Kharkiv"]]
+        queries, planned_groups = self.planner.plan(candidates, groups)
+        self.assertEqual(planned_groups, [["Soledar", "Kharkiv"]])
+        self.assertEqual(queries, candidates)
+        self.assertEqual([kind for kind, _ in self.planner.removed], ["keyword_group"] * 2)
+        everything = QueryPlanner(1, num_queries=2, use_embeddings=False)
+        self.assertEqual(everything.plan(candidates, groups), (candidates[:2], groups))
+
+    def test_previous_queries_are_reused(self):
+        """Generated queries close to a previous run's query are replaced by it"""
+        previous = ["wagner group soledar", "hamburg railway flood"]
+        candidates = ["the wagner group in soledar", "bakhmut salt mines"]
+        self.assertEqual(self.planner.reuse(candidates, previous),
+                         ["wagner group soledar", "bakhmut salt mines"])
+        queries, _ = self.planner.plan(candidates, [], previous)
+        self.assertEqual(queries, ["wagner group soledar", "bakhmut salt mines"])
@@ -0,0 +1,113 @@
+"""Unit test for the SQLite run store"""
+import os
+import tempfile
+from unittest import TestCase
+from auto_osint_v.priority_manager import PriorityManager
+from auto_osint_v.run_store import RunStore
+from auto_osint_v.source_record import SourceRecord
+
+
+class TestRunStore(TestCase):
+    """Provides test cases for the RunStore class"""
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.run_store = RunStore(os.path.join(self.tmp_dir.name, "runs.sqlite"))
+
+    def tearDown(self):
+        self.run_store.close()
+        self.tmp_dir.cleanup()
+
+    def test_record_run(self):
+        """Sources, entity counts and scores of a run can be queried afterwards"""
+        sources = [SourceRecord("https://a.com", "A", sentiment_label=1, sentiment_score=0.5),
+                   SourceRecord("https://b.com", "B", sentiment_label=0, sentiment_score=0.7)]
+        run_id = self.run_store.start_run("Wagner Group troops in Bakhmut.")
+        self.run_store.record_sources(run_id, sources)
+        self.run_store.record_entity_counts({"https://a.com": {"Wagner": 2, "Bakhmut": 1},
+                                             "https://b.com": {"Bakhmut": 4}})
+        sources[0].score = 20
+        self.run_store.record_scores(run_id, sources[:1])
+        self.run_store.finish_run(run_id)
+
+        self.assertEqual(self.run_store.get_entity_counts(["https://a.com", "https://c.com"]),
+                         {"https://a.com": {"Wagner": 2, "Bakhmut": 1}})
+        self.assertEqual(self.run_store.sources_mentioning("Bakhmut"),
+                         [("https://b.com", 4), ("https://a.com", 1)])
+        self.assertEqual(self.run_store.corroboration_history("https://a.com"),
+                         [(run_id, "Wagner Group troops in Bakhmut.", 20)])
+
+    def test_statements_are_shared_between_runs(self):
+        """Re-running a statement reuses its statement row"""
+        first = self.run_store.start_run("statement")
+        second = self.run_store.start_run("statement ")
+        statement_ids = self.run_store.connection.execute(
+            "SELECT DISTINCT statement_id FROM runs WHERE id IN (?, ?)", (first, second))
+        self.assertEqual(len(statement_ids.fetchall()), 1)
+
+    def test_incremental_reuse(self):
+        """Queries, searches, sources, page texts and NER entities of a run can be reused"""
+        source = SourceRecord("https://a.com", "A", image_links=["https://a.com/1.jpg"],
+                              sentiment_label=1, sentiment_score=0.5)
+        run_id = self.run_store.start_run("statement")
+        self.run_store.record_sources(run_id, [source])
+        self.run_store.record_queries(run_id, ["query one", "query two"], [["Wagner", "Bakhmut"]])
+        self.run_store.record_search([{"link": "https://a.com"}], "query one", num=10)
+        self.run_store.record_page_texts({"https://a.com": "Wagner troops in Bakhmut"})
+        self.run_store.record_ner_entities({"https://a.com": ["Wagner", "Bakhmut"]})
+        self.run_store.finish_run(run_id)
+        next_run_id = self.run_store.start_run("statement, edited")
+
+        self.assertEqual(self.run_store.previous_run(next_run_id, "statement, edited"), run_id)
+        self.assertEqual(self.run_store.get_queries(run_id),
+                         (["query one", "query two"], [["Wagner", "Bakhmut"]]))
+        self.assertEqual(self.run_store.get_search("query one", num=10),
+                         [{"link": "https://a.com"}])
+        self.assertIsNone(self.run_store.get_search("query one", num=5))
+        self.assertEqual(self.run_store.get_source("https://a.com"), source)
+        self.assertIsNone(self.run_store.get_source("https://b.com"))
+        self.assertEqual(self.run_store.get_page_texts(["https://a.com", "https://b.com"]),
+                         {"https://a.com": "Wagner troops in Bakhmut"})
+        ner_entities = self.run_store.get_ner_entities(["https://a.com"])
+        self.assertEqual(sorted(ner_entities["https://a.com"]), ["Bakhmut", "Wagner"])
+
+    def test_failed_sources_are_fetched_again(self):
+        """The empty text of a failed fetch is not stored, so the next run fetches the source"""
+        sources = [SourceRecord("https://a.com", "A"), SourceRecord("https://b.com", "B")]
+        run_id = self.run_store.start_run("statement")
+        self.run_store.record_sources(run_id, sources)
+        priority_manager = PriorityManager(None, None, sources)
+        try:
+            priority_manager._record(*priority_manager.count_text("https://a.com", "Wagner"))
+            priority_manager._record(*priority_manager.count_text("https://b.com", ""))
+            self.assertEqual(priority_manager.new_page_texts, {"https://a.com": "Wagner"})
+            self.run_store.record_page_texts({**priority_manager.new_page_texts,
+                                              "https://b.com": ""})
+        finally:
+            priority_manager.close()
+        self.assertEqual(self.run_store.get_page_texts(["https://a.com", "https://b.com"]),
+                         {"https://a.com": "Wagner"})
+        # so the next run's priority manager fetches it
+        priority_manager = PriorityManager(None, None, sources,
+                                           self.run_store.get_page_texts(["https://b.com"]))
+        self.assertNotIn("https://b.com", priority_manager.page_handles)
+        priority_manager.close()
+
+    def test_previous_run_of_the_same_statement(self):
+        """Only runs of the same or an edited statement are reused, not the last run"""
+        wagner = "Wagner Group troops have captured the town of Soledar near Bakhmut."
+        wagner_run = self.run_store.start_run(wagner)
+        self.run_store.finish_run(wagner_run)
+        storm = "A storm has flooded the main railway station in Hamburg."
+        storm_run = self.run_store.start_run(storm)
+        self.run_store.finish_run(storm_run)
+        # an unfinished run is never reused
+        self.run_store.start_run(wagner)
+        edited = "Wagner Group troops have captured the salt mining town of Soledar near Bakhmut."
+        current = self.run_store.start_run(edited)
+        self.assertEqual(self.run_store.previous_run(current, edited), wagner_run)
+        self.assertEqual(self.run_store.previous_run(current, storm), storm_run)
+        self.assertIsNone(self.run_store.previous_run(
+            current, "Protesters gathered outside the parliament in Tbilisi on Sunday."))
+        rerun = self.run_store.start_run(storm)
+        self.run_store.finish_run(rerun)
+        self.assertEqual(self.run_store.previous_run(rerun + 1, storm), rerun)
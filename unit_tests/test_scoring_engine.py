@@ -0,0 +1,56 @@
+"""Unit test for the scoring engine"""
+from unittest import TestCase
+from auto_osint_v.priority_manager import count_words
+from auto_osint_v.scoring_engine import ScoringEngine
+
+
+class TestScoringEngine(TestCase):
+    """Provides test cases for the ScoringEngine class"""
+    counts = {"https://a.com": {"Russia": 5, "Wagner": 1},
+              "https://b.com": {"Russia": 1},
+              "https://c.com": {"Russia": 2},
+              "https://d.com": {}}
+
+    def engine(self, weighting):
+        """Builds an engine with the example counts."""
+        engine = ScoringEngine(weighting)
+        for url, counts in self.counts.items():
+            engine.add(url, counts)
+        return engine
+
+    def test_count_weighting(self):
+        """Count weighting gives the number of distinct entities found, times the weight"""
+        scores = self.engine("count").scores(["Russia", "Wagner", "Bakhmut"], 10)
+        self.assertEqual(scores, {"https://a.com": 20, "https://b.com": 10, "https://c.com": 10,
+                                  "https://d.com": 0})
+
+    def test_rare_entities_weigh_more(self):
+        """With tfidf and bm25, a rare entity scores higher than a common one"""
+        for weighting in ("tfidf", "bm25"):
+            engine = self.engine(weighting)
+            rare = engine.scores(["Wagner"])["https://a.com"]
+            common = engine.scores(["Russia"])["https://b.com"]
+            self.assertGreater(rare, common, weighting)
+            self.assertEqual(engine.scores(["Russia"])["https://d.com"], 0)
+
+    def test_add_merges_counts(self):
+        """Counts added later for the same source (e.g. popular entities) are merged"""
+        engine = self.engine("count")
+        engine.add("https://b.com", {"Soledar": 3})
+        self.assertEqual(engine.scores(["Russia", "Soledar"])["https://b.com"], 2)
+
+    def test_unknown_weighting(self):
+        """Unknown weighting schemes are rejected"""
+        with self.assertRaises(ValueError):
+            ScoringEngine("bm26")
+
+    def test_bm25_lengths_are_in_words(self):
+        """Pages of the same words score the same, however many bytes their script takes"""
+        engine = ScoringEngine("bm25")
+        for url, text in (("https://en.com", "Wagner fighters left Bakhmut today"),
+                          ("https://ru.com", "Вагнер покинули Бахмут сегодня утром")):
+            counts, length = count_words(["Wagner", "Вагнер"], text)
+            self.assertEqual(length, 5)
+            engine.add(url, counts, length)
+        scores = engine.scores(["Wagner", "Вагнер"])
+        self.assertAlmostEqual(scores["https://en.com"], scores["https://ru.com"])
@@ -0,0 +1,101 @@
+"""Unit test for the local search backend"""
+import gzip
+import json
+import os
+import tempfile
+from unittest import TestCase
+from auto_osint_v.search_backend import LocalIndexBackend, SearchBackend, iter_documents
+
+WARC_HTML = b"<html><head><title>Soledar falls</title></head><body>Wagner Group took Soledar " \
+            b"after weeks of fighting.</body></html>"
+
+
+def warc_record(url, html):
+    """Builds a WARC response record"""
+    block = b"HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n" + html
+    return (f"WARC/1.0\r\nWARC-Type: response\r\nWARC-Target-URI: {url}\r\n"
+            f"Content-Length: {len(block)}\r\n\r\n").encode() + block + b"\r\n\r\n"
+
+
+class TestLocalIndexBackend(TestCase):
+    """Provides test cases for indexing and searching a local corpus"""
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        corpus = os.path.join(self.tmp_dir.name, "corpus")
+        os.makedirs(corpus)
+        with open(os.path.join(corpus, "bakhmut.html"), "w", encoding="utf-8") as html_file:
+            html_file.write("<html><head><title>Fighting in Bakhmut</title><meta name='description'"
+                            " content='Latest news'></head><body><script>x()</script>Wagner Group"
+                            " fighters advanced in Bakhmut. Bakhmut is encircled.</body></html>")
+        with open(os.path.join(corpus, "notes.txt"), "w", encoding="utf-8") as text_file:
+            text_file.write("Weather report\nSunny spells over Kyiv.")
+        self.jsonl_path = os.path.join(self.tmp_dir.name, "pages.jsonl")
+        with open(self.jsonl_path, "w", encoding="utf-8") as jsonl_file:
+            for url, title, text in [
+                    ("https://www.reddit.com/r/ukraine/1", "Bakhmut thread", "Bakhmut, Bakhmut."),
+                    ("https://news.example.com/a", "Kyiv news", "Drones over Kyiv overnight.")]:
+                jsonl_file.write(json.dumps({"url": url, "title": title, "text": text,
+                                             "published": "2023-01-10"}) + "\n")
+        self.warc_path = os.path.join(self.tmp_dir.name, "crawl.warc.gz")
+        with gzip.open(self.warc_path, "wb") as warc_file:
+            warc_file.write(warc_record("https://soledar.example.org/", WARC_HTML))
+        self.backend = LocalIndexBackend(os.path.join(self.tmp_dir.name, "index.sqlite"))
+        for path in (corpus, self.jsonl_path, self.warc_path):
+            self.backend.add_documents(iter_documents(path))
+
+    def tearDown(self):
+        self.backend.close()
+        self.tmp_dir.cleanup()
+
+    def test_search(self):
+        """Results are ranked by BM25 and shaped like Google CSE results"""
+        results = self.backend.search("wagner group bakhmut", num=3)
+        self.assertEqual(len(results), 3)
+        self.assertTrue(results[0]["link"].endswith("bakhmut.html"))
+        self.assertEqual(results[0]["title"], "Fighting in Bakhmut")
+        self.assertEqual(results[0]["pagemap"]["metatags"][0]["og:description"], "Latest news")
+        self.assertIn("Wagner Group", results[0]["snippet"])
+        self.assertNotIn("x()", results[0]["snippet"])
+        self.assertEqual(self.backend.search(["Soledar"])[0]["link"],
+                         "https://soledar.example.org/")
+        self.assertEqual(self.backend.search("Mariupol"), [])
+
+    def test_site_search(self):
+        """Results can be restricted to, or exclude, a site"""
+        results = self.backend.search("Bakhmut", siteSearch="www.reddit.com",
+                                      siteSearchFilter="i")
+        self.assertEqual([result["link"] for result in results],
+                         ["https://www.reddit.com/r/ukraine/1"])
+        self.assertEqual(results[0]["displayLink"], "reddit.com")
+        results = self.backend.search("Bakhmut", siteSearch="reddit.com", siteSearchFilter="e")
+        self.assertNotIn("https://www.reddit.com/r/ukraine/1",
+                         [result["link"] for result in results])
+
+    def test_page_texts_and_reindexing(self):
+        """Indexed texts are given to the pipeline, and re-indexed documents replace old ones"""
+        texts = self.backend.page_texts(["https://news.example.com/a", "https://missing.com"])
+        self.assertEqual(texts, {"https://news.example.com/a": "Drones over Kyiv overnight."})
+        self.backend.add_documents(iter_documents(self.jsonl_path))
+        self.assertEqual(len(self.backend.search("Kyiv")), 2)
+        self.backend.add_documents([{"url": "https://news.example.com/a", "title": "Moved",
+                                     "description": "", "page_type": "", "published": "",
+                                     "text": "Nothing here now."}])
+        self.assertEqual([result["link"] for result in self.backend.search("drones")], [])
+
+    def test_site_search_queries(self):
+        """A site search checks the hosts of the matching documents in a few queries"""
+        self.backend.add_documents(
+            [{"url": f"https://news{i}.example.com/", "title": "", "description": "",
+              "page_type": "", "published": "", "text": "Bakhmut " * (i % 7 + 1)}
+             for i in range(1200)] +
+            [{"url": f"https://old.reddit.com/{i}", "title": "", "description": "",
+              "page_type": "", "published": "", "text": "Bakhmut"} for i in range(3)])
+        statements = []
+        self.backend.connection.set_trace_callback(statements.append)
+        results = self.backend.search("Bakhmut", num=5, siteSearch="reddit.com")
+        self.backend.connection.set_trace_callback(None)
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all("reddit.com" in result["link"] for result in results))
+        self.assertLess(len(statements), 20)
+        with self.assertRaises(TypeError):
+            SearchBackend()  # pylint: disable=abstract-class-instantiated
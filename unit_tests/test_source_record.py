@@ -0,0 +1,36 @@
+"""Unit test for the source records"""
+import pickle
+from unittest import TestCase
+from auto_osint_v.source_record import SourceRecord, to_records
+
+
+class TestSourceRecord(TestCase):
+    """Provides test cases for the SourceRecord class"""
+    def test_from_dict(self):
+        """Rows of the potential corroboration file are converted to typed fields"""
+        row = {"url": "https://example.com", "title": "Title", "description": "Desc",
+               "title_sentiment": "negative sentiment, score=0.84", "score": "30"}
+        source = to_records([row])[0]
+        self.assertEqual(source.sentiment_label, 0)
+        self.assertAlmostEqual(source.sentiment_score, 0.84)
+        self.assertEqual(source.score, 30)
+        self.assertEqual(source["title_sentiment"], "negative sentiment, score=0.84")
+        self.assertEqual(source.as_row()[0], "https://example.com")
+
+    def test_fractional_scores(self):
+        """tfidf and bm25 scores keep their fraction, missing scores are 0"""
+        rows = [{"url": "a", "score": "2.75"}, {"url": "b", "score": 3.0},
+                {"url": "c", "score": float("nan")}, {"url": "d", "score": None}]
+        scores = [source.score for source in to_records(rows)]
+        self.assertEqual(scores, [2.75, 3, 0, 0])
+        self.assertIsInstance(scores[1], int)
+
+    def test_pickle(self):
+        """Records pickle to a smaller payload than the equivalent dictionary"""
+        source = SourceRecord("https://example.com", "Title", "Desc", sentiment_label=1,
+                              sentiment_score=0.5, score=10)
+        source["score"] += 5
+        self.assertEqual(pickle.loads(pickle.dumps(source)), source)
+        self.assertEqual(source.score, 15)
+        as_dict = {field: source[field] for field in source.keys()}
+        self.assertLess(len(pickle.dumps(source)), len(pickle.dumps(as_dict)))
@@ -0,0 +1,48 @@
+"""Import-time budget test for the command line interface.
+
+Fails if starting the tool (e.g. to show the help or report an argument error) regresses to
+importing the models and heavy libraries.
+"""
+import os
+import subprocess
+import sys
+import time
+from unittest import TestCase
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# seconds allowed for 'python -m auto_osint_v -h', including starting the interpreter
+STARTUP_BUDGET = 2.0
+HEAVY_MODULES = ["torch", "transformers", "sentence_transformers", "spacy", "pandas",
+                 "seleniumwire", "googleapiclient"]
+
+
+class TestStartup(TestCase):
+    """Provides test cases for the start-up cost of auto_osint_v"""
+    def run_python(self, *args):
+        """Runs python from the repository root, returning the completed process"""
+        return subprocess.run([sys.executable, *args], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=False)
+
+    def test_no_heavy_imports(self):
+        """Importing the CLI module must not import the models or heavy libraries"""
+        result = self.run_python(
+            "-c", "import sys, auto_osint_v.__main__; "
+                  f"print([m for m in {HEAVY_MODULES!r} if m in sys.modules])")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "[]")
+
+    def test_help_within_budget(self):
+        """'-h' must return within the start-up budget"""
+        start = time.perf_counter()
+        result = self.run_python("-m", "auto_osint_v", "-h")
+        elapsed = time.perf_counter() - start
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertLess(elapsed, STARTUP_BUDGET)
+
+    def test_argument_error_within_budget(self):
+        """Argument errors must be reported within the start-up budget"""
+        start = time.perf_counter()
+        result = self.run_python("-m", "auto_osint_v", "--top_k", "not-a-number")
+        elapsed = time.perf_counter() - start
+        self.assertEqual(result.returncode, 2)
+        self.assertLess(elapsed, STARTUP_BUDGET)
@@ -0,0 +1,38 @@
+"""Unit test for the thread budget"""
+import os
+from unittest import TestCase, mock
+from auto_osint_v.thread_budget import ThreadBudget
+
+
+class TestThreadBudget(TestCase):
+    """Provides test cases for the ThreadBudget class"""
+    def test_plan_never_oversubscribes(self):
+        """Workers x threads per worker never exceeds the number of cores"""
+        budget = ThreadBudget(16)
+        self.assertEqual(budget.plan("NER", 4), (4, 4))
+        self.assertEqual(budget.plan("Fetching", 64), (16, 1))
+        self.assertEqual(budget.plan("Main", 1), (1, 16))
+        self.assertEqual(budget.plan("Uneven", 5), (5, 3))
+
+    def test_report(self):
+        """Each stage's configuration and time appear in the report"""
+        budget = ThreadBudget(8)
+        with budget.run_stage("NER", 2):
+            pass
+        with budget.run_stage("NER", 2):
+            pass
+        report = budget.report().splitlines()
+        self.assertIn("Cores: 8", report[0])
+        self.assertEqual(len(report), 3)
+        self.assertEqual(report[2].split()[:3], ["NER", "2", "4"])
+
+    def test_stage_limits_are_restored(self):
+        """A stage run in this process doesn't change the thread limits of later stages"""
+        environment = {"OMP_NUM_THREADS": "3"}
+        with mock.patch.dict(os.environ, environment):
+            os.environ.pop("MKL_NUM_THREADS", None)
+            with ThreadBudget(8).run_stage("Main") as (_, threads):
+                self.assertEqual(os.environ["OMP_NUM_THREADS"], str(threads))
+                self.assertEqual(os.environ["MKL_NUM_THREADS"], str(threads))
+            self.assertEqual(os.environ["OMP_NUM_THREADS"], "3")
+            self.assertNotIn("MKL_NUM_THREADS", os.environ)
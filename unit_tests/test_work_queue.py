@@ -0,0 +1,135 @@
+"""Unit test for the work queue"""
+import os
+import tempfile
+import threading
+import xmlrpc.client
+from unittest import TestCase
+from auto_osint_v.work_queue import NoWorkersError, SQLiteBroker, XMLRPCBroker, create_server, \
+    run_job, run_worker
+
+
+def double(payload):
+    """A task handler for the tests."""
+    if payload["n"] < 0:
+        raise ValueError("negative")
+    return {"n": payload["n"] * 2}
+
+
+def page_text(payload):
+    """A task handler returning text that XML can't carry, or a result JSON can't encode."""
+    if payload["n"] < 0:
+        return {"text": {"not", "serialisable"}}
+    return {"text": f"page\x00{payload['n']}\x0cend"}
+
+
+class TestWorkQueue(TestCase):
+    """Provides test cases for the brokers and workers"""
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "queue.sqlite")
+        self.broker = SQLiteBroker(self.db_path)
+
+    def tearDown(self):
+        self.broker.close()
+        self.tmp_dir.cleanup()
+
+    def test_claim_and_complete(self):
+        """Tasks are claimed once, and their results are taken once"""
+        self.broker.submit("job", "double", [{"n": 1}, {"n": 2}])
+        first = self.broker.claim("worker-1")
+        second = self.broker.claim("worker-2")
+        self.assertNotEqual(first["id"], second["id"])
+        self.assertIsNone(self.broker.claim("worker-3"))
+        self.broker.complete(first["id"], {"n": 2})
+        self.assertEqual(self.broker.take_results("job"), [{"payload": {"n": 1},
+                                                            "result": {"n": 2}}])
+        self.assertEqual(self.broker.take_results("job"), [])
+
+    def test_expired_lease_and_failures(self):
+        """Tasks of dead workers are handed out again, and failing tasks are given up on"""
+        self.broker.submit("job", "double", [{"n": 1}])
+        task = self.broker.claim("worker-1", lease_seconds=-1)
+        self.assertEqual(self.broker.claim("worker-2")["id"], task["id"])
+        self.broker.fail(task["id"], "error")
+        self.assertEqual(self.broker.claim("worker-3")["id"], task["id"])
+        self.broker.fail(task["id"], "error")
+        self.assertIsNone(self.broker.claim("worker-4"))
+        self.assertEqual(self.broker.take_results("job"), [{"payload": {"n": 1}, "result": None}])
+
+    def test_worker_runs_job(self):
+        """A worker runs every task of a job, including failing ones"""
+        worker = threading.Thread(target=run_worker,
+                                  args=(SQLiteBroker(self.db_path), None, {"double": double}),
+                                  kwargs={"poll_interval": 0.01, "idle_timeout": 1})
+        worker.start()
+        results = dict((payload["n"], result) for payload, result in
+                       run_job(self.broker, "double", [{"n": 1}, {"n": -1}, {"n": 3}],
+                               poll_interval=0.01))
+        worker.join()
+        self.assertEqual(results, {1: {"n": 2}, -1: None, 3: {"n": 6}})
+
+    def test_network_broker(self):
+        """The network broker gives access to a served broker"""
+        server = create_server(SQLiteBroker(self.db_path), "127.0.0.1", 0)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            broker = XMLRPCBroker(f"http://127.0.0.1:{server.server_address[1]}")
+            broker.submit("job", "double", [{"n": 4}])
+            task = broker.claim("remote-worker", ["double"])
+            broker.complete(task["id"], double(task["payload"]))
+            self.assertEqual(broker.take_results("job"), [{"payload": {"n": 4},
+                                                           "result": {"n": 8}}])
+            self.assertEqual(broker.active_workers(60), 1)
+        finally:
+            server.shutdown()
+            thread.join()
+            server.server_close()
+
+    def test_network_worker_survives_bad_results(self):
+        """Control characters reach the broker, and results it can't store fail the task"""
+        server = create_server(SQLiteBroker(self.db_path), "127.0.0.1", 0)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}"
+            worker = threading.Thread(target=run_worker,
+                                      args=(XMLRPCBroker(url), None, {"text": page_text}),
+                                      kwargs={"poll_interval": 0.01, "idle_timeout": 1})
+            worker.start()
+            results = dict((payload["n"], result) for payload, result in
+                           run_job(XMLRPCBroker(url), "text", [{"n": 1}, {"n": -1}],
+                                   poll_interval=0.01))
+            worker.join()
+            self.assertEqual(results, {1: {"text": "page\x001\x0cend"}, -1: None})
+        finally:
+            server.shutdown()
+            thread.join()
+            server.server_close()
+
+    def test_server_token(self):
+        """Only loopback servers can do without a token, and clients must send it"""
+        with self.assertRaises(ValueError):
+            create_server(SQLiteBroker(self.db_path), "0.0.0.0", 0)
+        server = create_server(SQLiteBroker(self.db_path), "127.0.0.1", 0, token="secret")
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}"
+            with self.assertRaises(xmlrpc.client.ProtocolError):
+                XMLRPCBroker(url).submit("job", "double", [{"n": 1}])
+            with self.assertRaises(xmlrpc.client.ProtocolError):
+                XMLRPCBroker(url, "wrong").submit("job", "double", [{"n": 1}])
+            XMLRPCBroker(url, "secret").submit("job", "double", [{"n": 1}])
+            self.assertEqual(self.broker.claim("worker")["payload"], {"n": 1})
+        finally:
+            server.shutdown()
+            thread.join()
+            server.server_close()
+
+    def test_job_without_workers(self):
+        """A job fails rather than waiting forever when no worker is running"""
+        with self.assertRaises(NoWorkersError):
+            list(run_job(self.broker, "double", [{"n": 1}], poll_interval=0.01,
+                         worker_timeout=0.1))
+        self.assertIsNone(self.broker.claim("late-worker"))
@@ -0,0 +1,44 @@
+"""Unit test for the worker pools"""
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from auto_osint_v import metrics, worker_pool
+from auto_osint_v.metrics import MetricsRegistry
+
+
+def metrics_path(_):
+    """Gets the path of the metrics registry used by a worker."""
+    return metrics.get_metrics().db_path
+
+
+class TestWorkerPool(TestCase):
+    """Provides test cases for the worker_pool module"""
+    def test_pool_size_limited_by_memory(self):
+        """Pools never have more workers than fit in the available memory, nor fewer than 1"""
+        gib = 1024 ** 3
+        memory = worker_pool.RESERVED_MEMORY + 2 * gib
+        with patch.object(worker_pool, "available_memory", return_value=memory):
+            self.assertEqual(worker_pool.pool_size(gib, 64), 2)
+            self.assertEqual(worker_pool.pool_size(gib, 1), 1)
+        with patch.object(worker_pool, "available_memory", return_value=0):
+            self.assertEqual(worker_pool.pool_size(gib, 64), 1)
+        with patch.object(worker_pool, "available_memory", return_value=None):
+            self.assertEqual(worker_pool.pool_size(gib, 3), 3)
+
+    def test_pools_run_tasks(self):
+        """Both pools run tasks"""
+        with worker_pool.fetch_pool(max_workers=2) as pool:
+            self.assertEqual(pool.map(abs, [-1, -2]), [1, 2])
+        with worker_pool.ner_pool(max_workers=2) as pool:
+            self.assertEqual(pool.map(abs, [-1, -2]), [1, 2])
+
+    def test_forked_workers_share_the_stores(self):
+        """With the fork start method, NER workers use the stores of the main process"""
+        with tempfile.TemporaryDirectory() as directory:
+            registry = MetricsRegistry(os.path.join(directory, "metrics.sqlite"))
+            with patch.object(worker_pool, "NER_START_METHOD", "fork"), \
+                    patch.object(metrics, "_METRICS", registry):
+                with worker_pool.ner_pool(max_workers=2) as pool:
+                    self.assertEqual(pool.map(metrics_path, [1, 2]), [registry.db_path] * 2)
+            registry.close()